@@ -0,0 +1 @@
+Tiles may define an ``async def prepare()`` method gathering their data before they are rendered. ``plone.tiles.layout.renderTiles()`` runs those of a layout concurrently with ``asyncio.gather()``, cancelling them after its timeout.
@@ -0,0 +1,3 @@
+Add ``plone.tiles.storage.BTreeTileDataStorage``, which stores the data of all tiles of a context in one ``OOBTree`` annotation.
+Include ``btreestorage.zcml`` from an ``overrides.zcml`` to use it.
+Data stored in the old layout is still read, and ``plone.tiles.storage.migrate()`` moves it in batches.
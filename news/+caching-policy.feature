@@ -0,0 +1 @@
+Add a per tile type HTTP caching policy, set with the new ``cache_max_age``, ``cache_s_maxage``, ``cache_stale_while_revalidate``, ``cache_stale_if_error``, ``cache_vary`` and ``surrogate_keys`` attributes of the ``<plone:tile>`` directive, and applied to published tiles and ESI fragments.
@@ -0,0 +1,2 @@
+``PersistentTileDataManager.set()`` now updates the stored record in place, only writes changed fields, and writes nothing if nothing changed.
+The names of the changed fields are available as ``changed`` on the data manager.
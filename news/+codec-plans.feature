@@ -0,0 +1,2 @@
+``encode()`` and ``decode()`` now use a per-schema codec plan, compiled on first use and recompiled when the component registry changes.
+The plan caches field order, converter tokens, value type conversions, primary field flags and ``ignore_querystring`` names.
@@ -0,0 +1 @@
+Answer conditional GET requests for tiles setting ``conditionalGet`` with 304 Not Modified, based on the ``ETag`` and ``Last-Modified`` validators returned by the new ``Tile.cacheValidators()``.
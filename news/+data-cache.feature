@@ -0,0 +1,2 @@
+Add an optional process wide LRU cache of decoded persistent tile data, keyed by the stored record and its serial.
+Enable it with the ``PLONE_TILES_DATA_CACHE_SIZE`` and ``PLONE_TILES_DATA_CACHE_BYTES`` environment variables.
@@ -0,0 +1,2 @@
+Add ``plone.tiles.esiassembler``, a WSGI middleware resolving ESI includes in-process with concurrent rendering and a fragment cache, for deployments without an ESI capable proxy.
+It is available as the ``egg:plone.tiles#esi`` PasteDeploy filter.
@@ -0,0 +1 @@
+Extract the head and body of tiles for ``@@esi-head`` and ``@@esi-body`` without a backtracking regular expression, and let tiles providing the new ``IPartialRendering`` render only the part that is requested.
@@ -0,0 +1 @@
+Add ``plone.tiles.data.get_many()`` to load the data of several tiles of a context in one pass, and the ``IBatchTileDataStorage`` interface for storages that can fetch many records at once.
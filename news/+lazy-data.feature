@@ -0,0 +1,2 @@
+Add ``get_lazy()`` to the tile data managers, returning a ``LazyTileData`` mapping that decodes fields on first access and copies the data on write.
+Tiles opt in with ``lazyData = True``.
@@ -0,0 +1 @@
+Add a lazy loading mode for tiles below the fold. Tiles providing the new ``ILazyRendered`` with ``lazyLoad`` set, e.g. subclasses of ``LazyTile``, or registered with ``lazy_load="true"``, render a placeholder which the browser replaces with their ``@@esi-body`` when it nears the viewport.
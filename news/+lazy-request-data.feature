@@ -0,0 +1,2 @@
+``PersistentTileDataManager`` now only decodes the request fields that are missing from the stored data, and skips decoding the request when the stored data has all schema fields.
+``decode()`` accepts a ``names`` argument to decode only some fields.
@@ -0,0 +1,2 @@
+``Tile.url`` is now computed once per tile instance, until the tile id or its data changes.
+Set ``PLONE_TILES_LAZY_URL_HEADER=true`` to only send the ``X-Tile-Url`` header to editors and on form submissions.
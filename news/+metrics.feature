@@ -0,0 +1 @@
+Add per tile type metrics of rendering, tile data and caches, exported by the ``@@tiles-metrics`` view in the Prometheus text format or as JSON.
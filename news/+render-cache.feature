@@ -0,0 +1,2 @@
+Add an opt-in cache of rendered tiles for anonymous users, enabled per tile type with the new ``render_cache_ttl`` and ``render_cache_vary`` attributes of the ``<plone:tile>`` directive.
+The cache is disabled unless the ``PLONE_TILES_RENDER_CACHE_SIZE`` environment variable is set.
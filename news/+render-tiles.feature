@@ -0,0 +1 @@
+Add ``plone.tiles.layout.renderTiles()``, which renders the tiles of a layout marked with ``IThreadSafeRendering`` concurrently on a pool of worker threads, each with its own database connection at the same transaction, and replaces tiles not rendered within a timeout by a placeholder.
@@ -0,0 +1,3 @@
+Reuse tile data managers within a request.
+``ITileDataManager(tile)`` now returns the same manager for the same tile name, id and context, and the tile data is loaded and decoded only once.
+``set()`` and ``delete()`` discard the loaded data.
@@ -0,0 +1 @@
+Persistent tile data is stored as ``TileDataRecord``, which resolves conflicts between concurrent changes to different fields of the same tile.
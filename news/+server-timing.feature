@@ -0,0 +1 @@
+Time the phases of tile requests: traversal, creating the data manager, reading the data, encoding the URL, rendering and ESI extraction. The timings are passed to listeners added with ``plone.tiles.timing.addListener()``, and reported in a ``Server-Timing`` header if ``PLONE_TILES_SERVER_TIMING`` is set.
@@ -0,0 +1 @@
+Log tiles rendering slower than ``PLONE_TILES_SLOW_THRESHOLD`` milliseconds with their phases, and profile single renderings requested with the ``X-Tile-Profile`` header into ``PLONE_TILES_PROFILE_DIRECTORY``.
@@ -0,0 +1 @@
+Replace ESI placeholder links in a single pass over the page, also in bytes and in iterables of chunks, and accept any attribute order and quoting of the links.
@@ -0,0 +1 @@
+Send ``Surrogate-Key`` and ``xkey`` headers with tile responses, and fire ``ITileDataModifiedEvent`` and ``ITileDataDeletedEvent`` carrying the keys and URLs to purge when persistent tile data changes.
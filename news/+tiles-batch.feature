@@ -0,0 +1 @@
+Add a ``@@tiles-batch`` view, which renders several tiles of a context in one request and returns the status, headers and body of each as JSON.
@@ -42,11 +42,13 @@ setup(
     zip_safe=False,
     python_requires=">=3.10",
     install_requires=[
+        "BTrees",
         "plone.subrequest",
         "zope.annotation",
         "zope.component",
         "zope.configuration",
         "zope.interface",
+        "zope.lifecycleevent",
         "zope.publisher",
         "zope.schema",
         "zope.security",
@@ -61,4 +63,9 @@ setup(
             "plone.rfc822",
         ],
     },
+    entry_points={
+        "paste.filter_factory": [
+            "esi = plone.tiles.esiassembler:filter_factory",
+        ],
+    },
 )
@@ -1,6 +1,8 @@
+from plone.tiles import timing
 from plone.tiles.data import encode
 from plone.tiles.interfaces import ITileDataManager
 from plone.tiles.interfaces import ITileType
+from plone.tiles.metrics import METRICS
 from urllib import parse
 from zope.annotation import IAnnotations
 from zope.component import getMultiAdapter
@@ -87,10 +89,14 @@ class TransientTileAbsoluteURL(BaseTileAbsoluteURL):
         # and not persisted, it should also be kept in query string
         tileType = queryUtility(ITileType, name=self.context.__name__)
         if tileType is not None and tileType.schema is not None:
+            started = timing.start()
+            query = encode(data, tileType.schema)
+            timing.stop(self.context, timing.ENCODE, started)
+            METRICS.observeDataSize(self.context.__name__, len(query))
             if "?" in url:
-                url += "&" + encode(data, tileType.schema)
+                url += "&" + query
             else:
-                url += "?" + encode(data, tileType.schema)
+                url += "?" + query
         return url
 
 
@@ -0,0 +1,168 @@
+from plone.tiles.data import get_many
+from plone.tiles.interfaces import ESI_HEADER_KEY
+from plone.tiles.interfaces import ITileType
+from plone.tiles.tile import markFragmentRequest
+from Products.Five import BrowserView
+from zExceptions import BadRequest
+from zExceptions import Forbidden
+from zExceptions import NotFound
+from zExceptions import Unauthorized
+from ZODB.POSException import ConflictError
+from zope.component import queryMultiAdapter
+from zope.component import queryUtility
+
+import json
+import logging
+import os
+
+try:
+    from AccessControl.security import checkPermission
+except ImportError:
+    from zope.security import checkPermission
+
+
+LOGGER = logging.getLogger("plone.tiles")
+
+# The maximum number of tiles rendered by one @@tiles-batch request
+MAX_BATCH_SIZE = int(os.environ.get("PLONE_TILES_BATCH_SIZE", "100"))
+
+# Headers of the batch request which must not apply to the individual tiles
+IGNORED_ENVIRON_KEYS = (
+    ESI_HEADER_KEY,
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+    "CONTENT_TYPE",
+    "CONTENT_LENGTH",
+)
+
+
+class TilesBatch(BrowserView):
+    """Render several tiles of the context in one request.
+
+    The tiles are given as a JSON list of objects with the ``name`` and
+    ``id`` of each tile, and optionally the ``query`` string holding the data
+    of a transient tile, as found in the tile URL. The list is read from the
+    ``tiles`` request variable, or else from the request body.
+
+    The result is a JSON object, whose ``tiles`` list holds the ``name``,
+    ``id``, ``status``, ``headers`` and ``body`` of each tile, in the order
+    requested. The view permission of each tile type is checked as when the
+    tile is requested on its own.
+
+    Tiles with the same query string are rendered with one clone of the
+    request, so they share its data managers, and the data of persistent
+    tiles stored in an ``IBatchTileDataStorage`` is fetched at once. Each
+    tile gets a response of its own. Lazily loaded tiles are rendered
+    instead of their placeholder.
+    """
+
+    def __call__(self):
+        specs = self.parse()
+        results = [None] * len(specs)
+
+        groups = {}
+        for index, spec in enumerate(specs):
+            groups.setdefault(spec["query"], []).append(index)
+        for query, indexes in groups.items():
+            request = self.subrequest(query)
+            get_many(
+                self.context,
+                request,
+                [
+                    (specs[index]["name"], specs[index]["id"])
+                    for index in indexes
+                    if specs[index]["id"] is not None
+                ],
+            )
+            for index in indexes:
+                results[index] = self.render(request, **specs[index])
+
+        response = self.request.response
+        response.setHeader("Content-Type", "application/json")
+        response.setHeader("X-Theme-Disabled", "1")
+        return json.dumps({"tiles": results})
+
+    def parse(self):
+        """Return the list of tile specs of the request"""
+        value = self.request.form.get("tiles")
+        if value is None:
+            value = self.request.get("BODY") or b""
+        try:
+            specs = json.loads(value)
+        except ValueError:
+            raise BadRequest("Invalid JSON")
+        if isinstance(specs, dict):
+            specs = specs.get("tiles")
+        if not isinstance(specs, list):
+            raise BadRequest("Expected a list of tiles")
+        if len(specs) > MAX_BATCH_SIZE:
+            raise BadRequest(f"At most {MAX_BATCH_SIZE} tiles can be rendered at once")
+
+        parsed = []
+        for spec in specs:
+            if not isinstance(spec, dict):
+                raise BadRequest("Expected an object for each tile")
+            name, id_, query = spec.get("name"), spec.get("id"), spec.get("query", "")
+            if not isinstance(name, str) or not name:
+                raise BadRequest("Each tile needs a name")
+            if id_ is not None and not isinstance(id_, str):
+                raise BadRequest("Tile ids must be strings")
+            if not isinstance(query, str):
+                raise BadRequest("Tile queries must be strings")
+            parsed.append({"name": name, "id": id_, "query": query.lstrip("?")})
+        return parsed
+
+    def subrequest(self, query):
+        """Return a clone of the request with the given query string as its
+        form.
+        """
+        request = self.request.clone()
+        for key in IGNORED_ENVIRON_KEYS:
+            request.environ.pop(key, None)
+        request.environ["QUERY_STRING"] = query
+        request.processInputs()
+        # render lazily loaded tiles instead of their placeholder
+        markFragmentRequest(request)
+        return request
+
+    def render(self, request, name, id, query):
+        """Render one tile with the given request and a new response"""
+        response = request.response = self.request.response.__class__()
+        result = {"name": name, "id": id}
+        try:
+            tileType = queryUtility(ITileType, name=name)
+            tile = queryMultiAdapter((self.context, request), name=name)
+            if tileType is None or tile is None:
+                raise NotFound(name)
+            permission = tileType.view_permission
+            if permission and not checkPermission(permission, self.context):
+                raise Unauthorized(name)
+            if id is not None:
+                try:
+                    tile = tile[id]
+                except KeyError:
+                    raise NotFound(id)
+            request["PUBLISHED"] = tile
+            body = tile()
+        except ConflictError:
+            raise
+        except (Unauthorized, Forbidden):
+            response.setStatus(403)
+            body = ""
+        except NotFound:
+            response.setStatus(404)
+            body = ""
+        except Exception:
+            LOGGER.exception("Could not render tile %s/%s in a batch", name, id)
+            response.setStatus(500)
+            body = ""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        result["status"] = response.getStatus()
+        result["headers"] = {
+            key: value
+            for key, value in response.headers.items()
+            if key != "content-length"
+        }
+        result["body"] = body or ""
+        return result
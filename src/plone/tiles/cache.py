@@ -0,0 +1,242 @@
+from Acquisition import aq_base
+from persistent import Persistent
+from plone.tiles.interfaces import ITileType
+from zope.component import adapter
+from zope.component import queryUtility
+from zope.interface import Interface
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+
+import collections
+import os
+import sys
+import threading
+import time
+
+try:
+    from plone.uuid.interfaces import IUUID
+except ImportError:
+    IUUID = None
+
+_marker = object()
+
+
+def approximateSize(value, depth=3):
+    """Return the approximate size of a value in bytes, including the items
+    of dicts, lists, tuples and sets up to ``depth`` levels deep.
+    """
+    size = sys.getsizeof(value)
+    if depth <= 0:
+        return size
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += approximateSize(key, 0) + approximateSize(item, depth - 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approximateSize(item, depth - 1)
+    return size
+
+
+class LRUCache:
+    """A thread safe least recently used cache, bounded by the number of
+    entries and optionally by their approximate size in bytes.
+
+    Entries may expire after a number of seconds, and may be tagged, so that
+    all entries with a tag can be invalidated at once.
+
+    The cache is disabled, i.e. stores nothing, as long as ``maxEntries`` is
+    0. The number of hits, misses and evictions is counted. Expired entries
+    count as misses.
+    """
+
+    def __init__(self, maxEntries=0, maxBytes=0):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        # key -> (value, size, expires, tags)
+        self._entries = collections.OrderedDict()
+        # tag -> set of keys
+        self._tags = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.maxEntries > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _marker)
+            if entry is not _marker and entry[2] and entry[2] <= time.monotonic():
+                self._remove(key)
+                entry = _marker
+            if entry is _marker:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None, ttl=None, tags=()):
+        """Store a value. It expires after ``ttl`` seconds, if given, and is
+        dropped by ``invalidateTags()`` for any of the given ``tags``.
+        """
+        if not self.enabled:
+            return
+        if size is None:
+            size = approximateSize(value)
+        if self.maxBytes and size > self.maxBytes:
+            return
+        expires = time.monotonic() + ttl if ttl else None
+        tags = tuple(tags)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, expires, tags)
+            self.bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxEntries or (
+                self.maxBytes and self.bytes > self.maxBytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def invalidateTags(self, tags):
+        """Drop all entries with any of the given tags"""
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return the counters and current size of the cache as a dict"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "maxEntries": self.maxEntries,
+                "maxBytes": self.maxBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Process wide cache of decoded persistent tile data, see
+# PersistentTileDataManager. Disabled unless PLONE_TILES_DATA_CACHE_SIZE is
+# set to the maximum number of entries.
+DATA_CACHE = LRUCache(
+    int(os.environ.get("PLONE_TILES_DATA_CACHE_SIZE", "0")),
+    int(os.environ.get("PLONE_TILES_DATA_CACHE_BYTES", "0")),
+)
+
+
+def getDataCacheKey(record, name):
+    """Return the key of the data of the tile type ``name`` decoded from the
+    given stored record in ``DATA_CACHE``, or None if it cannot be cached.
+
+    The key contains the serial of the record, so that data decoded from a
+    record is never used once the record has been changed by a later
+    transaction. Records that are not stored yet, or have been changed in the
+    current transaction, cannot be cached.
+    """
+    if not isinstance(record, Persistent):
+        return None
+    jar = record._p_jar
+    if jar is None or record._p_oid is None:
+        return None
+    # load a ghost to get its serial
+    record._p_activate()
+    if record._p_changed:
+        return None
+    return (jar.db().database_name, record._p_oid, record._p_serial, name)
+
+
+# Process wide cache of rendered tiles, used for the tile types registered
+# with a ``render_cache_ttl``, see plone.tiles.tile.cachedRender(). Disabled
+# unless PLONE_TILES_RENDER_CACHE_SIZE is set to the maximum number of entries.
+RENDER_CACHE = LRUCache(
+    int(os.environ.get("PLONE_TILES_RENDER_CACHE_SIZE", "0")),
+    int(os.environ.get("PLONE_TILES_RENDER_CACHE_BYTES", str(64 * 1024 * 1024))),
+)
+
+
+def getContextPath(context):
+    """Return the physical path of the context as a string, or None"""
+    getPhysicalPath = getattr(context, "getPhysicalPath", None)
+    if getPhysicalPath is None:
+        return None
+    return "/".join(getPhysicalPath())
+
+
+def getContextUID(context):
+    """Return the UID of the context, or None"""
+    if IUUID is not None:
+        uid = IUUID(context, None)
+        if uid is not None:
+            return uid
+    UID = getattr(aq_base(context), "UID", None)
+    return UID() if callable(UID) else None
+
+
+def getSurrogateKeys(tile):
+    """Return the surrogate keys of the responses of a tile.
+
+    These are the tile name, the UID of the context and ``<UID>/<tile id>``,
+    followed by the ``surrogate_keys`` of the tile type and the keys the tile
+    declared while rendering with ``Tile.addSurrogateKeys()``.
+    """
+    keys = [tile.__name__]
+    uid = getContextUID(tile.context)
+    if uid is not None:
+        keys.append(uid)
+        if tile.id:
+            keys.append(f"{uid}/{tile.id}")
+    tileType = queryUtility(ITileType, name=tile.__name__)
+    keys.extend(getattr(tileType, "surrogate_keys", ()))
+    keys.extend(getattr(tile, "surrogateKeys", ()))
+    return list(dict.fromkeys(keys))
+
+
+def invalidateRenderCache(context, name=None, id=None):
+    """Drop the rendered tiles of the given context from ``RENDER_CACHE``:
+    all of them, or only those of the tile with the given name and id.
+    """
+    if not len(RENDER_CACHE):
+        return
+    path = getContextPath(context)
+    if path is None:
+        return
+    if name is None:
+        RENDER_CACHE.invalidateTags([path])
+    else:
+        RENDER_CACHE.invalidateTags([(path, name, id)])
+
+
+@adapter(Interface, IObjectModifiedEvent)
+def contextModified(context, event):
+    invalidateRenderCache(context)
@@ -1,8 +1,17 @@
 from importlib.metadata import distribution
 from importlib.metadata import PackageNotFoundError
-from persistent.dict import PersistentDict
+from persistent import Persistent
+from persistent.mapping import PersistentMapping
 from plone.subrequest import ISubRequest
+from plone.tiles import timing
+from plone.tiles.cache import approximateSize
+from plone.tiles.cache import DATA_CACHE
+from plone.tiles.cache import getDataCacheKey
+from plone.tiles.cache import invalidateRenderCache
 from plone.tiles.directives import IGNORE_QUERYSTRING_KEY
+from plone.tiles.events import TileDataDeletedEvent
+from plone.tiles.events import TileDataModifiedEvent
+from plone.tiles.interfaces import IBatchTileDataStorage
 from plone.tiles.interfaces import IFieldTypeConverter
 from plone.tiles.interfaces import IPersistentTile
 from plone.tiles.interfaces import ITile
@@ -10,11 +19,16 @@ from plone.tiles.interfaces import ITileDataContext
 from plone.tiles.interfaces import ITileDataManager
 from plone.tiles.interfaces import ITileDataStorage
 from plone.tiles.interfaces import ITileType
+from plone.tiles.metrics import METRICS
 from urllib import parse
+from ZODB.POSException import ConflictError
 from zope.annotation.interfaces import IAnnotations
 from zope.component import adapter
 from zope.component import getMultiAdapter
+from zope.component import getSiteManager
+from zope.component import queryMultiAdapter
 from zope.component import queryUtility
+from zope.event import notify
 from zope.interface import implementer
 from zope.interface import Interface
 from zope.interface.interfaces import ComponentLookupError
@@ -22,8 +36,13 @@ from zope.schema import getFields
 from zope.schema import getFieldsInOrder
 from zope.schema.interfaces import ISequence
 
+import collections
+import collections.abc
+import datetime
+import decimal
 import json
 import logging
+import weakref
 
 try:
     distribution("plone.rfc822")
@@ -36,23 +55,320 @@ else:
 
 
 ANNOTATIONS_KEY_PREFIX = "plone.tiles.data"
+MANAGERS_KEY = "plone.tiles.managers"
+GENERATION_KEY = "plone.tiles.generation"
 LOGGER = logging.getLogger("plone.tiles")
 
+_marker = object()
+
+
+class TileDataRecord(PersistentMapping):
+    """The persistent record holding the data of one tile.
+
+    Concurrent transactions changing different fields of the same tile are
+    merged when they are committed, instead of one of them failing with a
+    ``ConflictError``. Changing the same field differently still conflicts.
+    """
+
+    def _p_resolveConflict(self, oldState, savedState, newState):
+        return _mergeStates(oldState, savedState, newState, nested=("data",))
+
+
+def _sameValue(a, b):
+    if a is b:
+        return True
+    try:
+        return type(a) is type(b) and a == b
+    except ValueError:
+        # persistent references that cannot be compared reliably
+        return False
+
+
+def _mergeStates(old, saved, new, nested=()):
+    """Three-way merge of the keys of the given dicts. The values of the keys
+    in ``nested`` are dicts themselves, which are merged the same way.
+    """
+    merged = {}
+    for key in dict.fromkeys(list(old) + list(saved) + list(new)):
+        oldValue = old.get(key, _marker)
+        savedValue = saved.get(key, _marker)
+        newValue = new.get(key, _marker)
+        if key in nested:
+            value = _mergeStates(
+                {} if oldValue is _marker else oldValue,
+                {} if savedValue is _marker else savedValue,
+                {} if newValue is _marker else newValue,
+            )
+        elif _sameValue(savedValue, oldValue):
+            value = newValue
+        elif _sameValue(newValue, oldValue) or _sameValue(newValue, savedValue):
+            value = savedValue
+        else:
+            raise ConflictError(f"Conflicting changes to tile data field {key!r}")
+        if value is not _marker:
+            merged[key] = value
+    return merged
+
+
+def getRequestManagers(request, create=True):
+    """Return the dict of tile data managers cached on the request, or None
+    if the request cannot be annotated.
+    """
+    annotations = IAnnotations(request, None)
+    if annotations is None:
+        return None
+    managers = annotations.get(MANAGERS_KEY)
+    if managers is None and create:
+        managers = annotations[MANAGERS_KEY] = {}
+    return managers
+
+
+def getDataGeneration(request):
+    """Return a counter that is increased whenever tile data is changed through
+    a data manager during the request, or None if the request cannot be
+    annotated.
+    """
+    annotations = IAnnotations(request, None)
+    if annotations is None:
+        return None
+    return annotations.get(GENERATION_KEY, 0)
+
+
+def resolveTileData(tile):
+    """Return the tile type, data context and data storage of the given
+    tile, as used by the data managers.
+    """
+    tileType = queryUtility(ITileType, name=tile.__name__)
+    context = getMultiAdapter((tile.context, tile.request, tile), ITileDataContext)
+    storage = getMultiAdapter((context, tile.request, tile), ITileDataStorage)
+    return tileType, context, storage
+
+
+def cachedTileDataManager(factory, tile, *args):
+    """Return the data manager created by ``factory`` for the given tile,
+    called with ``tile`` and ``args``.
+
+    Within one request, the manager is created only once for each tile name,
+    tile id and context, so that adapter lookups and data decoding are not
+    repeated when the data is read from ``Tile.data``, the tile URL and the
+    ``X-Tile-Url`` header.
+    """
+    managers = getRequestManagers(tile.request)
+    if managers is None:
+        started = timing.start()
+        manager = factory(tile, *args)
+        timing.stop(tile, timing.MANAGER, started)
+        return manager
+
+    key = (factory, tile.__name__, tile.id, id(tile.context))
+    manager = managers.get(key)
+    if manager is None or manager.tile.context is not tile.context:
+        started = timing.start()
+        manager = managers[key] = factory(tile, *args)
+        timing.stop(tile, timing.MANAGER, started)
+    return manager
+
 
 @adapter(ITile)
 @implementer(ITileDataManager)
 def transientTileDataManagerFactory(tile):
     if tile.request.get("X-Tile-Persistent"):
-        return PersistentTileDataManager(tile)
+        return cachedTileDataManager(PersistentTileDataManager, tile)
     else:
-        return TransientTileDataManager(tile)
+        return cachedTileDataManager(TransientTileDataManager, tile)
+
+
+@adapter(IPersistentTile)
+@implementer(ITileDataManager)
+def persistentTileDataManagerFactory(tile):
+    return cachedTileDataManager(PersistentTileDataManager, tile)
+
+
+class LazyTileData(collections.abc.MutableMapping):
+    """The data of a tile, as returned by ``BaseTileDataManager.get_lazy()``.
+
+    Values are read from the stored record when they are accessed. Schema
+    fields missing from the record are decoded from the request one by one,
+    when they are first accessed, and fields found in neither return their
+    ``missing_value`` without it being stored.
+
+    Nothing is copied until the mapping is changed: the first write copies
+    the data into a plain dict, which is used from then on, so the stored
+    record is never modified.
+    """
+
+    def __init__(self, record=None, missing=None, decoder=None, decoded=None):
+        self._record = record if record is not None else {}
+        self._missing = missing if missing is not None else {}
+        self._decoder = decoder
+        self._decoded = decoded if decoded is not None else {}
+        self._data = None
+
+    def __getitem__(self, key):
+        if self._data is not None:
+            return self._data[key]
+        value = self._record.get(key, _marker)
+        if value is not _marker:
+            return value
+        value = self._decoded.get(key, _marker)
+        if value is not _marker:
+            return value
+        if key not in self._missing:
+            raise KeyError(key)
+        if self._decoder is not None:
+            value = self._decoder(key)
+            if value is not _marker:
+                self._decoded[key] = value
+                return value
+        return self._missing[key]
+
+    def __contains__(self, key):
+        if self._data is not None:
+            return key in self._data
+        return key in self._missing or key in self._record
+
+    def __iter__(self):
+        if self._data is not None:
+            return iter(self._data)
+        return self._keys()
+
+    def _keys(self):
+        yield from self._missing
+        for key in self._record:
+            if key not in self._missing:
+                yield key
+
+    def __len__(self):
+        if self._data is not None:
+            return len(self._data)
+        return sum(1 for key in self._keys())
+
+    def __setitem__(self, key, value):
+        self._materialize()[key] = value
+
+    def __delitem__(self, key):
+        del self._materialize()[key]
+
+    def _materialize(self):
+        if self._data is None:
+            self._data = {key: self[key] for key in self._keys()}
+            self._record = self._decoder = None
+        return self._data
+
+    def copy(self):
+        """Return a copy, which shares the values decoded so far"""
+        if self._data is not None:
+            return LazyTileData(self._data.copy())
+        return LazyTileData(self._record, self._missing, self._decoder, self._decoded)
+
+    def __repr__(self):
+        return "<{} {!r}>".format(type(self).__name__, dict(self))
+
+
+def _copyValue(value):
+    # Copy the lists, dicts and sets decoded from the request or stored, but
+    # not other objects, which may be persistent.
+    type_ = type(value)
+    if type_ is list:
+        return [_copyValue(item) for item in value]
+    if type_ is dict:
+        return {key: _copyValue(item) for key, item in value.items()}
+    if type_ is set:
+        return set(value)
+    return value
+
+
+def copyData(data):
+    """Return a copy of a tile data dict, with copies of the lists, dicts
+    and sets among its values.
+    """
+    return {key: _copyValue(value) for key, value in data.items()}
 
 
 class BaseTileDataManager:
 
-    def get_default_request_data(self):
+    _cachedData = None
+    _cachedLazyData = None
+
+    def get(self):
+        """Return a copy of the tile data, which is only loaded once. Lists,
+        dicts and sets in the data are copied as well, so that changing them
+        does not change the data returned by later calls.
+        """
+        started = timing.start()
+        if self._cachedData is None:
+            self._cachedData = self._load()
+        data = copyData(self._cachedData)
+        timing.stop(self.tile, timing.DATA, started)
+        return data
+
+    def get_lazy(self):
+        """Return the tile data like ``get()``, but as a ``LazyTileData``
+        mapping, which only decodes the values that are actually read.
+
+        Data that cannot be decoded field by field, e.g. because the tile type
+        has no schema or the request holds ``_tiledata``, is loaded as by
+        ``get()`` and wrapped.
+        """
+        if self._cachedLazyData is None:
+            if self._cachedData is None and self._canDecodeLazily():
+                started = timing.start()
+                self._cachedLazyData = self._buildLazy(self.storage.get(self.key))
+                timing.stop(self.tile, timing.DATA, started)
+            else:
+                self.get()
+                self._cachedLazyData = LazyTileData(self._cachedData)
+        return self._cachedLazyData.copy()
+
+    def _buildLazy(self, record):
+        return LazyTileData(record, self._missingValues(), self._decodeRequestField)
+
+    def _missingValues(self):
+        return dict(getCodecPlan(self.tileType.schema).missing)
+
+    def _decodeRequestField(self, name):
+        if name not in self.tile.request.form:
+            return _marker
+        return self.get_default_request_data([name]).get(name, _marker)
+
+    def _canDecodeLazily(self):
+        return (
+            self.tileType is not None
+            and self.tileType.schema is not None
+            and "_tiledata" not in self.tile.request.form
+            # a custom implementation may return other keys
+            and type(self).get_default_request_data
+            is BaseTileDataManager.get_default_request_data
+        )
+
+    def _load(self):
+        return self._build(self.storage.get(self.key))
+
+    def prefetched(self, record):
+        """Use the given record, as found in storage under ``self.key`` (or
+        None if not found), as if it was just loaded by ``get()``. This is
+        used by ``get_many()``.
+        """
+        self._cachedData = self._build(record)
+
+    def invalidate(self):
+        """Forget the data loaded by any data manager of this request, and
+        the cached output of the tile.
+        """
+        self._cachedData = self._cachedLazyData = None
+        for manager in (getRequestManagers(self.tile.request, False) or {}).values():
+            manager._cachedData = manager._cachedLazyData = None
+        annotations = IAnnotations(self.tile.request, None)
+        if annotations is not None:
+            annotations[GENERATION_KEY] = annotations.get(GENERATION_KEY, 0) + 1
+        invalidateRenderCache(self.tile.context, self.tile.__name__, self.tile.id)
+
+    def get_default_request_data(self, names=None):
         """
         from request form
+
+        If ``names`` is given, only these schema fields are decoded from the
+        form.
         """
         # try to use a '_tiledata' parameter in the request
         if "_tiledata" in self.tile.request.form:
@@ -67,34 +383,39 @@ class BaseTileDataManager:
                     self.tileType.schema,
                     missing=True,
                     primary=True,
+                    names=names,
                 )
             except (
                 ValueError,
                 UnicodeDecodeError,
             ):
                 LOGGER.exception("Could not convert form data to schema")
-                return self.data.copy()
+                return {}
         # we're assuming this data is potentially unsafe so we need to check
         # the ignore querystring field setting
+        for name in self._ignoredQuerystringFields():
+            if name in data:
+                del data[name]
+
+        return data
 
-        # before we start, we allow it for sub-requests since in this case,
-        # the input is safe and we can trust it
+    def _ignoredQuerystringFields(self):
+        """Return the names of the fields left out of the data read from
+        the request, see ``plone.tiles.directives.ignore_querystring``.
+        """
+        # we allow them for sub-requests since in this case, the input is
+        # safe and we can trust it
         if ISubRequest.providedBy(self.tile.request):
-            return data
+            return ()
 
-        # first off, we only care to filter if it is a GET request
+        # we only care to filter if it is a GET request
         if getattr(self.tile.request, "REQUEST_METHOD", "GET") != "GET":
-            return data
+            return ()
 
         # now, pay attention to schema hints for form data
-        if self.tileType is not None and self.tileType.schema is not None:
-            for name in (
-                self.tileType.schema.queryTaggedValue(IGNORE_QUERYSTRING_KEY) or []
-            ):
-                if name in data:
-                    del data[name]
-
-        return data
+        if self.tileType is None or self.tileType.schema is None:
+            return ()
+        return getCodecPlan(self.tileType.schema).ignore_querystring
 
 
 @adapter(ITile)
@@ -104,16 +425,11 @@ class TransientTileDataManager(BaseTileDataManager):
     request query string.
     """
 
-    def __init__(self, tile):
+    def __init__(self, tile, resolved=None):
         self.tile = tile
-        self.tileType = queryUtility(ITileType, name=tile.__name__)
-
-        self.context = getMultiAdapter(
-            (tile.context, tile.request, tile), ITileDataContext
-        )
-        self.storage = getMultiAdapter(
-            (self.context, tile.request, tile), ITileDataStorage
-        )
+        if resolved is None:
+            resolved = resolveTileData(tile)
+        self.tileType, self.context, self.storage = resolved
 
         if IAnnotations.providedBy(self.storage):
             self.key = ".".join([ANNOTATIONS_KEY_PREFIX, str(tile.id)])
@@ -124,27 +440,39 @@ class TransientTileDataManager(BaseTileDataManager):
     def annotations(self):  # BBB for < 0.7.0 support
         return self.storage
 
-    def get(self):
+    def _build(self, record):
         # use explicitly set data (saved as annotation on the request)
-        if self.key in self.storage:
-            data = dict(self.storage[self.key])
+        if record is not None:
+            data = dict(record)
 
             if self.tileType is not None and self.tileType.schema is not None:
-                for name, field in getFields(self.tileType.schema).items():
+                for name, missing_value in getCodecPlan(self.tileType.schema).missing:
                     if name not in data:
-                        data[name] = field.missing_value
+                        data[name] = missing_value
         # fall back to the copy of request.form object itself
         else:
             data = self.get_default_request_data()
 
         return data
 
+    def _buildLazy(self, record):
+        if record is None:
+            # like get_default_request_data(), which leaves these fields out
+            missing = self._missingValues()
+            for name in self._ignoredQuerystringFields():
+                missing.pop(name, None)
+            return LazyTileData(record, missing, self._decodeRequestField)
+        # explicitly set data is used as is, without looking at the request
+        return LazyTileData(record, self._missingValues())
+
     def set(self, data):
         self.storage[self.key] = data
+        self.invalidate()
 
     def delete(self):
         if self.key in self.storage:
             self.storage[self.key] = {}
+            self.invalidate()
 
 
 @adapter(IPersistentTile)
@@ -152,18 +480,26 @@ class TransientTileDataManager(BaseTileDataManager):
 class PersistentTileDataManager(BaseTileDataManager):
     """A data reader for persistent tiles operating on annotatable contexts.
     The data is retrieved from an annotation.
+
+    Request data is only used for fields missing from the stored data. Unless
+    ``lazyRequestData`` is False, only these fields are decoded from the
+    request.
+
+    If ``plone.tiles.cache.DATA_CACHE`` is enabled, data decoded from a stored
+    record alone is shared by all requests of the process until the record
+    is changed. Its values must not be changed in place.
     """
 
-    def __init__(self, tile):
-        self.tile = tile
-        self.tileType = queryUtility(ITileType, name=tile.__name__)
+    lazyRequestData = True
 
-        self.context = getMultiAdapter(
-            (tile.context, tile.request, tile), ITileDataContext
-        )
-        self.storage = getMultiAdapter(
-            (self.context, tile.request, tile), ITileDataStorage
-        )
+    # names of the fields changed by the last call to set() or delete()
+    changed = frozenset()
+
+    def __init__(self, tile, resolved=None):
+        self.tile = tile
+        if resolved is None:
+            resolved = resolveTileData(tile)
+        self.tileType, self.context, self.storage = resolved
 
         if IAnnotations.providedBy(self.storage):
             self.key = ".".join([ANNOTATIONS_KEY_PREFIX, str(tile.id)])
@@ -174,21 +510,197 @@ class PersistentTileDataManager(BaseTileDataManager):
     def annotations(self):  # BBB for < 0.7.0 support
         return self.storage
 
-    def get(self):
-        data = self.get_default_request_data()
-        data.update(dict(self.storage.get(self.key, {})))
+    def _build(self, record):
+        cacheKey = self._dataCacheKey(record)
+        if cacheKey is not None:
+            data = DATA_CACHE.get(cacheKey)
+            METRICS.observeCache(self.tile.__name__, "data", data is not None)
+            if data is not None:
+                return data
+
+        data = self._decode(record)
+
+        if cacheKey is not None and not any(
+            isinstance(value, Persistent) for value in data.values()
+        ):
+            DATA_CACHE.set(cacheKey, data)
+        return data
+
+    def _dataCacheKey(self, record):
+        # Only data decoded from the record alone can be shared across
+        # requests, i.e. if the request has none of the fields missing from
+        # the record.
+        if not DATA_CACHE.enabled or not self._canMergeLazily():
+            return None
+        key = getDataCacheKey(record, self.tile.__name__)
+        if key is None:
+            return None
+        form = self.tile.request.form
+        for name, missing_value in getCodecPlan(self.tileType.schema).missing:
+            if name in form and name not in record:
+                return None
+        return key
+
+    def _decode(self, record):
+        if self._canMergeLazily():
+            # Stored values override the request, so only decode the fields
+            # not in the record, and nothing at all if it has all of them.
+            stored = record or {}
+            plan = getCodecPlan(self.tileType.schema)
+            names = [name for name, value in plan.missing if name not in stored]
+            data = self.get_default_request_data(names) if names else {}
+        else:
+            data = self.get_default_request_data()
+        data.update(dict(record or {}))
         if self.tileType is not None and self.tileType.schema is not None:
-            for name, field in getFields(self.tileType.schema).items():
+            for name, missing_value in getCodecPlan(self.tileType.schema).missing:
                 if name not in data:
-                    data[name] = field.missing_value
+                    data[name] = missing_value
         return data
 
+    def _canMergeLazily(self):
+        return self.lazyRequestData and self._canDecodeLazily()
+
     def set(self, data):
-        self.storage[self.key] = PersistentDict(data)
+        """Store the given data.
+
+        A stored ``TileDataRecord`` is updated in place, writing only the
+        changed keys, and nothing is written at all if no value changed.
+        Records of other types are replaced by a ``TileDataRecord``.
+        Afterwards, ``changed`` is the set of names of the fields that were
+        changed, and an ``ITileDataModifiedEvent`` has been fired for the
+        tile unless nothing changed.
+        """
+        record = self.storage.get(self.key)
+        if record is None:
+            self.changed = frozenset(data)
+            self.storage[self.key] = TileDataRecord(data)
+        else:
+            self.changed = frozenset(
+                name
+                for name in set(record).union(data)
+                if name not in record
+                or name not in data
+                or not _unchanged(record[name], data[name])
+            )
+            if not self.changed:
+                return
+            if isinstance(record, TileDataRecord):
+                for name in self.changed:
+                    if name in data:
+                        record[name] = data[name]
+                    else:
+                        del record[name]
+            else:
+                self.storage[self.key] = TileDataRecord(data)
+        if METRICS.enabled:
+            METRICS.observeDataSize(self.tile.__name__, approximateSize(data))
+        self.invalidate()
+        notify(TileDataModifiedEvent(self.tile, self.changed))
 
     def delete(self):
-        if self.key in self.storage:
-            del self.storage[self.key]
+        record = self.storage.get(self.key)
+        if record is None:
+            self.changed = frozenset()
+            return
+        self.changed = frozenset(record)
+        del self.storage[self.key]
+        self.invalidate()
+        notify(TileDataDeletedEvent(self.tile, self.changed))
+
+
+# Values of these types cannot have been changed in place, so they can be
+# compared by equality even if they are the very object already stored.
+IMMUTABLE_TYPES = (
+    str,
+    bytes,
+    int,
+    float,
+    complex,
+    type(None),
+    frozenset,
+    decimal.Decimal,
+    datetime.date,
+    datetime.time,
+    datetime.timedelta,
+)
+
+
+def _isImmutable(value):
+    if isinstance(value, tuple):
+        return all(_isImmutable(item) for item in value)
+    return isinstance(value, IMMUTABLE_TYPES)
+
+
+def _unchanged(old, new):
+    if old is new:
+        # e.g. a list from get() that was appended to
+        return _isImmutable(new)
+    return type(old) is type(new) and old == new
+
+
+def get_many(context, request, tiles):
+    """Return the data of several tiles of a context in one pass.
+
+    ``tiles`` is a sequence of ``(tile name, tile id)`` pairs. The result is a
+    dict mapping these pairs to the tile data, as ``ITileDataManager.get()``
+    would return it. Tiles whose name cannot be looked up are left out. The
+    tile type, data context and storage are resolved once for all tiles of
+    the same name, which assumes that they do not depend on the tile id.
+
+    The data managers are those cached on the request, so rendering the tiles
+    afterwards reads their data without looking at the storage again.
+    Storages providing ``IBatchTileDataStorage`` fetch the records of all
+    tiles sharing a data context with one ``getMany()`` call; other storages
+    are read key by key.
+    """
+    groups = {}
+    for name, tid in tiles:
+        groups.setdefault(name, []).append(tid)
+
+    managers = {}
+    for name, tids in groups.items():
+        # the tile, its data manager, type, data context and storage are only
+        # looked up for the first tile of each name
+        first = queryMultiAdapter((context, request), name=name)
+        if first is None:
+            continue
+        first.id = tids[0]
+        manager = managers[(name, tids[0])] = ITileDataManager(first)
+        factory = type(manager)
+        resolved = None
+        if factory.__init__ in (
+            TransientTileDataManager.__init__,
+            PersistentTileDataManager.__init__,
+        ):
+            resolved = (manager.tileType, manager.context, manager.storage)
+        for tid in tids[1:]:
+            tile = type(first)(context, request)
+            tile.__name__ = first.__name__
+            tile.id = tid
+            if resolved is None:
+                managers[(name, tid)] = ITileDataManager(tile)
+            else:
+                managers[(name, tid)] = cachedTileDataManager(factory, tile, resolved)
+
+    batches = {}
+    for manager in managers.values():
+        if (
+            isinstance(manager, BaseTileDataManager)
+            and manager._cachedData is None
+            and IBatchTileDataStorage.providedBy(manager.storage)
+        ):
+            # Storages of the same type for the same data context are assumed
+            # to be interchangeable
+            group = (type(manager), type(manager.storage), id(manager.context))
+            batches.setdefault(group, []).append(manager)
+
+    for batch in batches.values():
+        records = batch[0].storage.getMany([manager.key for manager in batch])
+        for manager in batch:
+            manager.prefetched(records.get(manager.key))
+
+    return {key: manager.get() for key, manager in managers.items()}
 
 
 @implementer(ITileDataContext)
@@ -274,22 +786,14 @@ def encode(data, schema, ignore=()):
 
     encode = []
 
-    for name, field in getFieldsInOrder(schema):
-        if HAS_RFC822 and IPrimaryField.providedBy(field):
-            continue
+    for plan in getCodecPlan(schema).encoders:
+        name = plan.name
 
         if name in ignore or name not in data:
             continue
 
-        converter = IFieldTypeConverter(field, None)
-        if converter is None:
-            raise ComponentLookupError(
-                f"Cannot URL encode {name} of type {field.__class__}"
-            )
-
-        encoded_name = name
-        if converter.token:
-            encoded_name = ":".join([name, converter.token])
+        if plan.error is not None:
+            raise ComponentLookupError(plan.error)
 
         value = data[name]
         if value is None:
@@ -297,18 +801,11 @@ def encode(data, schema, ignore=()):
         elif isinstance(value, str):
             value = value.encode("utf-8")
 
-        if ISequence.providedBy(field):
-            value_type_converter = IFieldTypeConverter(field.value_type, None)
-            if value_type_converter is None:
-                raise ComponentLookupError(
-                    "Cannot URL encode value type for {} of type "
-                    "{} : {}".format(name, field.__class__, field.value_type.__class__)
-                )
+        if plan.sequence:
+            if plan.value_type_error is not None:
+                raise ComponentLookupError(plan.value_type_error)
 
-            if value_type_converter.token:
-                encoded_name = ":".join(
-                    [name, value_type_converter.token, converter.token]
-                )
+            encoded_name = plan.sequence_name
 
             for item in value:
 
@@ -328,6 +825,8 @@ def encode(data, schema, ignore=()):
                     )
 
         else:
+            encoded_name = plan.encoded_name
+
             # The :bool converter just does bool() value, but urlencode() does
             # str() on the object. The result is False => 'False' => True :(
             if isinstance(value, bool):
@@ -344,7 +843,7 @@ def encode(data, schema, ignore=()):
 # Decoding
 
 
-def decode(data, schema, missing=True, primary=False):
+def decode(data, schema, missing=True, primary=False, names=None):
     """Decode a data dict according to a schema. The returned dictionary will
     contain only keys matching schema names, and will force type values
     appropriately.
@@ -360,51 +859,41 @@ def decode(data, schema, missing=True, primary=False):
     decoded from the data. (Primary fields are not decoded by default,
     because primary field are mainly used for rich text or binary fields
     and data is usually parsed from query string with length limitations.)
+
+    If names is given, only the fields with these names are decoded.
     """
 
     decoded = {}
 
-    for name, field in getFields(schema).items():
-        if not primary and HAS_RFC822 and IPrimaryField.providedBy(field):
+    codecPlan = getCodecPlan(schema)
+    if names is None:
+        plans = codecPlan.decoders
+    else:
+        byName = codecPlan.decoders_by_name
+        plans = [byName[name] for name in names if name in byName]
+
+    for plan in plans:
+        if not primary and plan.primary:
             continue
 
+        name = plan.name
         if name not in data:
             if missing:
-                decoded[name] = field.missing_value
+                decoded[name] = plan.missing_value
             continue
 
         value = data[name]
         if value is None:
             continue
 
-        field_type = field._type
-        if isinstance(
-            field_type,
-            (
-                tuple,
-                list,
-            ),
-        ):
-            field_type = field_type[-1]
-
-        if ISequence.providedBy(field):
+        if plan.sequence:
             converted = []
 
-            value_type_field_type = field.value_type._type
-            if isinstance(
-                value_type_field_type,
-                (
-                    tuple,
-                    list,
-                ),
-            ):
-                value_type_field_type = value_type_field_type[-1]
-
+            value_type_type = plan.value_type_type
+            value_type_factory = plan.value_type_factory
             for item in value:
-                if field.value_type._type and not isinstance(
-                    item, field.value_type._type
-                ):
-                    item = value_type_field_type(item)
+                if value_type_type and not isinstance(item, value_type_type):
+                    item = value_type_factory(item)
                 converted.append(item)
 
             value = converted
@@ -414,9 +903,164 @@ def decode(data, schema, missing=True, primary=False):
         if isinstance(value, bytes):
             value = value.decode("utf-8")
 
-        if field._type is not None and not isinstance(value, field._type):
-            value = field_type(value)
+        if plan.type is not None and not isinstance(value, plan.type):
+            value = plan.factory(value)
 
         decoded[name] = value
 
     return decoded
+
+
+# Codec plans
+
+EncodePlan = collections.namedtuple(
+    "EncodePlan",
+    (
+        "name",
+        "encoded_name",
+        "error",
+        "sequence",
+        "sequence_name",
+        "value_type_error",
+    ),
+)
+
+DecodePlan = collections.namedtuple(
+    "DecodePlan",
+    (
+        "name",
+        "primary",
+        "missing_value",
+        "type",
+        "factory",
+        "sequence",
+        "value_type_type",
+        "value_type_factory",
+    ),
+)
+
+CodecPlan = collections.namedtuple(
+    "CodecPlan",
+    (
+        "encoders",
+        "decoders",
+        "decoders_by_name",
+        "missing",
+        "ignore_querystring",
+    ),
+)
+
+# registry -> {schema: (generation, plan)}
+_codecPlans = weakref.WeakKeyDictionary()
+
+
+def _typeFactory(field_type):
+    """The last entry of a field's ``_type`` tuple is used to convert values"""
+    if isinstance(
+        field_type,
+        (
+            tuple,
+            list,
+        ),
+    ):
+        return field_type[-1]
+    return field_type
+
+
+def _isPrimary(field):
+    return HAS_RFC822 and IPrimaryField.providedBy(field)
+
+
+def _compileEncodePlan(name, field):
+    converter = IFieldTypeConverter(field, None)
+    if converter is None:
+        return EncodePlan(
+            name,
+            name,
+            f"Cannot URL encode {name} of type {field.__class__}",
+            False,
+            None,
+            None,
+        )
+
+    encoded_name = name
+    if converter.token:
+        encoded_name = ":".join([name, converter.token])
+
+    if not ISequence.providedBy(field):
+        return EncodePlan(name, encoded_name, None, False, None, None)
+
+    sequence_name = encoded_name
+    value_type_error = None
+    value_type_converter = IFieldTypeConverter(field.value_type, None)
+    if value_type_converter is None:
+        value_type_error = (
+            "Cannot URL encode value type for {} of type "
+            "{} : {}".format(name, field.__class__, field.value_type.__class__)
+        )
+    elif value_type_converter.token and converter.token:
+        sequence_name = ":".join([name, value_type_converter.token, converter.token])
+
+    return EncodePlan(name, encoded_name, None, True, sequence_name, value_type_error)
+
+
+def _compileDecodePlan(name, field):
+    sequence = ISequence.providedBy(field)
+    value_type_type = value_type_factory = None
+    if sequence and field.value_type is not None:
+        value_type_type = field.value_type._type
+        value_type_factory = _typeFactory(value_type_type)
+
+    return DecodePlan(
+        name,
+        _isPrimary(field),
+        field.missing_value,
+        field._type,
+        _typeFactory(field._type),
+        sequence,
+        value_type_type,
+        value_type_factory,
+    )
+
+
+def _compileCodecPlan(schema):
+    encoders = tuple(
+        _compileEncodePlan(name, field)
+        for name, field in getFieldsInOrder(schema)
+        if not _isPrimary(field)
+    )
+    fields = getFields(schema)
+    decoders = tuple(_compileDecodePlan(name, field) for name, field in fields.items())
+    decoders_by_name = {plan.name: plan for plan in decoders}
+    missing = tuple((name, field.missing_value) for name, field in fields.items())
+    ignore_querystring = tuple(schema.queryTaggedValue(IGNORE_QUERYSTRING_KEY) or ())
+    return CodecPlan(encoders, decoders, decoders_by_name, missing, ignore_querystring)
+
+
+def getCodecPlan(schema):
+    """Return the compiled, immutable ``CodecPlan`` used by ``encode()`` and
+    ``decode()`` for the given schema.
+
+    Plans are compiled on first use and cached per component registry. The
+    field type converters are adapters, so a plan is recompiled whenever the
+    adapter registry of the current site manager changes.
+    """
+    registry = getSiteManager().adapters
+    generation = getattr(registry, "_generation", None)
+
+    plans = _codecPlans.get(registry)
+    if plans is None:
+        plans = _codecPlans[registry] = {}
+
+    cached = plans.get(schema)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    plan = _compileCodecPlan(schema)
+    plans[schema] = (generation, plan)
+    return plan
+
+
+def clearCodecPlans():
+    """Drop all compiled codec plans, e.g. after modifying a schema in place"""
+    _codecPlans.clear()
@@ -1,15 +1,29 @@
+from plone.tiles import timing
 from plone.tiles.interfaces import ESI_HEADER
 from plone.tiles.interfaces import ESI_HEADER_KEY
 from plone.tiles.interfaces import IESIRendered
+from plone.tiles.interfaces import ILazyRendered
+from plone.tiles.interfaces import IPartialRendering
 from plone.tiles.interfaces import ITileType
+from plone.tiles.metrics import measuredRender
+from plone.tiles.profiling import profiled
+from plone.tiles.profiling import profiledRender
+from plone.tiles.tile import cachedRender
+from plone.tiles.tile import conditionalRender
+from plone.tiles.tile import handleConditionalRequest
+from plone.tiles.tile import markFragmentRequest
 from plone.tiles.tile import PersistentTile
+from plone.tiles.tile import prepareTile
+from plone.tiles.tile import setCachingHeaders
 from plone.tiles.tile import Tile
 from Products.Five import BrowserView
 from zExceptions import Unauthorized
 from zope.component import queryUtility
 from zope.interface import implementer
 
+import itertools
 import os
+import pathlib
 import re
 import transaction
 
@@ -21,9 +35,33 @@ except ImportError:
 
 X_FRAME_OPTIONS = os.environ.get("PLONE_X_FRAME_OPTIONS", "SAMEORIGIN")
 
+# Loads the placeholders of lazily loaded tiles, served by @@tiles-lazy.js
+LAZY_SCRIPT = (pathlib.Path(__file__).parent / "lazy.js").read_text()
+
+# BBB: no longer used, see extractChildren()
 HEAD_CHILDREN = re.compile(r"<head[^>]*>(.*)</head>", re.I | re.S)
 BODY_CHILDREN = re.compile(r"<body[^>]*>(.*)</body>", re.I | re.S)
 
+# Used for tags which are neither in lower nor upper case
+OPENING_TAGS = {
+    tag: (
+        re.compile(rf"<{tag}(?:\s[^>]*)?>", re.I),
+        re.compile(rf"<{tag}(?:\s[^>]*)?>".encode(), re.I),
+    )
+    for tag in ("head", "body")
+}
+# Characters ending a tag name
+TAG_NAME_ENDS = (">/ \t\n\r\f", b">/ \t\n\r\f")
+
+# Used for tags which are neither in lower nor upper case
+CLOSING_TAGS = {
+    tag: (
+        re.compile(rf"</{tag}\s*>", re.I),
+        re.compile(rf"</{tag}\s*>".encode(), re.I),
+    )
+    for tag in ("head", "body")
+}
+
 ESI_NAMESPACE_MAP = {"esi": "http://www.edge-delivery.org/esi/1.0"}
 _ESI_HREF = 'href="{url}/@@{esiMode}?{queryString}"'
 ESI_TEMPLATE = (
@@ -41,21 +79,256 @@ ESI_TEMPLATE = (
 )
 
 
+# The number of characters (or bytes) of a chunk which may be held back by
+# substituteESILinks() while waiting for the end of a placeholder link
+MAX_HELD_BACK = 64 * 1024
+
+
+class _ESILinkSubstitution:
+    """Replaces ESI placeholder links in a document of str (or of bytes, if
+    ``binary`` is true), given at once or as consecutive chunks.
+
+    Placeholders are found by searching for their class name, which is much
+    faster than matching a regular expression at each ``<``. Links written
+    by ``ESI_TEMPLATE`` are then matched by a literal pattern, and only links
+    with other attribute orders or quoting are parsed attribute by attribute.
+    """
+
+    def __init__(self, binary=False):
+        def convert(value):
+            return value.encode("ascii") if binary else value
+
+        self.empty = convert("")
+        self.lt = convert("<")
+        self.gt = convert(">")
+        self.marker = convert("_esi_placeholder")
+        self.html = re.compile(convert(r"<html\b"), re.I)
+        # inserted after "<html"
+        self.namespace = convert(' xmlns:esi="{}"'.format(ESI_NAMESPACE_MAP["esi"]))
+        # as written by ESI_TEMPLATE
+        self.canonical = re.compile(
+            convert(r'<a class="_esi_placeholder" rel="esi" href="([^"]+)"></a>')
+        )
+        self.canonicalOffset = len('<a class="')
+        # [^>]* cannot run past the end of the opening tag
+        self.link = re.compile(convert(r"<a\s([^>]*)>\s*</a\s*>"), re.I)
+        self.linkStart = re.compile(convert(r"<a\s"), re.I)
+        self.attribute = re.compile(
+            convert(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+        )
+        self.names = tuple(convert(name) for name in ("class", "rel", "href"))
+        self.esi = convert("esi")
+        self.include = (convert('<esi:include src="'), convert('" />'))
+
+    def substitute(self, document, namespace=True):
+        """Return the document with the placeholder links replaced and, if
+        ``namespace`` is true, the ESI namespace added to its first <html />
+        tag.
+        """
+        parts = []
+        append = parts.append
+        # the namespace is inserted when the text before and after it is
+        # copied, independently of the placeholders found
+        insertAt = None
+        if namespace:
+            match = self.html.search(document)
+            if match is not None:
+                insertAt = match.end()
+
+        def copy(start, end):
+            nonlocal insertAt
+            if insertAt is not None and start <= insertAt <= end:
+                append(document[start:insertAt])
+                append(self.namespace)
+                start, insertAt = insertAt, None
+            append(document[start:end])
+
+        position = 0
+        find = document.find
+        marker = self.marker
+        offset = self.canonicalOffset
+        canonical = self.canonical.match
+        opening, closing = self.include
+        found = find(marker)
+        while found >= 0:
+            start = found - offset
+            match = canonical(document, start) if start >= position else None
+            if match is not None:
+                href = match.group(1)
+            else:
+                start, match, href = self.parse(document, position, found)
+            if href is None:
+                found = find(marker, found + 1)
+                continue
+            copy(position, start)
+            append(opening + href + closing)
+            position = match.end()
+            found = find(marker, position)
+
+        if not parts and insertAt is None:
+            return document
+        copy(position, len(document))
+        return self.empty.join(parts)
+
+    def parse(self, document, position, found):
+        """Return the start, match and URL of a placeholder link written with
+        another attribute order or quoting than ``ESI_TEMPLATE``, around the
+        class name found at ``found``. The URL is None if there is no such
+        link.
+        """
+        start = document.rfind(self.lt, position, found)
+        match = self.link.match(document, start) if start >= 0 else None
+        if match is None or match.end() <= found:
+            return start, match, None
+        attributes = {}
+        for name, double, single, bare in self.attribute.findall(match.group(1)):
+            attributes[name.lower()] = double or single or bare
+        classes, rel, href = (attributes.get(name) for name in self.names)
+        if (
+            not href
+            or classes is None
+            or self.marker not in classes.split()
+            or rel is None
+            or rel.lower() != self.esi
+        ):
+            href = None
+        return start, match, href
+
+    def chunks(self, iterable):
+        """Yield the chunks of an iterable with the placeholder links
+        replaced. The end of a chunk is held back while it may be part of a
+        tag or link continued in the next chunk.
+        """
+        namespace = True
+        carry = self.empty
+        for chunk in iterable:
+            buffer = carry + chunk if carry else chunk
+            end = self.completeUntil(buffer)
+            carry = buffer[end:]
+            if end:
+                part = buffer[:end]
+                if namespace and self.html.search(part) is not None:
+                    namespace = False
+                    yield self.substitute(part)
+                else:
+                    yield self.substitute(part, namespace=False)
+        if carry:
+            yield self.substitute(carry, namespace)
+
+    def completeUntil(self, buffer):
+        """Return the position up to which ``buffer`` contains no incomplete
+        tag or placeholder link.
+        """
+        end = len(buffer)
+        limit = max(end - MAX_HELD_BACK, 0)
+        start = buffer.rfind(self.lt, limit)
+        if start >= 0 and buffer.find(self.gt, start) < 0:
+            end = start
+        # a complete opening tag of a placeholder, which may be followed by
+        # the closing tag in the next chunk
+        found = buffer.rfind(self.marker, limit, end)
+        start = buffer.rfind(self.lt, limit, found) if found >= 0 else -1
+        if (
+            start >= 0
+            and self.linkStart.match(buffer, start) is not None
+            and self.link.match(buffer, start, end) is None
+        ):
+            rest = buffer[buffer.find(self.gt, found) + 1 : end].strip()
+            if len(rest) < len("</a >"):
+                end = start
+        return end
+
+
 def substituteESILinks(rendered):
     """Turn ESI links like <a class="_esi_placeholder" rel="esi" href="..." />
-    into <esi:include /> links.
+    into <esi:include /> links, and add the ESI namespace to the first
+    <html /> tag.
 
-    ``rendered`` should be an HTML string.
+    ``rendered`` may be an HTML string, bytes, or an iterable of string or
+    bytes chunks, which is substituted as a generator of chunks. The
+    attributes of the links may come in any order and with any quoting.
     """
+    if isinstance(rendered, str):
+        return SUBSTITUTIONS[False].substitute(rendered)
+    if isinstance(rendered, (bytes, bytearray)):
+        return SUBSTITUTIONS[True].substitute(bytes(rendered))
+    return _substituteChunks(rendered)
+
+
+def _substituteChunks(iterable):
+    iterator = iter(iterable)
+    first = next(iterator, None)
+    if first is None:
+        return
+    substitution = SUBSTITUTIONS[not isinstance(first, str)]
+    yield from substitution.chunks(itertools.chain([first], iterator))
+
+
+SUBSTITUTIONS = {
+    False: _ESILinkSubstitution(),
+    True: _ESILinkSubstitution(binary=True),
+}
+
+
+def extractChildren(document, tag):
+    """Return the children of the ``tag`` element (``head`` or ``body``) of
+    an HTML document, without surrounding whitespace, or None if the
+    document has no such element.
+
+    The tags are found with a few linear string searches instead of a
+    backtracking regular expression: the opening tag and the closing
+    ``</head>`` from the start of the document, the closing ``</body>`` from
+    its end. ``document`` may be a string, or bytes, in which case a
+    ``memoryview`` of the children is returned instead of a copy.
+    """
+    binary = not isinstance(document, str)
+    opening = f"<{tag}"
+    closing = f"</{tag}>"
+    if binary:
+        opening, closing = opening.encode(), closing.encode()
+
+    start = _findTag(document, opening, 0, len(document))
+    while start >= 0 and (
+        document[start + len(opening) : start + len(opening) + 1]
+        not in TAG_NAME_ENDS[binary]
+    ):
+        # e.g. <header>
+        start = _findTag(document, opening, start + 1, len(document))
+    if start < 0:
+        match = OPENING_TAGS[tag][binary].search(document)
+        if match is None:
+            return None
+        start = match.start()
+    start = document.find(b">" if binary else ">", start) + 1
+    if start == 0:
+        return None
 
-    rendered = re.sub(
-        r"<html", '<html xmlns:esi="{}"'.format(ESI_NAMESPACE_MAP["esi"]), rendered, 1
-    )
-    return re.sub(
-        r'<a class="_esi_placeholder" rel="esi" href="([^"]+)"></a>',
-        r'<esi:include src="\1" />',
-        rendered,
-    )
+    end = _findTag(document, closing, start, len(document), reverse=tag == "body")
+    if end < 0:
+        matches = list(CLOSING_TAGS[tag][binary].finditer(document, start))
+        if not matches:
+            return None
+        end = matches[0 if tag == "head" else -1].start()
+
+    if binary:
+        whitespace = b" \t\n\r\f\v"
+        while start < end and document[start] in whitespace:
+            start += 1
+        while end > start and document[end - 1] in whitespace:
+            end -= 1
+        return memoryview(document)[start:end]
+    return document[start:end].strip()
+
+
+def _findTag(document, tag, start, end, reverse=False):
+    """Return the position of the first (or last) ``tag`` between ``start``
+    and ``end``, spelled in lower case, or else in upper case, or -1.
+    """
+    find = document.rfind if reverse else document.find
+    position = find(tag, start, end)
+    if position < 0:
+        position = find(tag.upper(), start, end)
+    return position
 
 
 class ConditionalESIRendering:
@@ -67,6 +340,10 @@ class ConditionalESIRendering:
             "a view page template file"
         )
 
+    @conditionalRender
+    @profiledRender
+    @measuredRender
+    @cachedRender
     def __call__(self, *args, **kwargs):
         if self.request.getHeader(ESI_HEADER, "false").lower() == "true":
             mode = "esi-body"
@@ -81,12 +358,17 @@ class ConditionalESIRendering:
                 queryString=self.request.get("QUERY_STRING", ""),
                 esiMode=mode,
             )
+        prepareTile(self)
         # Do not hide AttributeError inside index()
+        started = timing.start()
         try:
             self.index
         except AttributeError:
-            return self.render()
-        return self.index(*args, **kwargs)
+            result = self.render()
+        else:
+            result = self.index(*args, **kwargs)
+        timing.stop(self, timing.RENDER, started)
+        return result
 
 
 # Convenience base classes
@@ -114,43 +396,40 @@ class ESIPersistentTile(ConditionalESIRendering, PersistentTile):
     head = False
 
 
-# ESI views
+@implementer(ILazyRendered)
+class LazyTile(Tile):
+    """Convenience class for tiles loaded by the browser when they near the
+    viewport, see ``ILazyRendered``.
 
+    Set ``lazyLoad`` to False to render the tile with the page again.
+    """
 
-class ESIHead(BrowserView):
-    """Render the head portion of a tile independently."""
+    lazyLoad = True
 
-    def __call__(self):
-        """Return the children of the <head> tag as a fragment."""
-        # Check for the registered view permission
-        try:
-            type_ = queryUtility(ITileType, self.context.__name__)
-            permission = type_.view_permission
-        except AttributeError:
-            permission = None
-        if permission:
-            if not checkPermission(permission, self.context):
-                raise Unauthorized()
 
-        if self.request.getHeader(ESI_HEADER):
-            del self.request.environ[ESI_HEADER_KEY]
+@implementer(ILazyRendered)
+class LazyPersistentTile(PersistentTile):
+    """Convenience class for persistent tiles loaded by the browser when
+    they near the viewport, see ``ILazyRendered``.
 
-        document = self.context()  # render the tile
+    Set ``lazyLoad`` to False to render the tile with the page again.
+    """
 
-        # Disable the theme so we don't <html/>-wrapped
-        self.request.response.setHeader("X-Theme-Disabled", "1")
+    lazyLoad = True
 
-        match = HEAD_CHILDREN.search(document)
-        if not match:
-            return document
-        return match.group(1).strip()
 
+# ESI views
 
-class ESIBody(BrowserView):
-    """Render the head portion of a tile independently."""
+
+class ESIView(BrowserView):
+    """Render the children of the <head /> or <body /> of a tile
+    independently.
+    """
+
+    tag = "body"
 
     def __call__(self):
-        """Return the children of the <head> tag as a fragment."""
+        """Return the children of the tag as a fragment."""
         # Check for the registered view permission
         try:
             type_ = queryUtility(ITileType, self.context.__name__)
@@ -163,16 +442,61 @@ class ESIBody(BrowserView):
 
         if self.request.getHeader(ESI_HEADER):
             del self.request.environ[ESI_HEADER_KEY]
+        # render lazily loaded tiles instead of their placeholder
+        markFragmentRequest(self.request)
+
+        if handleConditionalRequest(self.context):
+            setCachingHeaders(self.context)
+            timing.setServerTimingHeader(self.context)
+            return ""
 
-        document = self.context()  # render the tile
+        fragment = profiled(self.context, self.extract)
+        setCachingHeaders(self.context)
+        timing.setServerTimingHeader(self.context)
 
         # Disable the theme so we don't <html/>-wrapped
         self.request.response.setHeader("X-Theme-Disabled", "1")
+        return fragment
+
+    def extract(self):
+        """Render the children of the tag"""
+        started = timing.start()
+        if IPartialRendering.providedBy(self.context):
+            prepareTile(self.context)
+            if self.tag == "head":
+                fragment = self.context.renderHead()
+            else:
+                fragment = self.context.renderBody()
+        else:
+            document = self.context()  # render the tile
+            fragment = extractChildren(document, self.tag)
+            if fragment is None:
+                fragment = document
+        timing.stop(self.context, timing.EXTRACT, started)
+        return fragment
+
+
+class ESIHead(ESIView):
+    """Render the head portion of a tile independently."""
 
-        match = BODY_CHILDREN.search(document)
-        if not match:
-            return document
-        return match.group(1).strip()
+    tag = "head"
+
+
+class ESIBody(ESIView):
+    """Render the body portion of a tile independently."""
+
+    tag = "body"
+
+
+class LazyScript(BrowserView):
+    """Serve the script loading the placeholders of lazily loaded tiles"""
+
+    def __call__(self):
+        response = self.request.response
+        response.setHeader("Content-Type", "text/javascript; charset=utf-8")
+        response.setHeader("Cache-Control", "public, max-age=86400")
+        response.setHeader("X-Theme-Disabled", "1")
+        return LAZY_SCRIPT
 
 
 class ESIProtectTransform:
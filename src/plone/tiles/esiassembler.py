@@ -0,0 +1,397 @@
+"""A WSGI middleware resolving ESI includes in-process, for deployments
+without an ESI capable proxy in front of Zope.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from plone.tiles.cache import LRUCache
+from plone.tiles.esi import substituteESILinks
+from plone.tiles.interfaces import ESI_HEADER_KEY
+from urllib.parse import urljoin
+from urllib.parse import urlsplit
+
+import logging
+import os
+import re
+
+LOGGER = logging.getLogger("plone.tiles")
+
+# The class of the links rendered by tiles in place of ESI includes
+PLACEHOLDER = b"_esi_placeholder"
+
+ESI_INCLUDE = re.compile(rb"""<esi:include\s+src=(["'])(.*?)\1\s*/>""", re.I | re.S)
+
+# Marks responses which need to be assembled
+ESI_MARKER = re.compile(rb"<esi:|" + PLACEHOLDER, re.I)
+
+# Request headers of the page which do not apply to its fragments
+IGNORED_ENVIRON_KEYS = (
+    "CONTENT_TYPE",
+    "CONTENT_LENGTH",
+    "HTTP_IF_NONE_MATCH",
+    "HTTP_IF_MODIFIED_SINCE",
+    "HTTP_RANGE",
+    ESI_HEADER_KEY,
+)
+
+# Names of cookies which authenticate a request or identify a session, e.g.
+# of plone.session, plone.restapi or the Zope session machinery
+AUTH_COOKIES = re.compile(r"__ac|auth_tkt|auth_token|_ZopeId|__cp", re.I)
+
+# Cache-Control directives which forbid caching a fragment
+UNCACHEABLE = {"private", "no-store", "no-cache"}
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _virtualHostPrefixes(path):
+    """Return the internal and external prefix of a path rewritten for the
+    VirtualHostMonster, e.g. ``/VirtualHostBase/https/example.com:443/site/
+    VirtualHostRoot/_vh_intranet`` and ``/intranet``.
+    """
+    steps = path.split("/")
+    if "VirtualHostBase" not in steps or "VirtualHostRoot" not in steps:
+        return "", ""
+    end = steps.index("VirtualHostRoot") + 1
+    external = []
+    while end < len(steps) and steps[end].startswith("_vh_"):
+        external.append(steps[end][4:])
+        end += 1
+    return "/".join(steps[:end]), "".join("/" + step for step in external)
+
+
+class FragmentCache(LRUCache):
+    """A cache of rendered fragments, keyed by their URL and the values of
+    the request headers listed in their ``Vary`` header.
+
+    The names of the environ keys a fragment varies on are kept in an entry
+    of their own, so that they are evicted like the fragments.
+    """
+
+    def _key(self, environ, url, vary):
+        return ("body", url) + tuple(environ.get(key) for key in vary)
+
+    def lookup(self, environ, url):
+        vary = self.get(("vary", url))
+        if vary is None:
+            return None
+        return self.get(self._key(environ, url, vary))
+
+    def store(self, environ, url, headers, body):
+        """Store the body of a fragment response, if its ``Cache-Control``
+        header allows shared caches to keep it.
+        """
+        ttl = self.ttl(headers)
+        if not ttl or _header(headers, "Set-Cookie") is not None:
+            return
+        vary = tuple(
+            "HTTP_" + name.strip().upper().replace("-", "_")
+            for name in (_header(headers, "Vary") or "").split(",")
+            if name.strip()
+        )
+        if "HTTP_*" in vary:
+            return
+        self.set(("vary", url), vary, ttl=ttl)
+        self.set(self._key(environ, url, vary), body, size=len(body), ttl=ttl)
+
+    def ttl(self, headers):
+        """Return the number of seconds a shared cache may keep a fragment"""
+        directives = {}
+        for directive in (_header(headers, "Cache-Control") or "").split(","):
+            name, _, value = directive.strip().partition("=")
+            directives[name.lower()] = value
+        if "public" not in directives or UNCACHEABLE.intersection(directives):
+            return None
+        for name in ("s-maxage", "max-age"):
+            try:
+                return int(directives[name])
+            except (KeyError, ValueError):
+                continue
+        return None
+
+
+class ESIAssembler:
+    """WSGI middleware replacing ``<esi:include src="..." />`` tags in HTML
+    responses with the fragments they refer to.
+
+    Pages are requested with the ``X-ESI-Enabled`` header, so that tiles
+    rendered through ESI render placeholder links, which are turned into
+    includes with ``plone.tiles.esi.substituteESILinks()``.
+
+    Fragments are rendered by calling the wrapped application again, so
+    that each is traversed and published like a request of its own, with
+    its own ZODB connection. The includes of a page are rendered
+    concurrently by a pool of ``workers`` threads, and fragments sent with a
+    public ``Cache-Control`` header are kept in a cache of ``cache_size``
+    entries for as long as the header allows.
+
+    Only includes referring to the host of the page are resolved. Requests
+    from a proxy announcing ESI support with ``Surrogate-Capability`` are
+    passed through unchanged.
+
+    Responses are only buffered if their first chunks, up to ``sniffBytes``,
+    contain an include or a placeholder link, others are streamed.
+    """
+
+    maxDepth = 3
+    sniffBytes = 64 * 1024
+
+    def __init__(self, app, workers=4, cache_size=1000, cache_bytes=0):
+        self.app = app
+        self.workers = int(workers)
+        self.cache = FragmentCache(int(cache_size), int(cache_bytes))
+        self.executor = (
+            ThreadPoolExecutor(self.workers, thread_name_prefix="plone.tiles.esi")
+            if self.workers > 1
+            else None
+        )
+
+    def __call__(self, environ, start_response):
+        if "ESI/1.0" in environ.get("HTTP_SURROGATE_CAPABILITY", ""):
+            return self.app(environ, start_response)
+        if environ.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD", "POST"):
+            return self.app(environ, start_response)
+
+        # let tiles rendered through ESI render their placeholder links
+        environ = dict(environ)
+        environ[ESI_HEADER_KEY] = "true"
+        status, headers, result = self.start(environ, start_response)
+        if headers is None:
+            # not an HTML response, already passed on
+            return status
+        head, rest = self.sniff(result)
+        if not ESI_MARKER.search(head):
+            start_response(status, headers)
+            return _Chained(head, rest, result)
+        try:
+            body = head + b"".join(rest)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        if PLACEHOLDER in body:
+            body = substituteESILinks(body)
+        if not ESI_INCLUDE.search(body):
+            start_response(status, headers)
+            return [body]
+        body = self.assemble(environ, body)
+        headers = [
+            (key, value)
+            for key, value in headers
+            if key.lower() not in ("content-length", "etag")
+        ]
+        headers.append(("Content-Length", str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    def call(self, environ, start_response=None):
+        """Call the wrapped application and return the status, headers and
+        body of an HTML response.
+
+        Other responses are passed on to ``start_response`` as they are, and
+        returned as ``(result, None, None)``. Without ``start_response``, all
+        responses are returned.
+        """
+        status, headers, result = self.start(environ, start_response)
+        if headers is None:
+            return result, None, None
+        try:
+            chunks = list(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return status, headers, b"".join(chunks)
+
+    def start(self, environ, start_response=None):
+        """Call the wrapped application like ``call()``, but return the
+        result of an HTML response unread.
+        """
+        captured = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            html = (_header(headers, "Content-Type") or "").startswith("text/html")
+            if start_response is not None and not html:
+                captured["passed"] = True
+                return start_response(status, headers, exc_info)
+            captured["status"] = status
+            captured["headers"] = list(headers)
+            return written.append
+
+        result = self.app(environ, capture)
+        if not captured:
+            # start_response may be called when the first chunk is read
+            iterator = iter(result)
+            first = next(iterator, b"")
+            result = _Chained(first, iterator, result)
+        if captured.get("passed"):
+            return result, None, None
+        if written:
+            result = _Chained(b"".join(written), iter(result), result)
+        return captured["status"], captured["headers"], result
+
+    def sniff(self, result):
+        """Return the first chunks of a result, of at least ``sniffBytes``
+        unless it is shorter, and an iterator of the rest.
+        """
+        iterator = iter(result)
+        head = []
+        size = 0
+        for chunk in iterator:
+            head.append(chunk)
+            size += len(chunk)
+            if size >= self.sniffBytes:
+                break
+        return b"".join(head), iterator
+
+    def assemble(self, environ, body, depth=0):
+        """Return the body with its ESI includes replaced"""
+        matches = list(ESI_INCLUDE.finditer(body))
+        if not matches or depth >= self.maxDepth:
+            return body
+        srcs = [match.group(2).decode("utf-8", "replace") for match in matches]
+        # includes of fragments are rendered by the worker rendering the
+        # fragment, waiting for other workers could exhaust the pool
+        if self.executor is not None and len(srcs) > 1 and depth == 0:
+            fragments = list(
+                self.executor.map(lambda src: self.include(environ, src, depth), srcs)
+            )
+        else:
+            fragments = [self.include(environ, src, depth) for src in srcs]
+
+        parts = []
+        position = 0
+        for match, fragment in zip(matches, fragments):
+            parts.append(body[position : match.start()])
+            parts.append(match.group(0) if fragment is None else fragment)
+            position = match.end()
+        parts.append(body[position:])
+        return b"".join(parts)
+
+    def include(self, environ, src, depth=0):
+        """Return the body of the fragment at ``src``, or None to keep the
+        include tag.
+        """
+        fragmentEnviron = self.fragmentEnviron(environ, src)
+        if fragmentEnviron is None:
+            return None
+        url = (
+            fragmentEnviron.get("HTTP_HOST"),
+            fragmentEnviron["PATH_INFO"],
+            fragmentEnviron["QUERY_STRING"],
+        )
+        cacheable = self.cacheable(environ)
+        if cacheable:
+            cached = self.cache.lookup(environ, url)
+            if cached is not None:
+                return cached
+
+        try:
+            status, headers, body = self.call(fragmentEnviron)
+        except Exception:
+            LOGGER.exception("Could not include ESI fragment %s", src)
+            return b""
+        if not status.startswith("200"):
+            LOGGER.warning("Could not include ESI fragment %s: %s", src, status)
+            return b""
+        body = self.assemble(fragmentEnviron, body, depth + 1)
+        if cacheable:
+            self.cache.store(environ, url, headers, body)
+        return body
+
+    def cacheable(self, environ):
+        """Return True if fragments may be shared with other requests, i.e.
+        the request has neither credentials nor an authentication or session
+        cookie.
+        """
+        if environ.get("HTTP_AUTHORIZATION"):
+            return False
+        for cookie in environ.get("HTTP_COOKIE", "").split(";"):
+            name = cookie.partition("=")[0].strip()
+            if name and AUTH_COOKIES.match(name):
+                return False
+        return True
+
+    def fragmentEnviron(self, environ, src):
+        """Return the WSGI environ to render the fragment at ``src``, or
+        None if it is not served by this application.
+        """
+        src = src.replace("&amp;", "&")
+        url = urlsplit(src)
+        host = environ.get("HTTP_HOST") or environ.get("SERVER_NAME", "")
+        if url.scheme not in ("", "http", "https") or (
+            url.netloc and url.netloc != host
+        ):
+            return None
+
+        scriptName = environ.get("SCRIPT_NAME", "")
+        pathInfo = environ.get("PATH_INFO", "")
+        path = url.path
+        if not path.startswith("/"):
+            # relative to the page
+            path = urljoin(scriptName + pathInfo, path)
+        internal, external = _virtualHostPrefixes(pathInfo)
+        if scriptName:
+            if not path.startswith(scriptName + "/"):
+                return None
+            path = path[len(scriptName) :]
+        if internal:
+            if external and path.startswith(external + "/"):
+                path = path[len(external) :]
+            elif external:
+                return None
+            path = internal + path
+
+        fragmentEnviron = {
+            key: value
+            for key, value in environ.items()
+            if key not in IGNORED_ENVIRON_KEYS
+        }
+        fragmentEnviron.update(
+            {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": url.query,
+                "wsgi.input": BytesIO(),
+            }
+        )
+        return fragmentEnviron
+
+
+class _Chained:
+    """An iterable of a first chunk and the rest of a WSGI result"""
+
+    def __init__(self, first, rest, result):
+        self.first = first
+        self.rest = rest
+        self.result = result
+
+    def __iter__(self):
+        yield self.first
+        yield from self.rest
+
+    def close(self):
+        if hasattr(self.result, "close"):
+            self.result.close()
+
+
+def filter_factory(app, global_conf, **local_conf):
+    """PasteDeploy filter factory for the ESIAssembler middleware"""
+    return ESIAssembler(
+        app,
+        workers=local_conf.get(
+            "workers", os.environ.get("PLONE_TILES_ESI_WORKERS", "4")
+        ),
+        cache_size=local_conf.get(
+            "cache_size", os.environ.get("PLONE_TILES_ESI_CACHE_SIZE", "1000")
+        ),
+        cache_bytes=local_conf.get(
+            "cache_bytes",
+            os.environ.get("PLONE_TILES_ESI_CACHE_BYTES", str(64 * 1024 * 1024)),
+        ),
+    )
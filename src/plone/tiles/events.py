@@ -0,0 +1,47 @@
+from plone.tiles.cache import getSurrogateKeys
+from plone.tiles.interfaces import IESIRendered
+from plone.tiles.interfaces import ITileDataDeletedEvent
+from plone.tiles.interfaces import ITileDataModifiedEvent
+from plone.tiles.interfaces import ITilePhaseTimedEvent
+from zope.interface import implementer
+from zope.interface.interfaces import ObjectEvent
+
+
+@implementer(ITileDataModifiedEvent)
+class TileDataModifiedEvent(ObjectEvent):
+    """The stored data of a persistent tile has been changed.
+
+    The surrogate keys and URLs are only computed when a subscriber asks
+    for them.
+    """
+
+    def __init__(self, tile, changed=()):
+        super().__init__(tile)
+        self.changed = frozenset(changed)
+
+    @property
+    def surrogateKeys(self):
+        return getSurrogateKeys(self.object)
+
+    @property
+    def urls(self):
+        tile = self.object
+        url = tile.url.split("?", 1)[0]
+        if not IESIRendered.providedBy(tile):
+            return [url]
+        return [url, url + "/@@esi-body", url + "/@@esi-head"]
+
+
+@implementer(ITileDataDeletedEvent)
+class TileDataDeletedEvent(TileDataModifiedEvent):
+    """The stored data of a persistent tile has been deleted."""
+
+
+@implementer(ITilePhaseTimedEvent)
+class TilePhaseTimedEvent:
+    """A phase of handling a tile has been timed."""
+
+    def __init__(self, tile, phase, duration):
+        self.object = tile
+        self.phase = phase
+        self.duration = duration
@@ -1,6 +1,8 @@
+from zope.interface import Attribute
 from zope.interface import Interface
 from zope.interface.common.mapping import IMapping
 from zope.interface.interfaces import IInterface
+from zope.interface.interfaces import IObjectEvent
 from zope.publisher.interfaces.browser import IBrowserView
 
 import zope.schema
@@ -31,6 +33,83 @@ class ITileType(Interface):
         required=False,
     )
 
+    render_cache_ttl = zope.schema.Int(
+        title="Render cache TTL",
+        description="Seconds the output of the tile is cached for anonymous "
+        "users. None disables the render cache for this tile type",
+        required=False,
+        min=1,
+        default=None,
+    )
+
+    render_cache_vary = zope.schema.Tuple(
+        title="Render cache vary",
+        description="Names of the request variables the output of the tile "
+        "depends on",
+        value_type=zope.schema.ASCIILine(),
+        required=False,
+        default=(),
+    )
+
+    cache_max_age = zope.schema.Int(
+        title="Cache max-age",
+        description="Seconds browsers and proxies may cache responses of the "
+        "tile to anonymous users",
+        required=False,
+        min=0,
+        default=None,
+    )
+
+    cache_s_maxage = zope.schema.Int(
+        title="Cache s-maxage",
+        description="Seconds shared caches may cache responses of the tile",
+        required=False,
+        min=0,
+        default=None,
+    )
+
+    cache_stale_while_revalidate = zope.schema.Int(
+        title="Cache stale-while-revalidate",
+        description="Seconds caches may serve stale responses while they "
+        "revalidate them",
+        required=False,
+        min=0,
+        default=None,
+    )
+
+    cache_stale_if_error = zope.schema.Int(
+        title="Cache stale-if-error",
+        description="Seconds caches may serve stale responses if the tile "
+        "cannot be rendered",
+        required=False,
+        min=0,
+        default=None,
+    )
+
+    cache_vary = zope.schema.Tuple(
+        title="Cache vary",
+        description="Names of the request headers responses of the tile vary on",
+        value_type=zope.schema.ASCIILine(),
+        required=False,
+        default=(),
+    )
+
+    surrogate_keys = zope.schema.Tuple(
+        title="Surrogate keys",
+        description="Keys sent in the Surrogate-Key header of responses of " "the tile",
+        value_type=zope.schema.ASCIILine(),
+        required=False,
+        default=(),
+    )
+
+    lazy_load = zope.schema.Bool(
+        title="Lazy loading",
+        description="Whether the tile was registered to be loaded by the "
+        "browser when it nears the viewport",
+        required=False,
+        default=False,
+    )
+
 
 class IBasicTile(IBrowserView):
     """A tile is a publishable resource that can be inserted into a site or
@@ -111,6 +190,82 @@ class IESIRendered(Interface):
     """
 
 
+class ILazyRendered(Interface):
+    """Marker interface for tiles which may be loaded by the browser when
+    they near the viewport, instead of being rendered with the page.
+
+    Tiles providing this and having a true ``lazyLoad`` attribute render a
+    placeholder referring to their @@esi-body view, which is made available
+    on them as for ``IESIRendered`` tiles. A script loads the body of the
+    tile from there, so it no longer delays the first byte of the page.
+    """
+
+
+class IThreadSafeRendering(Interface):
+    """Marker interface for tiles which may be rendered in a worker thread,
+    concurrently with the other tiles of a layout.
+
+    See ``plone.tiles.layout.renderTiles()``. Such tiles must not depend on
+    state shared with the calling thread other than their context, request
+    and data, and must not write to the database.
+    """
+
+
+class IPartialRendering(Interface):
+    """A tile which can render the children of its <head /> and <body />
+    separately.
+
+    The @@esi-head and @@esi-body views of tiles providing this call
+    ``renderHead()`` or ``renderBody()``, instead of rendering the whole tile
+    and extracting the part they need.
+    """
+
+    def renderHead():
+        """Return the children of the <head /> of the tile"""
+
+    def renderBody():
+        """Return the children of the <body /> of the tile"""
+
+
+class ITileDataModifiedEvent(IObjectEvent):
+    """The stored data of a persistent tile has been changed.
+
+    ``object`` is the tile. The event carries what a purge handler needs to
+    drop cached responses of the tile from Varnish or a CDN.
+    """
+
+    changed = Attribute("The names of the changed fields")
+
+    surrogateKeys = Attribute(
+        "The surrogate keys of the responses of the tile, see "
+        "plone.tiles.cache.getSurrogateKeys()"
+    )
+
+    urls = Attribute(
+        "The canonical URLs of the tile, including its @@esi-body and "
+        "@@esi-head views if it is rendered through ESI"
+    )
+
+
+class ITileDataDeletedEvent(ITileDataModifiedEvent):
+    """The stored data of a persistent tile has been deleted."""
+
+
+class ITilePhaseTimedEvent(Interface):
+    """A phase of handling a tile has been timed, see ``plone.tiles.timing``.
+
+    It is only passed to the listeners added with
+    ``plone.tiles.timing.addListener()``, not sent with ``zope.event.notify()``,
+    so that timing costs nothing while there are no listeners.
+    """
+
+    object = Attribute("The tile")
+
+    phase = Attribute("The name of the phase, e.g. 'render'")
+
+    duration = Attribute("The duration of the phase in seconds")
+
+
 class ITileDataManager(Interface):
     """Support for getting and setting tile data dicts.
 
@@ -159,6 +314,19 @@ class ITileDataStorage(IMapping):
     """
 
 
+class IBatchTileDataStorage(ITileDataStorage):
+    """A tile data storage that can fetch the data of several tiles at once,
+    e.g. with a single query to an external database.
+
+    Used by ``plone.tiles.data.get_many()``.
+    """
+
+    def getMany(keys):
+        """Return a dict mapping those of the given keys that are stored to
+        their values.
+        """
+
+
 class IFieldTypeConverter(Interface):
     """Field type converter for querystring parameters for Zope."""
 
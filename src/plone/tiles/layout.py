@@ -0,0 +1,395 @@
+"""Concurrent rendering of the tiles of a layout.
+
+``renderTiles()`` renders tiles providing ``IThreadSafeRendering`` on a
+bounded pool of ``PLONE_TILES_RENDER_THREADS`` worker threads (4 by
+default, 0 disables it), while the other tiles are rendered one after
+another in the calling thread, after their ``prepare()`` coroutines were run
+concurrently by ``prepareTiles()``.
+
+Each worker renders a new instance of the tile with a clone of its request,
+with its annotations and virtual hosting settings, the site of the caller,
+and its own connection to the database, which sees the same transaction as
+the connection of the caller. Objects persisted in the database, including
+the user of the caller fetched again from its user folder, are loaded
+through that connection, so that no persistent object is shared between
+threads, and the context acquires the clone as ``REQUEST``. Changes made by
+the caller but not yet committed are not seen by the workers, so layouts
+should only be rendered concurrently when reading. Tiles are rendered in the
+calling thread if the transaction seen by the caller cannot be determined.
+"""
+
+from AccessControl.SecurityManagement import getSecurityManager
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.SpecialUsers import nobody
+from Acquisition import aq_base
+from Acquisition import aq_chain
+from Acquisition import aq_inner
+from Acquisition import aq_parent
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+from plone.tiles.interfaces import IESIRendered
+from plone.tiles.interfaces import ILazyRendered
+from plone.tiles.interfaces import IThreadSafeRendering
+from plone.tiles.tile import needsPreparing
+from plone.tiles.tile import PREPARE_TIMEOUT
+from plone.tiles.tile import renderLazyPlaceholder
+from plone.tiles.tile import runEventLoop
+from plone.tiles.tile import runPrepare
+from time import perf_counter
+from zope.annotation.interfaces import IAnnotations
+from zope.component import getMultiAdapter
+from zope.component.hooks import getSite
+from zope.component.hooks import setSite
+from zope.globalrequest import clearRequest
+from zope.globalrequest import setRequest
+from ZPublisher.BaseRequest import RequestContainer
+
+import asyncio
+import logging
+import os
+import threading
+import transaction
+
+LOGGER = logging.getLogger("plone.tiles")
+
+MAX_WORKERS = int(os.environ.get("PLONE_TILES_RENDER_THREADS", "4"))
+
+_executor = None
+_executorLock = threading.Lock()
+# the number of renderings which timed out but still keep a worker busy
+_abandoned = 0
+_local = threading.local()
+
+
+def getExecutor():
+    """Return the pool of worker threads, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executorLock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS, thread_name_prefix="plone.tiles"
+                )
+    return _executor
+
+
+def shutdownExecutor(wait=True):
+    """Shut down the pool of worker threads, if it was created. A new one
+    is created when tiles are rendered again.
+    """
+    global _executor
+    with _executorLock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def timeoutPlaceholder(tile):
+    """Return the placeholder of a tile which was not rendered in time.
+
+    Tiles with an ``@@esi-body`` view are loaded by the browser like lazily
+    loaded tiles, other tiles are left out.
+    """
+    if ILazyRendered.providedBy(tile) or IESIRendered.providedBy(tile):
+        return renderLazyPlaceholder(tile)
+    return ""
+
+
+def prepareTiles(tiles, timeout=None):
+    """Run the ``prepare()`` coroutines of the given tiles concurrently with
+    ``asyncio.gather()``, in a new event loop, see
+    ``plone.tiles.tile.runEventLoop()``.
+
+    A coroutine not done within ``timeout`` seconds, or
+    ``PLONE_TILES_PREPARE_TIMEOUT`` by default, is cancelled. Its
+    ``asyncio.TimeoutError``, or any other exception raised by a
+    coroutine, is raised again when the tile is rendered, see
+    ``plone.tiles.tile.prepareTile()``.
+    """
+    pending = [tile for tile in tiles if needsPreparing(tile)]
+    if not pending:
+        return
+    if timeout is None:
+        timeout = PREPARE_TIMEOUT
+
+    async def gather():
+        await asyncio.gather(*(prepareConcurrently(tile, timeout) for tile in pending))
+
+    runEventLoop(gather())
+
+
+async def prepareConcurrently(tile, timeout):
+    try:
+        await runPrepare(tile, timeout)
+    except Exception as exception:
+        tile._prepared = exception
+    else:
+        tile._prepared = True
+
+
+def renderTiles(tiles, timeout=None, placeholder=timeoutPlaceholder):
+    """Render the given tiles and return the list of results in their order.
+
+    Tiles providing ``IThreadSafeRendering`` are rendered by the worker
+    threads. The ``prepare()`` coroutines of the other tiles are run
+    concurrently with ``prepareTiles()``, before they are rendered in the
+    calling thread. If ``timeout`` is given, it applies to each tile: a tile
+    whose ``prepare()`` coroutine is not done within ``timeout`` seconds, or
+    which a worker has not rendered ``timeout`` seconds after starting it, is
+    replaced by ``placeholder(tile)``. So is a tile still waiting for a free
+    worker ``timeout`` seconds after the tiles before it are done. Other
+    exceptions are raised as if the tiles were rendered one after another in
+    the calling thread.
+
+    A worker keeps rendering a tile which timed out until it is done. While
+    all workers are busy with such tiles, all tiles are rendered in the
+    calling thread, and a warning is logged.
+    """
+    results = [None] * len(tiles)
+    futures = {}
+    startTimes = {}
+    # workers render nested layouts themselves, not to wait for each other
+    useWorkers = MAX_WORKERS > 0 and not getattr(_local, "worker", False)
+    if useWorkers and _abandoned >= MAX_WORKERS:
+        LOGGER.warning(
+            "All %s workers are busy with tiles which were not rendered in "
+            "time, rendering tiles in the calling thread",
+            MAX_WORKERS,
+        )
+        useWorkers = False
+    if useWorkers:
+        for index, tile in enumerate(tiles):
+            if IThreadSafeRendering.providedBy(tile):
+                task = workerTask(tile)
+                if task is not None:
+                    futures[index] = getExecutor().submit(
+                        startRender, startTimes, index, *task
+                    )
+
+    prepareTiles(
+        [tile for index, tile in enumerate(tiles) if index not in futures], timeout
+    )
+    for index, tile in enumerate(tiles):
+        if index in futures:
+            continue
+        if isinstance(tile.__dict__.get("_prepared"), asyncio.TimeoutError):
+            LOGGER.warning(
+                "Tile %s %s was not prepared within %s seconds",
+                tile.__name__,
+                tile.id,
+                timeout,
+            )
+            results[index] = placeholder(tile)
+        else:
+            results[index] = tile()
+
+    for index, future in futures.items():
+        try:
+            results[index] = waitForRender(future, startTimes, index, timeout)
+        except TimeoutError:
+            abandon(future)
+            tile = tiles[index]
+            LOGGER.warning(
+                "Tile %s %s was not rendered within %s seconds",
+                tile.__name__,
+                tile.id,
+                timeout,
+            )
+            results[index] = placeholder(tile)
+    return results
+
+
+def abandon(future):
+    """Cancel a rendering which timed out, or count it as keeping its worker
+    busy until it is done, as a thread cannot be stopped.
+    """
+    global _abandoned
+    if future.cancel():
+        return
+    with _executorLock:
+        _abandoned += 1
+    future.add_done_callback(releaseAbandoned)
+
+
+def releaseAbandoned(future):
+    global _abandoned
+    with _executorLock:
+        _abandoned -= 1
+
+
+def startRender(startTimes, index, func, *args):
+    startTimes[index] = perf_counter()
+    return func(*args)
+
+
+def waitForRender(future, startTimes, index, timeout):
+    """Return the result of ``future``, waiting at most ``timeout`` seconds
+    after its rendering was started by a worker, or after this call if no
+    worker has started it yet.
+    """
+    if timeout is None:
+        return future.result()
+    called = perf_counter()
+    while True:
+        started = startTimes.get(index)
+        since = called if started is None else started
+        try:
+            return future.result(timeout=max(0, since + timeout - perf_counter()))
+        except TimeoutError:
+            # wait again from the start of a rendering started meanwhile
+            if started is not None or index not in startTimes:
+                raise
+
+
+def workerTask(tile):
+    """Return the function and arguments rendering ``tile`` in a worker, or
+    None if its request cannot be cloned, or if the transaction seen by the
+    connection of its context is unknown.
+    """
+    request = tile.request
+    if getattr(request, "clone", None) is None:
+        return None
+    connection = getConnection(tile.context)
+    before = None
+    if connection is not None:
+        before = getSnapshot(connection)
+        if before is None:
+            return None
+
+    clone = request.clone()
+    clone.form.update(request.form)
+    copyVirtualHosting(request, clone)
+    # e.g. the data of transient tiles, see TransientTileDataManager.set()
+    annotations = IAnnotations(request, None)
+    if annotations:
+        cloneAnnotations = IAnnotations(clone)
+        for key, value in annotations.items():
+            if isinstance(value, (dict, list, set)):
+                value = value.copy()
+            cloneAnnotations[key] = value
+
+    # a user is loaded again from its user folder by the worker
+    user = getSecurityManager().getUser()
+    userId = userFolderPath = None
+    userFolder = aq_parent(aq_inner(user))
+    if getattr(aq_base(userFolder), "getUserById", None) is not None:
+        userId = user.getId()
+        userFolderPath = userFolder.getPhysicalPath()
+        user = None
+
+    return (
+        renderInWorker,
+        tile.__name__,
+        tile.id,
+        tile.context,
+        clone,
+        (userFolderPath, userId, user),
+        getSite(),
+        connection,
+        before,
+    )
+
+
+def getSnapshot(connection):
+    """Return the id of the transaction before which the database state seen
+    by ``connection`` was committed, or None if it is unknown.
+    """
+    # the start of the transaction of the connection, see ZODB.mvccadapter
+    storage = connection._storage
+    return getattr(storage, "_start", None) or getattr(storage, "_before", None)
+
+
+def getConnection(obj):
+    """Return the database connection of the first persistent object in the
+    acquisition chain of ``obj``, or None.
+    """
+    for item in aq_chain(obj):
+        connection = getattr(aq_base(item), "_p_jar", None)
+        if connection is not None:
+            return connection
+    return None
+
+
+def copyVirtualHosting(request, clone):
+    """Set the server URL and virtual root of ``request``, e.g. set by the
+    virtual host monster, on its ``clone``, so that it generates the same
+    URLs.
+    """
+    other = getattr(request, "other", None)
+    if other is None or getattr(request, "_script", None) is None:
+        return
+    for key in ("SERVER_URL", "VirtualRootPhysicalPath"):
+        if key in other:
+            clone.other[key] = other[key]
+    clone._script[:] = request._script
+    clone._resetURLS()
+
+
+def rebase(obj, connection, request):
+    """Return ``obj`` with all persistent objects of its acquisition chain
+    loaded through ``connection`` instead, unless it is None, and the
+    ``RequestContainer`` at its root holding ``request`` instead, like
+    ``Testing.makerequest`` does.
+    """
+    if obj is None:
+        return obj
+    result = None
+    for item in reversed(aq_chain(obj)):
+        item = aq_base(item)
+        if isinstance(item, RequestContainer):
+            item = RequestContainer(REQUEST=request)
+        elif connection is not None and getattr(item, "_p_jar", None) is not None:
+            item = connection.get(item._p_oid)
+        if result is not None and hasattr(item, "__of__"):
+            item = item.__of__(result)
+        result = item
+    return result
+
+
+def getUser(userFolderPath, userId, user, root):
+    """Return the user ``userId`` of the user folder at ``userFolderPath``,
+    traversed from ``root``, or ``user`` for users not from a user folder.
+    """
+    if userFolderPath is None:
+        return user
+    userFolder = root.unrestrictedTraverse(userFolderPath)
+    user = userFolder.getUserById(userId)
+    if user is None:
+        return nobody
+    if aq_parent(user) is None:
+        user = user.__of__(userFolder)
+    return user
+
+
+def renderInWorker(name, id_, context, request, user, site, connection, before):
+    """Render the tile ``name`` with the given id in a worker thread. ``user``
+    is a tuple of arguments to ``getUser()``.
+    """
+    _local.worker = True
+    workerConnection = None
+    try:
+        if connection is not None:
+            workerConnection = connection.db().open(
+                transaction_manager=transaction.TransactionManager(), before=before
+            )
+        # the caller's request must not be acquired, e.g. as context.REQUEST
+        context = rebase(context, workerConnection, request)
+        site = rebase(site, workerConnection, request)
+        setSite(site)
+        setRequest(request)
+        user = getUser(*user, site if site is not None else context)
+        newSecurityManager(request, user)
+
+        tile = getMultiAdapter((context, request), name=name)
+        if id_ is not None:
+            tile = tile[id_]
+        return tile()
+    finally:
+        noSecurityManager()
+        clearRequest()
+        setSite(None)
+        if workerConnection is not None:
+            workerConnection.transaction_manager.abort()
+            workerConnection.close()
+        _local.worker = False
@@ -0,0 +1,76 @@
+/* Load the tiles rendered as placeholders by plone.tiles, see
+ * ILazyRendered, when they near the viewport.
+ *
+ * The script may be included once for each tile on a page, it only runs
+ * once. Placeholders added to the page later can be loaded with
+ * window.ploneTilesLazy.scan(element).
+ */
+(function () {
+  "use strict";
+
+  if (window.ploneTilesLazy) {
+    return;
+  }
+
+  var SELECTOR = "._lazy_placeholder[data-tile-src]";
+
+  function load(placeholder) {
+    if (placeholder.hasAttribute("data-tile-state")) {
+      return;
+    }
+    placeholder.setAttribute("data-tile-state", "loading");
+    fetch(placeholder.getAttribute("data-tile-src"), {
+      credentials: "same-origin",
+    })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status + " " + response.statusText);
+        }
+        return response.text();
+      })
+      .then(function (body) {
+        // unlike innerHTML, runs the scripts of the tile
+        var range = document.createRange();
+        range.selectNode(placeholder);
+        placeholder.replaceWith(range.createContextualFragment(body));
+      })
+      .catch(function () {
+        placeholder.setAttribute("data-tile-state", "failed");
+      });
+  }
+
+  var observer = null;
+  if ("IntersectionObserver" in window) {
+    observer = new IntersectionObserver(
+      function (entries) {
+        entries.forEach(function (entry) {
+          if (entry.isIntersecting) {
+            observer.unobserve(entry.target);
+            load(entry.target);
+          }
+        });
+      },
+      { rootMargin: "300px 0px" }
+    );
+  }
+
+  function scan(root) {
+    (root || document).querySelectorAll(SELECTOR).forEach(function (placeholder) {
+      if (observer) {
+        observer.observe(placeholder);
+      } else {
+        load(placeholder);
+      }
+    });
+  }
+
+  window.ploneTilesLazy = { scan: scan, load: load };
+
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", function () {
+      scan();
+    });
+  } else {
+    scan();
+  }
+})();
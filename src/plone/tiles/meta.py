@@ -1,3 +1,4 @@
+from plone.tiles.interfaces import ILazyRendered
 from plone.tiles.interfaces import ITileType
 from plone.tiles.tile import Tile
 from plone.tiles.type import TileType
@@ -5,12 +6,17 @@ from Products.Five.browser.metaconfigure import page
 from zope import schema
 from zope.component.zcml import utility
 from zope.configuration.exceptions import ConfigurationError
+from zope.configuration.fields import Bool
 from zope.configuration.fields import GlobalInterface
 from zope.configuration.fields import GlobalObject
 from zope.configuration.fields import MessageID
 from zope.configuration.fields import Path
+from zope.configuration.fields import Tokens
+from zope.interface import classImplements
 from zope.interface import Interface
 from zope.publisher.interfaces.browser import IDefaultBrowserLayer
+from zope.schema import ASCIILine
+from zope.schema import Int
 from zope.security.zcml import Permission
 
 
@@ -88,6 +94,77 @@ class ITileDirective(Interface):
         required=True,
     )
 
+    render_cache_ttl = Int(
+        title="Render cache TTL",
+        description="Cache the output of this tile for anonymous users for "
+        "this many seconds",
+        required=False,
+        min=1,
+    )
+
+    render_cache_vary = Tokens(
+        title="Render cache vary",
+        description="Names of the request variables the output of this tile "
+        "depends on, e.g. LANGUAGE",
+        value_type=ASCIILine(),
+        required=False,
+    )
+
+    cache_max_age = Int(
+        title="Cache max-age",
+        description="Let browsers and proxies cache responses of this tile to "
+        "anonymous users for this many seconds",
+        required=False,
+        min=0,
+    )
+
+    cache_s_maxage = Int(
+        title="Cache s-maxage",
+        description="Let shared caches, e.g. Varnish or a CDN, cache "
+        "responses of this tile for this many seconds",
+        required=False,
+        min=0,
+    )
+
+    cache_stale_while_revalidate = Int(
+        title="Cache stale-while-revalidate",
+        description="Let caches serve stale responses for this many seconds "
+        "while they revalidate them",
+        required=False,
+        min=0,
+    )
+
+    cache_stale_if_error = Int(
+        title="Cache stale-if-error",
+        description="Let caches serve stale responses for this many seconds "
+        "if the tile cannot be rendered",
+        required=False,
+        min=0,
+    )
+
+    cache_vary = Tokens(
+        title="Cache vary",
+        description="Names of the request headers responses of this tile "
+        "vary on, e.g. Accept-Language",
+        value_type=ASCIILine(),
+        required=False,
+    )
+
+    surrogate_keys = Tokens(
+        title="Surrogate keys",
+        description="Keys sent in the Surrogate-Key header of responses of "
+        "this tile, to purge them from caches",
+        value_type=ASCIILine(),
+        required=False,
+    )
+
+    lazy_load = Bool(
+        title="Lazy loading",
+        description="Render a placeholder, which the browser replaces with "
+        "the tile when it nears the viewport",
+        required=False,
+    )
+
 
 def tile(
     _context,
@@ -104,6 +181,15 @@ def tile(
     class_=None,
     template=None,
     permission=None,
+    render_cache_ttl=None,
+    render_cache_vary=None,
+    cache_max_age=None,
+    cache_s_maxage=None,
+    cache_stale_while_revalidate=None,
+    cache_stale_if_error=None,
+    cache_vary=None,
+    surrogate_keys=None,
+    lazy_load=None,
 ):
     """Implements the <plone:tile /> directive"""
     if (
@@ -112,6 +198,14 @@ def tile(
         or icon is not None
         or add_permission is not None
         or schema is not None
+        or render_cache_ttl is not None
+        or render_cache_vary is not None
+        or cache_max_age is not None
+        or cache_s_maxage is not None
+        or cache_stale_while_revalidate is not None
+        or cache_stale_if_error is not None
+        or cache_vary is not None
+        or surrogate_keys is not None
     ):
         if title is None or add_permission is None:
             raise ConfigurationError(
@@ -128,6 +222,15 @@ def tile(
             description=description,
             icon=icon,
             schema=schema,
+            render_cache_ttl=render_cache_ttl,
+            render_cache_vary=render_cache_vary or (),
+            cache_max_age=cache_max_age,
+            cache_s_maxage=cache_s_maxage,
+            cache_stale_while_revalidate=cache_stale_while_revalidate,
+            cache_stale_if_error=cache_stale_if_error,
+            cache_vary=cache_vary or (),
+            surrogate_keys=surrogate_keys or (),
+            lazy_load=bool(lazy_load),
         )
 
         utility(_context, provides=ITileType, component=type_, name=name)
@@ -137,6 +240,7 @@ def tile(
         or layer is not None
         or class_ is not None
         or template is not None
+        or lazy_load
     ):
         if class_ is None and template is None:
             raise ConfigurationError(
@@ -151,6 +255,10 @@ def tile(
         if class_ is None:
             class_ = Tile
 
+        if lazy_load:
+            class_ = type(class_.__name__, (class_,), {"lazyLoad": True})
+            classImplements(class_, ILazyRendered)
+
         page(
             _context,
             name=name,
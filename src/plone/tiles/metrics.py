@@ -0,0 +1,297 @@
+"""Metrics of rendering, tile data and caches for each tile type.
+
+The tile base classes and data managers feed ``METRICS``, which is read by
+the ``@@tiles-metrics`` view in the Prometheus text format or as JSON.
+Metrics are kept for at most ``PLONE_TILES_METRICS_MAX_TYPES`` tile types
+(500 by default), any further types and tiles without a name are counted
+as ``_other``. Set
+``PLONE_TILES_METRICS`` to ``0`` to disable them.
+"""
+
+from Products.Five import BrowserView
+from time import perf_counter
+from ZODB.POSException import ConflictError
+
+import bisect
+import functools
+import json
+import os
+import threading
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# The name under which tile types beyond maxTypes are counted
+OTHER = "_other"
+
+CACHES = ("render", "data")
+
+
+class Histogram:
+    """Counts of observed values in buckets with fixed upper bounds"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # the last bucket holds values above all bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self):
+        """Return a list of ``(upper bound, cumulative count)`` pairs, ending
+        with ``("+Inf", count)``.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class TileTypeMetrics:
+    """The metrics of one tile type"""
+
+    __slots__ = ("renders", "errors", "seconds", "renderBytes", "dataBytes", "cache")
+
+    def __init__(self):
+        self.renders = 0
+        self.errors = 0
+        self.seconds = Histogram(SECONDS_BUCKETS)
+        self.renderBytes = Histogram(BYTES_BUCKETS)
+        self.dataBytes = Histogram(BYTES_BUCKETS)
+        # cache name -> [hits, misses]
+        self.cache = {name: [0, 0] for name in CACHES}
+
+    def asDict(self):
+        return {
+            "renders": self.renders,
+            "errors": self.errors,
+            "render_seconds": _histogramDict(self.seconds),
+            "render_bytes": _histogramDict(self.renderBytes),
+            "data_bytes": _histogramDict(self.dataBytes),
+            "cache": {
+                name: {
+                    "hits": hits,
+                    "misses": misses,
+                    "ratio": hits / (hits + misses) if hits + misses else None,
+                }
+                for name, (hits, misses) in self.cache.items()
+            },
+        }
+
+
+def _histogramDict(histogram):
+    return {
+        "buckets": {str(bound): count for bound, count in histogram.buckets()},
+        "sum": histogram.sum,
+        "count": histogram.count,
+    }
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """A thread safe registry of ``TileTypeMetrics`` by tile type name.
+
+    Its memory is bounded: metrics are kept for at most ``maxTypes`` tile
+    types, further types are counted together as ``_other``.
+    """
+
+    def __init__(self, maxTypes=500, enabled=True):
+        self.maxTypes = maxTypes
+        self.enabled = enabled
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def _metrics(self, name):
+        # call with the lock held
+        if not name:
+            # a tile not looked up by its name
+            name = OTHER
+        metrics = self._types.get(name)
+        if metrics is None:
+            if len(self._types) >= self.maxTypes:
+                name = OTHER
+                metrics = self._types.get(name)
+            if metrics is None:
+                metrics = self._types[name] = TileTypeMetrics()
+        return metrics
+
+    def observeRender(self, name, seconds, size=None, error=False):
+        """Count a rendering of a tile of type ``name``, which took
+        ``seconds`` and returned ``size`` characters or bytes, or failed.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            metrics = self._metrics(name)
+            metrics.renders += 1
+            metrics.seconds.observe(seconds)
+            if error:
+                metrics.errors += 1
+            elif size is not None:
+                metrics.renderBytes.observe(size)
+
+    def observeDataSize(self, name, size):
+        """Count the size in bytes of the data of a tile of type ``name``"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._metrics(name).dataBytes.observe(size)
+
+    def observeCache(self, name, cache, hit):
+        """Count a hit or miss of ``cache`` (``render`` or ``data``) for a
+        tile of type ``name``.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._metrics(name).cache[cache][0 if hit else 1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._types.clear()
+
+    def asDict(self):
+        """Return the metrics of all tile types as a JSON compatible dict"""
+        with self._lock:
+            return {
+                "tiles": {
+                    name: metrics.asDict()
+                    for name, metrics in sorted(self._types.items())
+                }
+            }
+
+    def prometheus(self):
+        """Return the metrics of all tile types in the Prometheus text
+        exposition format.
+        """
+        tiles = self.asDict()["tiles"]
+        lines = []
+
+        def family(name, type_, help_):
+            lines.append(f"# HELP plone_tiles_{name} {help_}")
+            lines.append(f"# TYPE plone_tiles_{name} {type_}")
+
+        family("renders_total", "counter", "Number of renderings of tiles.")
+        for tile, metrics in tiles.items():
+            lines.append(
+                f'plone_tiles_renders_total{{tile="{_label(tile)}"}} '
+                f'{metrics["renders"]}'
+            )
+        family("render_errors_total", "counter", "Number of failed renderings.")
+        for tile, metrics in tiles.items():
+            lines.append(
+                f'plone_tiles_render_errors_total{{tile="{_label(tile)}"}} '
+                f'{metrics["errors"]}'
+            )
+        for key, help_ in (
+            ("render_seconds", "Time spent rendering tiles."),
+            ("render_bytes", "Size of rendered tiles."),
+            ("data_bytes", "Size of encoded or stored tile data."),
+        ):
+            family(key, "histogram", help_)
+            for tile, metrics in tiles.items():
+                label = _label(tile)
+                histogram = metrics[key]
+                for bound, count in histogram["buckets"].items():
+                    lines.append(
+                        f'plone_tiles_{key}_bucket{{tile="{label}",le="{bound}"}} '
+                        f"{count}"
+                    )
+                lines.append(
+                    f'plone_tiles_{key}_sum{{tile="{label}"}} {histogram["sum"]}'
+                )
+                lines.append(
+                    f'plone_tiles_{key}_count{{tile="{label}"}} {histogram["count"]}'
+                )
+        family("cache_requests_total", "counter", "Lookups of tiles in the caches.")
+        for tile, metrics in tiles.items():
+            label = _label(tile)
+            for cache, counts in metrics["cache"].items():
+                for result, key in (("hit", "hits"), ("miss", "misses")):
+                    lines.append(
+                        "plone_tiles_cache_requests_total"
+                        f'{{tile="{label}",cache="{cache}",result="{result}"}} '
+                        f"{counts[key]}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry(
+    maxTypes=int(os.environ.get("PLONE_TILES_METRICS_MAX_TYPES", "500")),
+    enabled=os.environ.get("PLONE_TILES_METRICS", "1").lower()
+    not in ("0", "false", "no", "off"),
+)
+
+
+def measuredRender(func):
+    """Decorator for the ``__call__`` method of tiles, which counts the
+    renderings, failures, rendering time and size of the output in
+    ``METRICS``.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        if not METRICS.enabled:
+            return func(self, *args, **kwargs)
+        started = perf_counter()
+        try:
+            result = func(self, *args, **kwargs)
+        except ConflictError:
+            raise
+        except Exception:
+            METRICS.observeRender(self.__name__, perf_counter() - started, error=True)
+            raise
+        size = len(result) if isinstance(result, (str, bytes)) else None
+        METRICS.observeRender(self.__name__, perf_counter() - started, size)
+        return result
+
+    return __call__
+
+
+class TilesMetrics(BrowserView):
+    """Return the tile metrics in the Prometheus text format, or as JSON if
+    the ``format`` request variable is ``json`` or JSON is accepted.
+    """
+
+    def __call__(self):
+        response = self.request.response
+        response.setHeader("Cache-Control", "no-store")
+        response.setHeader("X-Theme-Disabled", "1")
+        accept = self.request.getHeader("Accept", "")
+        if self.request.form.get("format") == "json" or (
+            "application/json" in accept and "text/plain" not in accept
+        ):
+            response.setHeader("Content-Type", "application/json")
+            return json.dumps(METRICS.asDict())
+        response.setHeader("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        return METRICS.prometheus()
@@ -0,0 +1,175 @@
+"""Logging of slow tiles and profiling of single tile renderings.
+
+If ``PLONE_TILES_SLOW_THRESHOLD`` is set to a number of milliseconds, tiles
+taking longer than that to render are logged to the ``plone.tiles`` logger
+with their name, id, context path, data size and the phases timed by
+``plone.tiles.timing``.
+
+If ``PLONE_TILES_PROFILE_DIRECTORY`` is set, users with the ``View management
+screens`` permission can render a tile under ``cProfile`` by sending the
+``X-Tile-Profile`` header or the ``_tile_profile`` request variable. The
+statistics are written to a file in that directory, whose name is returned
+in the ``X-Tile-Profile`` response header.
+"""
+
+from datetime import datetime
+from plone.tiles import timing
+from plone.tiles.cache import approximateSize
+from plone.tiles.cache import getContextPath
+from time import perf_counter
+from zope.annotation.interfaces import IAnnotations
+
+import cProfile
+import functools
+import logging
+import os
+import re
+import threading
+
+try:
+    from AccessControl.security import checkPermission
+except ImportError:
+    from zope.security import checkPermission
+
+
+LOGGER = logging.getLogger("plone.tiles")
+
+# Renderings taking longer than this many seconds are logged, 0 disables it
+SLOW_THRESHOLD = float(os.environ.get("PLONE_TILES_SLOW_THRESHOLD") or 0) / 1000
+
+PROFILE_DIRECTORY = os.environ.get("PLONE_TILES_PROFILE_DIRECTORY") or None
+PROFILE_HEADER = "X-Tile-Profile"
+PROFILE_PARAMETER = "_tile_profile"
+PROFILE_PERMISSION = "zope2.ViewManagementScreens"
+
+PHASES_KEY = "plone.tiles.phases"
+ACTIVE_KEY = "plone.tiles.profiled"
+
+# Only one rendering at a time can be profiled
+_profileLock = threading.Lock()
+
+
+def recordPhases(event):
+    """Listener keeping the timed phases of each tile in the annotations of
+    the request, for the log of slow tiles.
+    """
+    annotations = IAnnotations(event.object.request, None)
+    if annotations is None:
+        return
+    phases = annotations.setdefault(PHASES_KEY, {}).setdefault(
+        (event.object.__name__, event.object.id), {}
+    )
+    phases[event.phase] = phases.get(event.phase, 0.0) + event.duration
+
+
+def profileRequested(tile):
+    """Return whether the request of ``tile`` asks for profiling and the
+    user may profile it.
+    """
+    if PROFILE_DIRECTORY is None:
+        return False
+    request = tile.request
+    if not request.getHeader(PROFILE_HEADER) and not request.form.get(
+        PROFILE_PARAMETER
+    ):
+        return False
+    return checkPermission(PROFILE_PERMISSION, tile.context)
+
+
+def profiled(tile, func, *args, **kwargs):
+    """Call ``func`` rendering ``tile`` with the given arguments, and return
+    its result.
+
+    The rendering is logged if it is slow, or profiled if requested. A tile
+    rendered again within its own rendering, e.g. by its ``@@esi-body``
+    view, is only logged or profiled once.
+    """
+    if not SLOW_THRESHOLD and PROFILE_DIRECTORY is None:
+        return func(*args, **kwargs)
+    annotations = IAnnotations(tile.request, None)
+    if annotations is None:
+        return func(*args, **kwargs)
+    active = annotations.setdefault(ACTIVE_KEY, set())
+    key = (tile.__name__, tile.id)
+    if key in active:
+        return func(*args, **kwargs)
+
+    active.add(key)
+    try:
+        if profileRequested(tile) and _profileLock.acquire(blocking=False):
+            try:
+                return profile(tile, func, *args, **kwargs)
+            finally:
+                _profileLock.release()
+        started = perf_counter()
+        result = func(*args, **kwargs)
+        duration = perf_counter() - started
+        phases = annotations.get(PHASES_KEY, {}).pop(key, {})
+        if SLOW_THRESHOLD and duration >= SLOW_THRESHOLD:
+            logSlowTile(tile, duration, phases)
+        return result
+    finally:
+        active.discard(key)
+
+
+def profiledRender(func):
+    """Decorator for the ``__call__`` method of tiles, which logs slow
+    renderings and profiles them on request, see ``profiled()``.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        return profiled(self, func, self, *args, **kwargs)
+
+    return __call__
+
+
+def logSlowTile(tile, duration, phases):
+    try:
+        size = approximateSize(dict(tile.data))
+    except Exception:
+        size = None
+    LOGGER.warning(
+        "Slow tile %s %s at %s: %.1f ms, data %s bytes, phases: %s",
+        tile.__name__,
+        tile.id,
+        getContextPath(tile.context),
+        duration * 1000,
+        size,
+        ", ".join(
+            f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in phases.items()
+        )
+        or "not timed",
+    )
+
+
+def profile(tile, func, *args, **kwargs):
+    """Call ``func`` under ``cProfile`` and write the statistics to a file in
+    ``PROFILE_DIRECTORY``.
+    """
+    profiler = cProfile.Profile()
+    # render the tile instead of returning it from the render cache
+    bypassCache = "_renderingCached" not in tile.__dict__
+    if bypassCache:
+        tile._renderingCached = True
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        if bypassCache:
+            del tile._renderingCached
+        filename = "{}-{}-{}.prof".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S%f"),
+            re.sub(r"[^\w.-]", "_", tile.__name__ or ""),
+            re.sub(r"[^\w.-]", "_", tile.id or ""),
+        )
+        os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIRECTORY, filename))
+        tile.request.response.setHeader(PROFILE_HEADER, filename)
+        LOGGER.info("Profiled tile %s %s to %s", tile.__name__, tile.id, filename)
+
+
+if SLOW_THRESHOLD:
+    timing.addListener(recordPhases)
@@ -0,0 +1,170 @@
+from BTrees.OOBTree import OOBTree
+from persistent import Persistent
+from plone.tiles.data import ANNOTATIONS_KEY_PREFIX
+from plone.tiles.data import LOGGER
+from plone.tiles.data import TileDataRecord
+from plone.tiles.interfaces import IBatchTileDataStorage
+from plone.tiles.interfaces import IPersistentTile
+from plone.tiles.interfaces import ITile
+from plone.tiles.interfaces import ITileDataStorage
+from zope.annotation.interfaces import IAnnotations
+from zope.component import adapter
+from zope.interface import implementer
+from zope.interface import Interface
+
+import transaction
+
+STORAGE_KEY = "plone.tiles.storage"
+LEGACY_KEY_PREFIX = ANNOTATIONS_KEY_PREFIX + "."
+
+_marker = object()
+
+
+@implementer(IBatchTileDataStorage)
+class BTreeTileDataStorage:
+    """Tile data storage keeping the data of all tiles of a context in one
+    ``OOBTree``, stored in a single annotation of the context.
+
+    Each tile's data is a persistent record of its own, so loading or writing
+    the data of one tile does not load or rewrite the data of the others, and
+    tile data does not bloat the annotations other add-ons read.
+
+    Data stored in the default layout, i.e. one ``plone.tiles.data.<id>``
+    annotation per tile, is still found, and is moved into the tree when it is
+    replaced. Data managers update ``TileDataRecord`` records in place,
+    though, so use ``migrate()`` to move all of it at once.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.annotations = IAnnotations(context)
+
+    def _tree(self, create=False):
+        tree = self.annotations.get(STORAGE_KEY)
+        if tree is None and create:
+            tree = self.annotations[STORAGE_KEY] = OOBTree()
+        return tree
+
+    def _legacyKeys(self):
+        for key in self.annotations.keys():
+            if key.startswith(LEGACY_KEY_PREFIX):
+                yield key[len(LEGACY_KEY_PREFIX) :]
+
+    def get(self, key, default=None):
+        tree = self._tree()
+        if tree is not None:
+            value = tree.get(key, _marker)
+            if value is not _marker:
+                return value
+        return self.annotations.get(LEGACY_KEY_PREFIX + key, default)
+
+    def getMany(self, keys):
+        tree = self._tree()
+        records = {}
+        for key in keys:
+            value = _marker
+            if tree is not None:
+                value = tree.get(key, _marker)
+            if value is _marker:
+                value = self.annotations.get(LEGACY_KEY_PREFIX + key, _marker)
+            if value is not _marker:
+                records[key] = value
+        return records
+
+    def __getitem__(self, key):
+        value = self.get(key, _marker)
+        if value is _marker:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _marker) is not _marker
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, Persistent):
+            value = TileDataRecord(value)
+        self._tree(create=True)[key] = value
+        if LEGACY_KEY_PREFIX + key in self.annotations:
+            del self.annotations[LEGACY_KEY_PREFIX + key]
+
+    def __delitem__(self, key):
+        found = False
+        tree = self._tree()
+        if tree is not None and key in tree:
+            del tree[key]
+            found = True
+        if LEGACY_KEY_PREFIX + key in self.annotations:
+            del self.annotations[LEGACY_KEY_PREFIX + key]
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def keys(self):
+        tree = self._tree()
+        keys = list(tree.keys()) if tree is not None else []
+        stored = set(keys)
+        keys.extend(key for key in self._legacyKeys() if key not in stored)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def migrate(self):
+        """Move tile data stored in the default layout into the tree. Returns
+        the number of tiles moved.
+        """
+        keys = list(self._legacyKeys())
+        for key in keys:
+            self[key] = self.annotations[LEGACY_KEY_PREFIX + key]
+        return len(keys)
+
+
+@implementer(ITileDataStorage)
+@adapter(Interface, Interface, ITile)
+def btreeTileDataStorage(context, request, tile):
+    if tile.request.get("X-Tile-Persistent"):
+        return btreePersistentTileDataStorage(context, request, tile)
+    else:
+        return IAnnotations(tile.request, tile.request.form)
+
+
+@implementer(ITileDataStorage)
+@adapter(Interface, Interface, IPersistentTile)
+def btreePersistentTileDataStorage(context, request, tile):
+    return BTreeTileDataStorage(context)
+
+
+def migrate(contexts, batch_size=100, commit=True):
+    """Move the tile data of the given contexts from the default layout into
+    ``BTreeTileDataStorage``.
+
+    The transaction is committed whenever at least ``batch_size`` tiles have
+    been moved, and once more at the end. Moved data is removed from the old
+    location, so an interrupted migration can simply be run again over the
+    same contexts: the work already committed is skipped. Pass
+    ``commit=False`` to manage the transaction yourself.
+
+    Returns the number of tiles moved.
+    """
+    total = pending = 0
+    for context in contexts:
+        moved = BTreeTileDataStorage(context).migrate()
+        total += moved
+        pending += moved
+        if commit and pending >= batch_size:
+            transaction.commit()
+            LOGGER.info("Moved data of %d tiles to BTree storage", total)
+            pending = 0
+    if commit and pending:
+        transaction.commit()
+    LOGGER.info("Moved data of %d tiles to BTree storage in total", total)
+    return total
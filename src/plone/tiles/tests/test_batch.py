@@ -0,0 +1,141 @@
+from AccessControl.SecurityManagement import noSecurityManager
+from plone.testing.zope import makeTestRequest
+from plone.tiles.batch import TilesBatch
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import ITileType
+from plone.tiles.tests.test_datamanager import Context
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import SampleTile
+from plone.tiles.tests.test_tile import ContextAbsoluteURL
+from plone.tiles.type import TileType
+from unittest import mock
+from zExceptions import BadRequest
+from zope.component import getUtility
+from zope.component import provideAdapter
+from zope.component import provideUtility
+from zope.interface import Interface
+
+import json
+
+
+class BrokenTile(SampleTile):
+
+    __name__ = "sample.broken"
+
+    def __call__(self):
+        if self.id == "k1":
+            # a bug of the tile, not a missing tile
+            raise KeyError("k1")
+        raise ValueError("broken")
+
+
+class TestTilesBatch(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        noSecurityManager()
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(ContextAbsoluteURL, name="absolute_url")
+        self.context = Context()
+
+    def batch(self, tiles, **environ):
+        request = makeTestRequest(environ)
+        request["PARENTS"] = [self.layer["app"]]
+        request.form["tiles"] = json.dumps(tiles)
+        return json.loads(TilesBatch(self.context, request)()), request
+
+    def test_render(self):
+        tile = self.tile("sample.persistenttile", "p1", context=self.context)
+        PersistentTileDataManager(tile).set({"title": "Stored"})
+
+        result, request = self.batch(
+            [
+                {"name": "sample.tile", "id": "t1", "query": "title=One"},
+                {"name": "sample.persistenttile", "id": "p1"},
+                {"name": "sample.tile", "id": "t2", "query": "?title=Two"},
+                {"name": "sample.tile", "id": "t3", "query": "title=One"},
+            ]
+        )
+        self.assertEqual(
+            [(tile["id"], tile["status"], tile["body"]) for tile in result["tiles"]],
+            [
+                ("t1", 200, "<html><body>One</body></html>"),
+                ("p1", 200, "<html><body>Stored</body></html>"),
+                ("t2", 200, "<html><body>Two</body></html>"),
+                ("t3", 200, "<html><body>One</body></html>"),
+            ],
+        )
+        self.assertEqual(
+            result["tiles"][0]["headers"]["x-tile-url"],
+            "http://example.com/context/@@sample.tile/t1?title=One",
+        )
+        self.assertEqual(
+            request.response.getHeader("Content-Type")[:16], "application/json"
+        )
+
+    def test_query_strings_are_grouped(self):
+        with mock.patch.object(
+            TilesBatch, "subrequest", autospec=True, side_effect=TilesBatch.subrequest
+        ) as subrequest:
+            self.batch(
+                [
+                    {"name": "sample.tile", "id": "t1", "query": "title=One"},
+                    {"name": "sample.persistenttile", "id": "p1"},
+                    {"name": "sample.tile", "id": "t2", "query": "title=One"},
+                ]
+            )
+        self.assertEqual(subrequest.call_count, 2)
+
+    def test_errors(self):
+        getUtility(ITileType, "sample.persistenttile").view_permission = (
+            "plone.tiles.tests.Unknown"
+        )
+        provideUtility(
+            TileType("sample.broken", "Broken", "zope.Public", "zope.Public"),
+            ITileType,
+            name="sample.broken",
+        )
+        provideAdapter(BrokenTile, (Interface, Interface), IBasicTile, "sample.broken")
+
+        with self.assertLogs("plone.tiles", "ERROR"):
+            result, request = self.batch(
+                [
+                    {"name": "sample.unknown", "id": "u1"},
+                    {"name": "sample.persistenttile", "id": "p1"},
+                    {"name": "sample.broken", "id": "b1"},
+                    {"name": "sample.broken", "id": "k1"},
+                    {"name": "sample.tile", "id": "t1", "query": "title=One"},
+                ]
+            )
+        self.assertEqual(
+            [(tile["status"], tile["body"]) for tile in result["tiles"]],
+            [
+                (404, ""),
+                (403, ""),
+                (500, ""),
+                (500, ""),
+                (200, "<html><body>One</body></html>"),
+            ],
+        )
+
+    def test_bad_request(self):
+        for tiles in (
+            {"foo": []},
+            ["sample.tile"],
+            [{"id": "t1"}],
+            [{"name": "sample.tile", "id": 1}],
+            [{"name": "sample.tile", "query": {"title": "One"}}],
+        ):
+            with self.assertRaises(BadRequest):
+                self.batch(tiles)
+
+        request = makeTestRequest()
+        request.form["tiles"] = "no json"
+        with self.assertRaises(BadRequest):
+            TilesBatch(self.context, request)()
+
+    @mock.patch("plone.tiles.batch.MAX_BATCH_SIZE", 2)
+    def test_max_batch_size(self):
+        with self.assertRaises(BadRequest):
+            self.batch([{"name": "sample.tile", "id": tid} for tid in "abc"])
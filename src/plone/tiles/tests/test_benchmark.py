@@ -0,0 +1,560 @@
+"""Benchmarks for the tile hot paths.
+
+The benchmarks are skipped by default. Run them with::
+
+    PLONE_TILES_BENCHMARK=1 zope-testrunner --test-path=src -t test_benchmark
+
+The results are written as JSON to the file named by
+``PLONE_TILES_BENCHMARK_OUTPUT`` (default: ``benchmark-results.json`` in the
+current directory) and compared against ``benchmark-baseline.json`` next to
+this module. A case that is slower than its baseline by more than a factor of
+``PLONE_TILES_BENCHMARK_TOLERANCE`` (default: 2.0) fails the test run,
+unless it is within the tolerance when it is timed again, up to ``RETRIES``
+times.
+Set ``PLONE_TILES_BENCHMARK_UPDATE=1`` to store the results as the new
+baseline instead.
+
+Timings are normalized against a fixed pure Python calibration loop, so that
+a baseline recorded on one machine remains meaningful on another one. Each
+case is timed ``REPEAT`` times for about 50 ms, in turns with the calibration
+loop, and the fastest times are kept, which are the least disturbed by other
+processes.
+"""
+
+from pathlib import Path
+from plone.testing import zca
+from plone.tiles import PersistentTile
+from plone.tiles import Tile
+from plone.tiles import timing
+from plone.tiles.absoluteurl import TransientTileAbsoluteURL
+from plone.tiles.data import decode
+from plone.tiles.data import encode
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.data import TransientTileDataManager
+from plone.tiles.esi import ESIBody
+from plone.tiles.esi import ESIHead
+from plone.tiles.esi import ESITile
+from plone.tiles.esi import substituteESILinks
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.interfaces import ITileType
+from plone.tiles.testing import PLONE_TILES_INTEGRATION_TESTING
+from plone.tiles.type import TileType
+from zope import schema
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.component import adapter
+from zope.component import getMultiAdapter
+from zope.component import provideAdapter
+from zope.component import provideUtility
+from zope.interface import implementer
+from zope.interface import Interface
+from zope.publisher.browser import TestRequest
+from zope.publisher.interfaces.http import IHTTPRequest
+from zope.traversing.browser.interfaces import IAbsoluteURL
+
+import json
+import os
+import platform
+import timeit
+import unittest
+
+BASELINE = Path(__file__).parent / "benchmark-baseline.json"
+REPEAT = 20
+RETRIES = 2
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a benchmark case.
+
+    The decorated function is called once with the ``BenchmarkFixture`` and
+    must return a callable without arguments, which is then timed.
+    """
+
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+
+    return register
+
+
+# Schemas
+
+
+class ISmall(Interface):
+
+    title = schema.TextLine(title="Title")
+    count = schema.Int(title="Count")
+    css_class = schema.ASCIILine(title="CSS class")
+
+
+IWide = type(ISmall)(
+    "IWide",
+    (Interface,),
+    {
+        **{f"text_{i}": schema.TextLine(title=f"Text {i}") for i in range(20)},
+        **{f"int_{i}": schema.Int(title=f"Int {i}") for i in range(10)},
+        **{f"bool_{i}": schema.Bool(title=f"Bool {i}") for i in range(5)},
+        **{
+            f"list_{i}": schema.List(title=f"List {i}", value_type=schema.TextLine())
+            for i in range(5)
+        },
+    },
+)
+
+
+class INested(Interface):
+
+    query = schema.List(
+        title="Search terms",
+        value_type=schema.Dict(value_type=schema.Field(), key_type=schema.TextLine()),
+        required=False,
+    )
+
+    lines = schema.List(title="Strings", value_type=schema.TextLine(), required=False)
+
+    title = schema.TextLine(title="Title")
+
+
+SMALL_DATA = {"title": "Hällo World", "count": 5, "css_class": "foo"}
+WIDE_DATA = {
+    **{f"text_{i}": f"Text number {i}" for i in range(20)},
+    **{f"int_{i}": i for i in range(10)},
+    **{f"bool_{i}": bool(i % 2) for i in range(5)},
+    **{f"list_{i}": ["a", "b", "ö"] for i in range(5)},
+}
+NESTED_DATA = {
+    "query": [
+        {
+            "i": "Subject",
+            "o": "plone.app.querystring.operation.selection.any",
+            "v": ["äüö", "foo"],
+        },
+        {
+            "i": "portal_type",
+            "o": "plone.app.querystring.operation.selection.any",
+            "v": ["Document", "News Item"],
+        },
+    ],
+    "lines": ["one", "two", "three"],
+    "title": "Hello World",
+}
+
+
+# Components
+
+
+class IContext(Interface):
+    pass
+
+
+@implementer(IContext, IAttributeAnnotatable)
+class Context:
+    pass
+
+
+@implementer(IAttributeAnnotatable)
+class Request(TestRequest):
+    pass
+
+
+@implementer(IAbsoluteURL)
+@adapter(IContext, IHTTPRequest)
+class ContextAbsoluteURL:
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def __str__(self):
+        return "http://example.com/context"
+
+    __call__ = __str__
+
+    def breadcrumbs(self):
+        return ({"name": "context", "url": "http://example.com/context"},)
+
+
+class BenchmarkTile(Tile):
+    def __call__(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class BenchmarkTemplateTile(Tile):
+    def index(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class BenchmarkPersistentTile(PersistentTile):
+    def __call__(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+LARGE_HEAD = "".join(
+    f'<link rel="stylesheet" href="http://example.com/style-{i}.css" />'
+    for i in range(500)
+)
+LARGE_BODY = "".join(
+    f'<li class="item"><a href="http://example.com/item-{i}">Item {i}</a></li>'
+    for i in range(5000)
+)
+LARGE_DOCUMENT = (
+    f"<html><head>{LARGE_HEAD}</head><body><ul>{LARGE_BODY}</ul></body></html>"
+)
+
+# A page of about 4MB with 5000 ESI placeholder links
+ESI_PAGE = "<html><head></head><body><ul>{}</ul></body></html>".format(
+    "".join(
+        f'<li class="item"><a href="http://example.com/item-{i}">Item {i}</a></li>'
+        + (
+            '<a class="_esi_placeholder" rel="esi" href="http://example.com/page'
+            f'/@@bench.tile/t{i}/@@esi-body?title=Tile+{i}"></a>'
+            if i % 10 == 0
+            else ""
+        )
+        for i in range(50000)
+    )
+)
+
+
+class BenchmarkESITile(ESITile):
+    def render(self):
+        return LARGE_DOCUMENT
+
+
+class BenchmarkFixture:
+    """Registers the tiles used by the benchmark cases"""
+
+    def __init__(self):
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(ContextAbsoluteURL, name="absolute_url")
+        for name, class_, schema_ in (
+            ("bench.transient", BenchmarkTile, ISmall),
+            ("bench.template", BenchmarkTemplateTile, ISmall),
+            ("bench.persistent", BenchmarkPersistentTile, ISmall),
+            ("bench.wide", BenchmarkTile, IWide),
+            ("bench.esi", BenchmarkESITile, None),
+        ):
+            type_ = TileType(name, name, "zope.Public", "zope.Public", schema=schema_)
+            provideUtility(type_, ITileType, name=name)
+            provideAdapter(
+                type(class_.__name__, (class_,), {"__name__": name}),
+                (Interface, Interface),
+                IBasicTile,
+                name=name,
+            )
+
+    def request(self, **form):
+        return Request(form=form)
+
+    def tile(self, name, id_="tile1", context=None, request=None, **form):
+        if context is None:
+            context = Context()
+        if request is None:
+            request = self.request(**form)
+        tile = getMultiAdapter((context, request), name=name)
+        tile.id = id_
+        return tile
+
+
+# Cases
+
+
+@benchmark("data.encode.small")
+def encode_small(fixture):
+    return lambda: encode(SMALL_DATA, ISmall)
+
+
+@benchmark("data.encode.wide")
+def encode_wide(fixture):
+    return lambda: encode(WIDE_DATA, IWide)
+
+
+@benchmark("data.encode.nested")
+def encode_nested(fixture):
+    return lambda: encode(NESTED_DATA, INested)
+
+
+@benchmark("data.decode.small")
+def decode_small(fixture):
+    return lambda: decode(SMALL_DATA, ISmall)
+
+
+@benchmark("data.decode.wide")
+def decode_wide(fixture):
+    return lambda: decode(WIDE_DATA, IWide)
+
+
+@benchmark("data.decode.nested")
+def decode_nested(fixture):
+    return lambda: decode(NESTED_DATA, INested)
+
+
+@benchmark("manager.transient.get")
+def transient_get(fixture):
+    tile = fixture.tile("bench.transient", **SMALL_DATA)
+    return lambda: TransientTileDataManager(tile).get()
+
+
+@benchmark("manager.transient.lookup")
+def transient_lookup(fixture):
+    tile = fixture.tile("bench.transient", **SMALL_DATA)
+    return lambda: ITileDataManager(tile).get()
+
+
+@benchmark("manager.persistent.get")
+def persistent_get(fixture):
+    tile = fixture.tile("bench.persistent")
+    PersistentTileDataManager(tile).set(SMALL_DATA)
+    return lambda: PersistentTileDataManager(tile).get()
+
+
+@benchmark("manager.persistent.set")
+def persistent_set(fixture):
+    tile = fixture.tile("bench.persistent")
+    return lambda: PersistentTileDataManager(tile).set(SMALL_DATA)
+
+
+@benchmark("manager.wide.get")
+def wide_get(fixture):
+    tile = fixture.tile("bench.wide", **WIDE_DATA)
+
+    def get():
+        data = TransientTileDataManager(tile).get()
+        return data["text_0"], data["int_0"]
+
+    return get
+
+
+@benchmark("manager.wide.get_lazy")
+def wide_get_lazy(fixture):
+    tile = fixture.tile("bench.wide", **WIDE_DATA)
+
+    def get():
+        data = TransientTileDataManager(tile).get_lazy()
+        return data["text_0"], data["int_0"]
+
+    return get
+
+
+@benchmark("url.transient")
+def transient_url(fixture):
+    tile = fixture.tile("bench.transient", **SMALL_DATA)
+    return lambda: str(TransientTileAbsoluteURL(tile, tile.request))
+
+
+@benchmark("tile.traverse")
+def tile_traverse(fixture):
+    context = Context()
+    request = fixture.request(**SMALL_DATA)
+
+    def traverse():
+        tile = getMultiAdapter((context, request), name="bench.transient")
+        return tile["tile1"]
+
+    return traverse
+
+
+@benchmark("tile.render")
+def tile_render(fixture):
+    tile = fixture.tile("bench.template", **SMALL_DATA)
+    return tile
+
+
+@benchmark("timing.disabled")
+def timing_disabled(fixture):
+    # the cost of one timed phase without listeners
+    return lambda: timing.stop(None, timing.RENDER, timing.start())
+
+
+@benchmark("tile.render.timed")
+def tile_render_timed(fixture):
+    tile = fixture.tile("bench.template", **SMALL_DATA)
+    events = []
+
+    def render():
+        timing.addListener(events.append)
+        try:
+            return tile()
+        finally:
+            timing.removeListener(events.append)
+            del events[:]
+
+    return render
+
+
+@benchmark("esi.head")
+def esi_head(fixture):
+    tile = fixture.tile("bench.esi")
+    return lambda: ESIHead(tile, tile.request)()
+
+
+@benchmark("esi.body")
+def esi_body(fixture):
+    tile = fixture.tile("bench.esi")
+    return lambda: ESIBody(tile, tile.request)()
+
+
+@benchmark("esi.substitute.str")
+def esi_substitute_str(fixture):
+    return lambda: substituteESILinks(ESI_PAGE)
+
+
+@benchmark("esi.substitute.bytes")
+def esi_substitute_bytes(fixture):
+    page = ESI_PAGE.encode()
+    return lambda: substituteESILinks(page)
+
+
+@benchmark("esi.substitute.chunks")
+def esi_substitute_chunks(fixture):
+    chunks = [ESI_PAGE[i : i + 8192] for i in range(0, len(ESI_PAGE), 8192)]
+    return lambda: "".join(substituteESILinks(chunks))
+
+
+# Runner
+
+
+def workload():
+    """A fixed pure Python workload used to normalize results"""
+    total = 0
+    for i in range(1000):
+        total += i * i
+    return {str(i): total for i in range(100)}
+
+
+def number(timer):
+    """Return the number of calls timed in about 50 ms"""
+    # autorange() times at least 0.2 seconds
+    return max(timer.autorange()[0] // 4, 1)
+
+
+def time(func):
+    """Return the best time per call of ``func`` and of the calibration
+    workload in seconds, and the number of calls per repetition of ``func``.
+
+    Both are timed in turns, so that they are equally slowed down by other
+    processes at any one time.
+    """
+    timer = timeit.Timer(func)
+    calibration = timeit.Timer(workload)
+    calls = number(timer)
+    calibrationCalls = number(calibration)
+    times = []
+    calibrationTimes = []
+    for repeat in range(REPEAT):
+        calibrationTimes.append(calibration.timeit(calibrationCalls))
+        times.append(timer.timeit(calls))
+    return min(times) / calls, min(calibrationTimes) / calibrationCalls, calls
+
+
+def run(names=None):
+    """Run the registered benchmarks and return the results as a dict"""
+    fixture = BenchmarkFixture()
+    results = {}
+    for name, factory in BENCHMARKS:
+        if names and name not in names:
+            continue
+        seconds, calibration, calls = time(factory(fixture))
+        results[name] = {
+            "seconds": seconds,
+            "calibration": calibration,
+            "normalized": seconds / calibration,
+            "number": calls,
+            "repeat": REPEAT,
+        }
+    return {
+        "python": platform.python_version(),
+        "results": results,
+    }
+
+
+def regressed(current, baseline, tolerance):
+    """Return the names of the cases of ``current`` slower than ``baseline``
+    by more than a factor of ``tolerance``.
+    """
+    names = []
+    for name, result in sorted(current["results"].items()):
+        expected = baseline.get("results", {}).get(name)
+        if expected is None:
+            continue
+        if result["normalized"] / expected["normalized"] > tolerance:
+            names.append(name)
+    return names
+
+
+def compare(current, baseline, tolerance):
+    """Return a list of human readable regressions of ``current`` against
+    ``baseline``.
+    """
+    regressions = []
+    for name in regressed(current, baseline, tolerance):
+        result = current["results"][name]["normalized"]
+        expected = baseline["results"][name]["normalized"]
+        regressions.append(
+            f"{name}: {result / expected:.2f}x slower than baseline "
+            f"({result:.2f} vs. {expected:.2f})"
+        )
+    return regressions
+
+
+def retime(current, names):
+    """Time the named cases of ``current`` again, keeping the faster result"""
+    again = run(names)
+    for name, result in again["results"].items():
+        if result["normalized"] < current["results"][name]["normalized"]:
+            current["results"][name] = result
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_compare(self):
+        baseline = {"results": {"a": {"normalized": 1.0}, "b": {"normalized": 2.0}}}
+        current = {
+            "results": {
+                "a": {"normalized": 1.4},
+                "b": {"normalized": 5.0},
+                "c": {"normalized": 9.0},
+            }
+        }
+        self.assertEqual(
+            compare(current, baseline, 2.0),
+            ["b: 2.50x slower than baseline (5.00 vs. 2.00)"],
+        )
+
+
+@unittest.skipUnless(
+    os.environ.get("PLONE_TILES_BENCHMARK"), "Set PLONE_TILES_BENCHMARK=1 to run"
+)
+class TestBenchmarks(unittest.TestCase):
+
+    layer = PLONE_TILES_INTEGRATION_TESTING
+
+    def setUp(self):
+        zca.pushGlobalRegistry()
+
+    def tearDown(self):
+        zca.popGlobalRegistry()
+
+    def test_benchmarks(self):
+        current = run()
+
+        output = Path(
+            os.environ.get("PLONE_TILES_BENCHMARK_OUTPUT", "benchmark-results.json")
+        )
+        if os.environ.get("PLONE_TILES_BENCHMARK_UPDATE"):
+            output.write_text(json.dumps(current, indent=2, sort_keys=True))
+            BASELINE.write_text(json.dumps(current, indent=2, sort_keys=True) + "\n")
+            return
+
+        tolerance = float(os.environ.get("PLONE_TILES_BENCHMARK_TOLERANCE", "2.0"))
+        baseline = json.loads(BASELINE.read_text())
+        for retry in range(RETRIES):
+            names = regressed(current, baseline, tolerance)
+            if not names:
+                break
+            retime(current, names)
+        output.write_text(json.dumps(current, indent=2, sort_keys=True))
+        regressions = compare(current, baseline, tolerance)
+        if regressions:
+            self.fail("Benchmark regressions:\n" + "\n".join(regressions))
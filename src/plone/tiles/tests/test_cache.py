@@ -0,0 +1,160 @@
+from plone.tiles.cache import approximateSize
+from plone.tiles.cache import DATA_CACHE
+from plone.tiles.cache import LRUCache
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_storage import PersistentContext
+from unittest import mock
+from ZODB.DB import DB
+from ZODB.MappingStorage import MappingStorage
+
+import transaction
+import unittest
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_disabled(self):
+        cache = LRUCache()
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_max_entries(self):
+        cache = LRUCache(maxEntries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(
+            cache.stats(),
+            {
+                "entries": 2,
+                "bytes": cache.bytes,
+                "maxEntries": 2,
+                "maxBytes": 0,
+                "hits": 3,
+                "misses": 1,
+                "evictions": 1,
+            },
+        )
+
+    def test_max_bytes(self):
+        cache = LRUCache(maxEntries=10, maxBytes=100)
+        cache.set("a", "a", size=40)
+        cache.set("b", "b", size=40)
+        cache.set("c", "c", size=40)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.bytes, 80)
+        self.assertIsNone(cache.get("a"))
+        # too large to be cached at all
+        cache.set("d", "d", size=101)
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_invalidate(self):
+        cache = LRUCache(maxEntries=10)
+        cache.set("a", "a", size=40)
+        cache.invalidate("a")
+        cache.invalidate("b")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.bytes, 0)
+
+    def test_ttl(self):
+        cache = LRUCache(maxEntries=10)
+        with mock.patch("time.monotonic", return_value=100.0):
+            cache.set("a", "a", ttl=10)
+            cache.set("b", "b")
+        with mock.patch("time.monotonic", return_value=109.0):
+            self.assertEqual(cache.get("a"), "a")
+        with mock.patch("time.monotonic", return_value=110.0):
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), "b")
+        self.assertEqual(len(cache), 1)
+
+    def test_tags(self):
+        cache = LRUCache(maxEntries=2)
+        cache.set("a", "a", tags=("page", ("page", "tile1")))
+        cache.set("b", "b", tags=("page", ("page", "tile2")))
+        cache.invalidateTags([("page", "tile1")])
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "b")
+        cache.invalidateTags(["page", "other"])
+        self.assertEqual(len(cache), 0)
+
+        # evicted entries are dropped from the tags
+        cache.set("a", "a", tags=("page",))
+        cache.set("b", "b")
+        cache.set("c", "c")
+        self.assertEqual(cache._tags, {})
+
+    def test_approximate_size(self):
+        small = approximateSize({"title": "Hello"})
+        self.assertGreater(approximateSize({"title": "Hello" * 1000}), small + 4000)
+        self.assertGreater(approximateSize({"tags": ["Hello" * 1000]}), small + 4000)
+
+
+class TestDataCache(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(DATA_CACHE, "maxEntries", 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DATA_CACHE.clear)
+        DATA_CACHE.clear()
+
+        self.db = DB(MappingStorage())
+        tm, conn = self.open()
+        context = conn.root()["context"] = PersistentContext()
+        self.manager(context).set({"title": "Hello"})
+        tm.commit()
+
+    def tearDown(self):
+        transaction.abort()
+        self.db.close()
+        super().tearDown()
+
+    def open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        self.addCleanup(conn.close)
+        return tm, conn
+
+    def manager(self, context=None, **form):
+        if context is None:
+            tm, conn = self.open()
+            context = conn.root()["context"]
+        tile = self.tile("sample.persistenttile", context=context, **form)
+        return PersistentTileDataManager(tile)
+
+    def test_decoded_once(self):
+        self.assertEqual(self.manager().get(), {"title": "Hello", "count": None})
+        with mock.patch.object(PersistentTileDataManager, "_decode") as decode:
+            self.assertEqual(self.manager().get(), {"title": "Hello", "count": None})
+        decode.assert_not_called()
+        self.assertEqual(len(DATA_CACHE), 1)
+
+    def test_not_stale_after_commit(self):
+        self.assertEqual(self.manager().get()["title"], "Hello")
+        tm, conn = self.open()
+        self.manager(conn.root()["context"]).set({"title": "Changed"})
+        # changed in this transaction
+        self.assertEqual(self.manager(conn.root()["context"]).get()["title"], "Changed")
+        self.assertEqual(len(DATA_CACHE), 1)
+        tm.commit()
+        self.assertEqual(self.manager().get()["title"], "Changed")
+        self.assertEqual(len(DATA_CACHE), 2)
+
+    def test_request_data_not_cached(self):
+        self.assertEqual(self.manager(count="1").get()["count"], 1)
+        self.assertEqual(len(DATA_CACHE), 0)
+        self.assertIsNone(self.manager().get()["count"])
+        self.assertEqual(len(DATA_CACHE), 1)
+        # stored values override the request
+        hits = DATA_CACHE.hits
+        self.assertEqual(self.manager(title="Form").get()["title"], "Hello")
+        self.assertEqual(DATA_CACHE.hits, hits + 1)
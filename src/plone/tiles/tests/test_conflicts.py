@@ -0,0 +1,143 @@
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.data import TileDataRecord
+from plone.tiles.storage import btreePersistentTileDataStorage
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_storage import PersistentContext
+from ZODB.DB import DB
+from ZODB.FileStorage import FileStorage
+from ZODB.POSException import ConflictError
+from zope.annotation.interfaces import IAnnotations
+from zope.component import provideAdapter
+
+import os
+import shutil
+import tempfile
+import transaction
+import unittest
+
+
+class TestResolveConflict(unittest.TestCase):
+
+    def resolve(self, old, saved, new):
+        return TileDataRecord()._p_resolveConflict(
+            {"data": old}, {"data": saved}, {"data": new}
+        )["data"]
+
+    def test_different_fields(self):
+        self.assertEqual(
+            self.resolve(
+                {"title": "Old", "count": 1, "tags": ["a"]},
+                {"title": "Saved", "count": 1, "tags": ["a"]},
+                {"title": "Old", "count": 2},
+            ),
+            {"title": "Saved", "count": 2},
+        )
+
+    def test_added_fields(self):
+        self.assertEqual(
+            self.resolve({}, {"title": "Saved"}, {"count": 2}),
+            {"title": "Saved", "count": 2},
+        )
+
+    def test_same_change(self):
+        self.assertEqual(
+            self.resolve({"title": "Old"}, {"title": "New"}, {"title": "New"}),
+            {"title": "New"},
+        )
+
+    def test_same_field(self):
+        with self.assertRaises(ConflictError):
+            self.resolve({"title": "Old"}, {"title": "Saved"}, {"title": "New"})
+        with self.assertRaises(ConflictError):
+            self.resolve({"title": "Old"}, {}, {"title": "New"})
+        with self.assertRaises(ConflictError):
+            self.resolve({"count": 1}, {"count": True}, {"count": 2})
+
+
+class TestConcurrentTransactions(DataManagerTestCase):
+    """Concurrent transactions are simulated with two connections to a
+    FileStorage (MappingStorage does not resolve conflicts).
+    """
+
+    storageAdapters = ()
+
+    def setUp(self):
+        super().setUp()
+        for factory in self.storageAdapters:
+            provideAdapter(factory)
+        self.tempdir = tempfile.mkdtemp()
+        self.db = DB(FileStorage(os.path.join(self.tempdir, "Data.fs")))
+
+        tm, conn = self.open()
+        context = conn.root()["context"] = PersistentContext()
+        IAnnotations(context)["other"] = "data"
+        self.set(context, "tile1", {"title": "Tile 1", "count": 1})
+        tm.commit()
+        conn.close()
+
+    def tearDown(self):
+        transaction.abort()
+        self.db.close()
+        shutil.rmtree(self.tempdir)
+        super().tearDown()
+
+    def open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        return tm, conn
+
+    def set(self, context, id_, data):
+        tile = self.tile("sample.persistenttile", id_=id_, context=context)
+        manager = PersistentTileDataManager(tile)
+        manager.set(dict(manager.get(), **data))
+
+    def get(self, id_):
+        tm, conn = self.open()
+        tile = self.tile(
+            "sample.persistenttile", id_=id_, context=conn.root()["context"]
+        )
+        data = PersistentTileDataManager(tile).get()
+        conn.close()
+        return data
+
+    def concurrently(self, first, second):
+        tm1, conn1 = self.open()
+        tm2, conn2 = self.open()
+        first(conn1.root()["context"])
+        second(conn2.root()["context"])
+        tm1.commit()
+        try:
+            tm2.commit()
+        finally:
+            tm2.abort()
+            conn1.close()
+            conn2.close()
+
+    def test_different_fields_of_one_tile(self):
+        self.concurrently(
+            lambda context: self.set(context, "tile1", {"title": "Changed"}),
+            lambda context: self.set(context, "tile1", {"count": 2}),
+        )
+        self.assertEqual(self.get("tile1"), {"title": "Changed", "count": 2})
+
+    def test_same_field_of_one_tile(self):
+        with self.assertRaises(ConflictError):
+            self.concurrently(
+                lambda context: self.set(context, "tile1", {"title": "First"}),
+                lambda context: self.set(context, "tile1", {"title": "Second"}),
+            )
+        self.assertEqual(self.get("tile1"), {"title": "First", "count": 1})
+
+    def test_new_tiles(self):
+        self.concurrently(
+            lambda context: self.set(context, "tile2", {"title": "Tile 2"}),
+            lambda context: self.set(context, "tile3", {"title": "Tile 3"}),
+        )
+        self.assertEqual(self.get("tile2")["title"], "Tile 2")
+        self.assertEqual(self.get("tile3")["title"], "Tile 3")
+        self.assertEqual(self.get("tile1")["title"], "Tile 1")
+
+
+class TestConcurrentTransactionsBTreeStorage(TestConcurrentTransactions):
+
+    storageAdapters = (btreePersistentTileDataStorage,)
@@ -1,10 +1,16 @@
+from decimal import Decimal
 from plone.rfc822.interfaces import IPrimaryField
 from plone.tiles.data import decode
 from plone.tiles.data import encode
+from plone.tiles.data import getCodecPlan
+from plone.tiles.fieldtypeconverters import NoConverter
 from plone.tiles.testing import PLONE_TILES_INTEGRATION_TESTING
 from zope import schema
+from zope.component import getGlobalSiteManager
 from zope.interface import alsoProvides
 from zope.interface import Interface
+from zope.interface.interfaces import ComponentLookupError
+from zope.schema.interfaces import IDecimal
 
 import unittest
 
@@ -35,6 +41,11 @@ class IPrimary(Interface):
 alsoProvides(IPrimary["words"], IPrimaryField)
 
 
+class IAmount(Interface):
+
+    amount = schema.Decimal(title="Amount")
+
+
 class TestEncode(unittest.TestCase):
 
     layer = PLONE_TILES_INTEGRATION_TESTING
@@ -81,3 +92,41 @@ class TestDecode(unittest.TestCase):
     def test_skip_decoding_primary_fields(self):
         data = {"words": ["ä", "ö"]}
         self.assertEqual(decode(data, schema=IPrimary), {})
+
+
+class TestCodecPlan(unittest.TestCase):
+
+    layer = PLONE_TILES_INTEGRATION_TESTING
+
+    def test_plan_is_reused(self):
+        self.assertIs(getCodecPlan(IQuerySchema), getCodecPlan(IQuerySchema))
+
+    def test_plan_field_order(self):
+        plan = getCodecPlan(IQuerySchema)
+        self.assertEqual([p.name for p in plan.encoders], ["query", "lines", "title"])
+        self.assertEqual(
+            sorted(name for name, missing_value in plan.missing),
+            ["lines", "query", "title"],
+        )
+
+    def test_plan_skips_primary_fields_for_encoding(self):
+        plan = getCodecPlan(IPrimary)
+        self.assertEqual(plan.encoders, ())
+        self.assertTrue(plan.decoders[0].primary)
+
+    def test_plan_invalidated_on_registry_change(self):
+        data = {"amount": Decimal(2)}
+        with self.assertRaises(ComponentLookupError):
+            encode(data, IAmount)
+        plan = getCodecPlan(IAmount)
+
+        sm = getGlobalSiteManager()
+        sm.registerAdapter(NoConverter, (IDecimal,))
+        try:
+            self.assertIsNot(plan, getCodecPlan(IAmount))
+            self.assertEqual(encode(data, IAmount), "amount=2")
+        finally:
+            sm.unregisterAdapter(NoConverter, (IDecimal,))
+
+        with self.assertRaises(ComponentLookupError):
+            encode(data, IAmount)
@@ -0,0 +1,446 @@
+from plone.testing import zca
+from plone.tiles import PersistentTile
+from plone.tiles import Tile
+from plone.tiles.data import BaseTileDataManager
+from plone.tiles.data import decode
+from plone.tiles.data import get_many
+from plone.tiles.data import LazyTileData
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.data import resolveTileData
+from plone.tiles.data import TransientTileDataManager
+from plone.tiles.directives import ignore_querystring
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.interfaces import ITileType
+from plone.tiles.testing import PLONE_TILES_INTEGRATION_TESTING
+from plone.tiles.type import TileType
+from unittest import mock
+from zope import schema
+from zope.annotation.interfaces import IAnnotations
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.component import getMultiAdapter
+from zope.component import provideAdapter
+from zope.component import provideUtility
+from zope.interface import implementer
+from zope.interface import Interface
+from zope.publisher.browser import TestRequest
+
+import unittest
+
+
+class ISampleData(Interface):
+
+    title = schema.TextLine(title="Title")
+    count = schema.Int(title="Count")
+
+
+class IFilteredData(ISampleData):
+
+    ignore_querystring("count")
+
+
+@implementer(IAttributeAnnotatable)
+class Context:
+    pass
+
+
+@implementer(IAttributeAnnotatable)
+class Request(TestRequest):
+    pass
+
+
+class SampleTile(Tile):
+
+    __name__ = "sample.tile"
+
+    def __call__(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class SamplePersistentTile(PersistentTile):
+
+    __name__ = "sample.persistenttile"
+
+    def __call__(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class DataManagerTestCase(unittest.TestCase):
+
+    layer = PLONE_TILES_INTEGRATION_TESTING
+
+    def setUp(self):
+        zca.pushGlobalRegistry()
+        for name, class_ in (
+            ("sample.tile", SampleTile),
+            ("sample.persistenttile", SamplePersistentTile),
+        ):
+            provideUtility(
+                TileType(name, name, "zope.Public", "zope.Public", schema=ISampleData),
+                ITileType,
+                name=name,
+            )
+            provideAdapter(class_, (Interface, Interface), IBasicTile, name=name)
+
+    def tearDown(self):
+        zca.popGlobalRegistry()
+
+    def tile(self, name, id_="tile1", context=None, request=None, **form):
+        if context is None:
+            context = Context()
+        if request is None:
+            request = Request(form=form)
+        tile = getMultiAdapter((context, request), name=name)
+        tile.id = id_
+        return tile
+
+
+class TestRequestManagerCache(DataManagerTestCase):
+
+    def test_manager_reused_within_request(self):
+        tile = self.tile("sample.tile", title="Hello")
+        other = getMultiAdapter((tile.context, tile.request), name="sample.tile")
+        other.id = tile.id
+        self.assertIs(ITileDataManager(tile), ITileDataManager(other))
+
+    def test_manager_not_reused_across_ids_and_contexts(self):
+        tile = self.tile("sample.tile", title="Hello")
+        other = self.tile("sample.tile", "tile2", tile.context, tile.request)
+        self.assertIsNot(ITileDataManager(tile), ITileDataManager(other))
+        other = self.tile("sample.tile", "tile1", Context(), tile.request)
+        self.assertIsNot(ITileDataManager(tile), ITileDataManager(other))
+
+    def test_manager_not_reused_across_requests(self):
+        tile = self.tile("sample.tile", title="Hello")
+        other = self.tile("sample.tile", context=tile.context, title="Hello")
+        self.assertIsNot(ITileDataManager(tile), ITileDataManager(other))
+
+    def test_data_decoded_once(self):
+        tile = self.tile("sample.tile", title="Hello", count="1")
+        manager = ITileDataManager(tile)
+        with mock.patch.object(
+            TransientTileDataManager,
+            "get_default_request_data",
+            autospec=True,
+            side_effect=TransientTileDataManager.get_default_request_data,
+        ) as decoder:
+            data = manager.get()
+            self.assertEqual(data, ITileDataManager(tile).get())
+            self.assertEqual(decoder.call_count, 1)
+        self.assertEqual(data, {"title": "Hello", "count": 1})
+
+    def test_undecodable_form(self):
+        tile = self.tile("sample.tile", title="Hello", count="many")
+        manager = ITileDataManager(tile)
+        with mock.patch("plone.tiles.data.LOGGER") as logger:
+            self.assertEqual(manager.get_default_request_data(), {})
+        logger.exception.assert_called_once()
+
+    def test_get_returns_copy(self):
+        tile = self.tile("sample.tile", title="Hello")
+        ITileDataManager(tile).get()["title"] = "Changed"
+        self.assertEqual(ITileDataManager(tile).get()["title"], "Hello")
+
+    def test_get_copies_mutable_values(self):
+        tile = self.tile("sample.persistenttile")
+        ITileDataManager(tile).set({"tags": ["a"], "meta": {"b": [1]}})
+        data = ITileDataManager(tile).get()
+        data["tags"].append("MUTATED")
+        data["meta"]["b"].append(2)
+        data = ITileDataManager(tile).get()
+        self.assertEqual((data["tags"], data["meta"]), (["a"], {"b": [1]}))
+
+    def test_set_invalidates_transient(self):
+        tile = self.tile("sample.tile", title="Hello")
+        manager = ITileDataManager(tile)
+        self.assertEqual(manager.get()["title"], "Hello")
+        manager.set({"title": "Changed", "count": 2})
+        self.assertEqual(ITileDataManager(tile).get()["title"], "Changed")
+        manager.delete()
+        self.assertEqual(ITileDataManager(tile).get()["title"], None)
+
+    def test_set_invalidates_persistent(self):
+        tile = self.tile("sample.persistenttile")
+        manager = ITileDataManager(tile)
+        self.assertIsInstance(manager, PersistentTileDataManager)
+        self.assertEqual(manager.get()["title"], None)
+        manager.set({"title": "Changed"})
+        self.assertEqual(ITileDataManager(tile).get()["title"], "Changed")
+        manager.delete()
+        self.assertEqual(ITileDataManager(tile).get()["title"], None)
+
+    def test_set_invalidates_other_managers_sharing_storage(self):
+        tile = self.tile("sample.persistenttile")
+        request = tile.request
+        request.form["X-Tile-Persistent"] = "1"
+        other = self.tile("sample.tile", context=tile.context, request=request)
+        self.assertEqual(ITileDataManager(other).get()["title"], None)
+        ITileDataManager(tile).set({"title": "Shared"})
+        self.assertEqual(ITileDataManager(other).get()["title"], "Shared")
+
+    def test_cache_does_not_shadow_tile_data(self):
+        tile = self.tile("sample.tile", title="Hello")
+        ITileDataManager(tile).get()
+        self.assertNotIn("plone.tiles.data.tile1", IAnnotations(tile.request))
+
+
+class TestGetMany(DataManagerTestCase):
+
+    def test_get_many(self):
+        context = Context()
+        request = Request(form={"title": "Transient"})
+        tile = self.tile("sample.persistenttile", "p1", context, request)
+        ITileDataManager(tile).set({"title": "Persistent"})
+        request = Request(form={"title": "Transient"})
+
+        data = get_many(
+            context,
+            request,
+            [
+                ("sample.tile", "t1"),
+                ("sample.persistenttile", "p1"),
+                ("sample.persistenttile", "p2"),
+                ("unknown.tile", "u1"),
+            ],
+        )
+        self.assertEqual(
+            data,
+            {
+                ("sample.tile", "t1"): {"title": "Transient", "count": None},
+                ("sample.persistenttile", "p1"): {"title": "Persistent", "count": None},
+                ("sample.persistenttile", "p2"): {"title": "Transient", "count": None},
+            },
+        )
+
+        # The managers of the request are seeded
+        with mock.patch.object(BaseTileDataManager, "_load") as load:
+            tile = self.tile("sample.persistenttile", "p1", context, request)
+            self.assertEqual(tile.data["title"], "Persistent")
+        load.assert_not_called()
+
+    def test_get_many_resolves_once_per_name(self):
+        context = Context()
+        request = Request(form={"title": "Transient"})
+        tiles = [("sample.persistenttile", f"p{i}") for i in range(3)]
+        tiles.append(("sample.tile", "t1"))
+        with mock.patch(
+            "plone.tiles.data.resolveTileData", side_effect=resolveTileData
+        ) as resolve:
+            data = get_many(context, request, tiles)
+            self.assertEqual(resolve.call_count, 2)
+            # rendering the tiles afterwards uses the same managers
+            managers = [
+                ITileDataManager(self.tile(name, tid, context, request))
+                for name, tid in tiles
+            ]
+        self.assertEqual(resolve.call_count, 2)
+        self.assertEqual([data[tile]["title"] for tile in tiles], ["Transient"] * 4)
+        self.assertEqual(
+            [manager.key for manager in managers],
+            [f"plone.tiles.data.{tid}" for name, tid in tiles],
+        )
+        self.assertIs(managers[1].storage, managers[0].storage)
+
+
+class TestLazyRequestData(DataManagerTestCase):
+
+    def manager(self, record, **form):
+        tile = self.tile("sample.persistenttile", **form)
+        if record is not None:
+            PersistentTileDataManager(tile).set(record)
+        return PersistentTileDataManager(tile)
+
+    def test_stored_data_covering_schema_skips_decoding(self):
+        manager = self.manager({"title": "Stored", "count": 1}, title="Form")
+        with mock.patch("plone.tiles.data.decode") as decode:
+            data = manager.get()
+        decode.assert_not_called()
+        self.assertEqual(data, {"title": "Stored", "count": 1})
+
+    def test_only_missing_fields_are_decoded(self):
+        manager = self.manager({"title": "Stored"}, title="Form", count="2")
+        with mock.patch(
+            "plone.tiles.data.decode", side_effect=decode
+        ) as patched_decode:
+            data = manager.get()
+        self.assertEqual(patched_decode.call_args.kwargs["names"], ["count"])
+        self.assertEqual(data, {"title": "Stored", "count": 2})
+
+    def test_same_result_as_eager_merge(self):
+        for record, form in (
+            (None, {}),
+            (None, {"title": "Form", "count": "3"}),
+            ({}, {"title": "Form"}),
+            ({"title": "Stored"}, {"count": "4"}),
+            ({"title": "Stored", "extra": 1}, {"title": "Form"}),
+            ({"title": "Stored", "count": 1}, {"count": "5"}),
+            ({"count": 1}, {"_tiledata": '{"title": "JSON", "other": 2}'}),
+        ):
+            manager = self.manager(record, **form)
+            lazy = manager.get()
+            manager._cachedData = None
+            manager.lazyRequestData = False
+            self.assertEqual(lazy, manager.get(), (record, form))
+
+
+class TestLazyTileData(DataManagerTestCase):
+
+    def test_mapping(self):
+        data = LazyTileData(
+            {"title": "Stored", "extra": 1}, {"title": None, "count": 0}
+        )
+        self.assertEqual(data["title"], "Stored")
+        self.assertEqual(data["count"], 0)
+        self.assertEqual(data.get("other", "default"), "default")
+        self.assertEqual(list(data), ["title", "count", "extra"])
+        self.assertEqual(len(data), 3)
+        self.assertEqual(data, {"title": "Stored", "count": 0, "extra": 1})
+
+    def test_copy_on_write(self):
+        record = {"title": "Stored"}
+        data = LazyTileData(record, {"title": None, "count": None})
+        copy = data.copy()
+        data["title"] = "Changed"
+        del data["count"]
+        self.assertEqual(data, {"title": "Changed"})
+        self.assertEqual(record, {"title": "Stored"})
+        self.assertEqual(copy, {"title": "Stored", "count": None})
+
+    def test_fields_decoded_on_access(self):
+        tile = self.tile("sample.tile", title="Hello", count="2")
+        manager = ITileDataManager(tile)
+        with mock.patch(
+            "plone.tiles.data.decode", side_effect=decode
+        ) as patched_decode:
+            data = manager.get_lazy()
+            patched_decode.assert_not_called()
+            self.assertEqual(data["count"], 2)
+            self.assertEqual(data["count"], 2)
+            self.assertEqual(patched_decode.call_count, 1)
+            self.assertEqual(patched_decode.call_args.kwargs["names"], ["count"])
+            # decoded values are shared with later copies
+            self.assertEqual(manager.get_lazy()["count"], 2)
+            self.assertEqual(patched_decode.call_count, 1)
+
+    def test_missing_values_not_decoded(self):
+        tile = self.tile("sample.tile", title="Hello")
+        data = ITileDataManager(tile).get_lazy()
+        with mock.patch("plone.tiles.data.decode") as patched_decode:
+            self.assertIsNone(data["count"])
+        patched_decode.assert_not_called()
+
+    def test_same_result_as_get(self):
+        for name, record, form in (
+            ("sample.tile", None, {}),
+            ("sample.tile", None, {"title": "Form", "count": "3"}),
+            ("sample.tile", {"title": "Set"}, {"count": "3"}),
+            ("sample.tile", None, {"_tiledata": '{"title": "JSON", "other": 2}'}),
+            ("sample.persistenttile", None, {"title": "Form"}),
+            ("sample.persistenttile", {"title": "Stored", "extra": 1}, {"count": "4"}),
+        ):
+            tile = self.tile(name, **form)
+            if record is not None:
+                ITileDataManager(tile).set(record)
+            manager = ITileDataManager(tile)
+            self.assertEqual(manager.get_lazy(), manager.get(), (name, record, form))
+
+    def test_ignored_querystring_fields(self):
+        provideUtility(
+            TileType(
+                "sample.tile",
+                "sample.tile",
+                "zope.Public",
+                "zope.Public",
+                schema=IFilteredData,
+            ),
+            ITileType,
+            name="sample.tile",
+        )
+        for form, environ in (
+            ({"title": "Form", "count": "3"}, {}),
+            ({"title": "Form"}, {}),
+            ({"title": "Form", "count": "3"}, {"REQUEST_METHOD": "POST"}),
+        ):
+            tile = self.tile("sample.tile", request=Request(form=form, environ=environ))
+            manager = ITileDataManager(tile)
+            self.assertEqual(manager.get_lazy(), manager.get(), (form, environ))
+        self.assertNotIn("count", self.tile("sample.tile", count="3").data)
+
+    def test_invalidated_on_set(self):
+        tile = self.tile("sample.persistenttile")
+        manager = ITileDataManager(tile)
+        self.assertIsNone(manager.get_lazy()["title"])
+        manager.set({"title": "Changed"})
+        self.assertEqual(manager.get_lazy()["title"], "Changed")
+
+    def test_tile_opt_in(self):
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertIsInstance(tile.data, dict)
+
+        tile = self.tile("sample.tile", title="Hello")
+        tile.lazyData = True
+        self.assertIsInstance(tile.data, LazyTileData)
+        self.assertEqual(tile(), "<html><body>Hello</body></html>")
+
+
+class TestChangeAwareSet(DataManagerTestCase):
+
+    def manager(self):
+        return PersistentTileDataManager(self.tile("sample.persistenttile"))
+
+    def test_record_updated_in_place(self):
+        manager = self.manager()
+        manager.set({"title": "Hello", "count": 1})
+        self.assertEqual(manager.changed, {"title", "count"})
+        self.assertIsInstance(manager.changed, frozenset)
+        record = manager.storage[manager.key]
+
+        manager.set({"title": "Changed", "count": 1})
+        self.assertEqual(manager.changed, {"title"})
+        self.assertIsInstance(manager.changed, frozenset)
+        self.assertIs(manager.storage[manager.key], record)
+        self.assertEqual(dict(record), {"title": "Changed", "count": 1})
+
+        manager.set({"title": "Changed"})
+        self.assertEqual(manager.changed, {"count"})
+        self.assertEqual(dict(record), {"title": "Changed"})
+        self.assertEqual(manager.get(), {"title": "Changed", "count": None})
+
+    def test_noop_writes_nothing(self):
+        manager = self.manager()
+        manager.set({"title": "Hello", "tags": ["a"]})
+        record = manager.storage[manager.key]
+        manager.get()
+
+        with (
+            mock.patch.object(type(record), "__setitem__") as setitem,
+            mock.patch.object(manager, "invalidate") as invalidate,
+        ):
+            manager.set({"title": "Hello", "tags": ["a"]})
+        self.assertEqual(manager.changed, set())
+        setitem.assert_not_called()
+        invalidate.assert_not_called()
+
+    def test_values_changed_in_place(self):
+        manager = self.manager()
+        manager.set({"tags": ["a"], "title": None, "count": 1})
+        data = manager.get()
+        data["tags"].append("b")
+        manager.set(data)
+        self.assertEqual(manager.changed, {"tags"})
+
+    def test_type_changes(self):
+        manager = self.manager()
+        manager.set({"count": 1})
+        manager.set({"count": True})
+        self.assertEqual(manager.changed, {"count"})
+
+    def test_delete(self):
+        manager = self.manager()
+        manager.delete()
+        self.assertEqual(manager.changed, frozenset())
+        self.assertIsInstance(manager.changed, frozenset)
+        manager.set({"title": "Hello"})
+        manager.delete()
+        self.assertEqual(manager.changed, {"title"})
+        self.assertIsInstance(manager.changed, frozenset)
@@ -0,0 +1,216 @@
+from plone.tiles.esi import ESI_TEMPLATE
+from plone.tiles.esi import ESIBody
+from plone.tiles.esi import ESIHead
+from plone.tiles.esi import extractChildren
+from plone.tiles.esi import LazyScript
+from plone.tiles.esi import LazyTile
+from plone.tiles.esi import substituteESILinks
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import IPartialRendering
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import SampleTile
+from plone.tiles.tests.test_tile import ContextAbsoluteURL
+from zope.component import provideAdapter
+from zope.interface import implementer
+from zope.interface import Interface
+from zope.publisher.browser import TestRequest
+
+import unittest
+
+
+class TestExtractChildren(unittest.TestCase):
+
+    def test_children(self):
+        document = (
+            '<html><HEAD class="x">\n<title>Title</title>\n</HEAD>'
+            "<body><header>Header</header> <p>Text</p>\n</Body></html>"
+        )
+        self.assertEqual(extractChildren(document, "head"), "<title>Title</title>")
+        self.assertEqual(
+            extractChildren(document, "body"), "<header>Header</header> <p>Text</p>"
+        )
+
+    def test_last_closing_tag(self):
+        self.assertEqual(extractChildren("<body>a</body>b</body>", "body"), "a</body>b")
+
+    def test_missing(self):
+        self.assertIsNone(extractChildren("<p>Text</p>", "body"))
+        self.assertIsNone(extractChildren("<header>Text</header>", "head"))
+        self.assertIsNone(extractChildren("<body>Text", "body"))
+        self.assertIsNone(extractChildren("</body><body>", "body"))
+
+    def test_bytes(self):
+        children = extractChildren(b"<html><body>\n <p>Text</p> </body></html>", "body")
+        self.assertIsInstance(children, memoryview)
+        self.assertEqual(bytes(children), b"<p>Text</p>")
+
+
+class TestSubstituteESILinks(unittest.TestCase):
+
+    def test_template(self):
+        document = ESI_TEMPLATE.format(
+            url="http://example.com/@@tile/t1", esiMode="esi-body", queryString="a=1"
+        )
+        substituted = substituteESILinks(document)
+        self.assertIn(
+            '<esi:include src="http://example.com/@@tile/t1/@@esi-body?a=1" />',
+            substituted,
+        )
+        self.assertIn(
+            '<html xmlns:esi="http://www.edge-delivery.org/esi/1.0" xmlns=', substituted
+        )
+        self.assertNotIn("_esi_placeholder", substituted)
+
+    def test_attribute_order_and_quoting(self):
+        for link in (
+            '<a href="/t1" rel="esi" class="_esi_placeholder"></a>',
+            "<a rel='esi' class='tile _esi_placeholder' href='/t1'></a>",
+            "<A CLASS=_esi_placeholder REL=ESI HREF=/t1>\n</A>",
+        ):
+            self.assertEqual(
+                substituteESILinks(f"<p>{link}</p>"), '<p><esi:include src="/t1" /></p>'
+            )
+
+    def test_other_links_unchanged(self):
+        for document in (
+            '<a class="_esi_placeholder" href="/t1"></a>',
+            '<a class="_esi_placeholder" rel="esi" href="/t1">Text</a>',
+            '<a class="no_esi_placeholder" rel="esi" href="/t1"></a>',
+            '<p class="_esi_placeholder"></p>',
+        ):
+            self.assertEqual(substituteESILinks(document), document)
+
+    def test_first_html_tag_only(self):
+        self.assertEqual(
+            substituteESILinks("<html><html><htmlx>"),
+            '<html xmlns:esi="http://www.edge-delivery.org/esi/1.0"><html><htmlx>',
+        )
+
+    def test_bytes(self):
+        self.assertEqual(
+            substituteESILinks(
+                b'<a class="_esi_placeholder" rel="esi" href="/t1"></a>'
+            ),
+            b'<esi:include src="/t1" />',
+        )
+
+    def test_chunks(self):
+        document = (
+            '<html><body><a class="_esi_placeholder" rel="esi" href="/t1"></a>'
+            "<p>Text</p><a href='/t2' rel='esi' class='_esi_placeholder'> </a>"
+            "</body></html>"
+        )
+        expected = substituteESILinks(document)
+        for size in range(1, len(document) + 1):
+            chunks = [document[i : i + size] for i in range(0, len(document), size)]
+            substituted = substituteESILinks(iter(chunks))
+            self.assertEqual("".join(substituted), expected)
+            substituted = substituteESILinks([chunk.encode() for chunk in chunks])
+            self.assertEqual(b"".join(substituted), expected.encode())
+        self.assertEqual(list(substituteESILinks([])), [])
+
+    def test_placeholder_before_html_tag(self):
+        document = (
+            '<a class="_esi_placeholder" rel="esi" href="/t1"></a>'
+            "<html><body><a href='/t2' rel='esi' class='_esi_placeholder'></a>"
+            "</body></html>"
+        )
+        expected = (
+            '<esi:include src="/t1" />'
+            '<html xmlns:esi="http://www.edge-delivery.org/esi/1.0"><body>'
+            '<esi:include src="/t2" /></body></html>'
+        )
+        self.assertEqual(substituteESILinks(document), expected)
+        self.assertEqual(substituteESILinks(document.encode()), expected.encode())
+        for size in range(1, len(document) + 1):
+            chunks = [document[i : i + size] for i in range(0, len(document), size)]
+            self.assertEqual("".join(substituteESILinks(chunks)), expected)
+            self.assertEqual(
+                b"".join(substituteESILinks([chunk.encode() for chunk in chunks])),
+                expected.encode(),
+            )
+
+    def test_chunks_streamed(self):
+        chunks = substituteESILinks(["<html><body>", "<p>Text</p>", "</body></html>"])
+        self.assertEqual(
+            next(chunks),
+            '<html xmlns:esi="http://www.edge-delivery.org/esi/1.0"><body>',
+        )
+        self.assertEqual(next(chunks), "<p>Text</p>")
+
+
+@implementer(IPartialRendering)
+class PartialTile(SampleTile):
+
+    def __call__(self):
+        raise AssertionError("The whole tile should not be rendered")
+
+    def renderHead(self):
+        return "<title>{}</title>".format(self.data["title"])
+
+    def renderBody(self):
+        return "<p>{}</p>".format(self.data["title"])
+
+
+class TestESIViews(DataManagerTestCase):
+
+    def test_whole_tile_rendered(self):
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertEqual(ESIBody(tile, tile.request)(), "Hello")
+        self.assertEqual(
+            ESIHead(tile, tile.request)(), "<html><body>Hello</body></html>"
+        )
+
+    def test_partial_rendering(self):
+        provideAdapter(PartialTile, (Interface, Interface), IBasicTile, "sample.tile")
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertEqual(ESIHead(tile, tile.request)(), "<title>Hello</title>")
+        self.assertEqual(ESIBody(tile, tile.request)(), "<p>Hello</p>")
+
+
+class LazySampleTile(LazyTile):
+
+    __name__ = "sample.tile"
+
+    def index(self):
+        return "<html><body><p>{}</p></body></html>".format(self.data["title"])
+
+
+class TestLazyLoading(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(
+            LazySampleTile, (Interface, Interface), IBasicTile, "sample.tile"
+        )
+
+    def test_placeholder(self):
+        tile = self.tile("sample.tile", title="Hello", count=1)
+        rendered = tile()
+        self.assertIn(
+            '<div class="_lazy_placeholder" data-tile-src="http://example.com/context'
+            '/@@sample.tile/tile1/@@esi-body?title=Hello&amp;count%3Along=1"></div>',
+            rendered,
+        )
+        self.assertIn('<script src="/@@tiles-lazy.js" defer></script>', rendered)
+        self.assertNotIn("<p>", rendered)
+
+    def test_fragment_rendered(self):
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertEqual(ESIBody(tile, tile.request)(), "<p>Hello</p>")
+        # also when rendered again within the same request
+        self.assertEqual(tile(), "<html><body><p>Hello</p></body></html>")
+
+    def test_opt_out(self):
+        tile = self.tile("sample.tile", title="Hello")
+        tile.lazyLoad = False
+        self.assertEqual(tile(), "<html><body><p>Hello</p></body></html>")
+
+    def test_script(self):
+        request = TestRequest()
+        script = LazyScript(None, request)()
+        self.assertIn("IntersectionObserver", script)
+        self.assertEqual(
+            request.response.getHeader("Content-Type"), "text/javascript; charset=utf-8"
+        )
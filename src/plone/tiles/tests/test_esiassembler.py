@@ -0,0 +1,299 @@
+from plone.tiles.esi import ESIBody
+from plone.tiles.esi import ESITile
+from plone.tiles.esi import extractChildren
+from plone.tiles.esiassembler import ESIAssembler
+from plone.tiles.esiassembler import filter_factory
+from plone.tiles.esiassembler import FragmentCache
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.tests.test_datamanager import Context
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import Request
+from urllib.parse import parse_qsl
+from zope.component import getMultiAdapter
+from zope.component import provideAdapter
+from zope.interface import Interface
+
+import threading
+import unittest
+
+PAGE = (
+    b"<html><body>"
+    b'<esi:include src="http://example.com/page/@@a.tile/a1/@@esi-body?x=1" />'
+    b'<esi:include src="/page/@@b.tile/b1/@@esi-body" />'
+    b"</body></html>"
+)
+
+
+class App:
+    """A WSGI application serving fixed responses by path"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+        path = environ["PATH_INFO"]
+        if environ["QUERY_STRING"]:
+            path += "?" + environ["QUERY_STRING"]
+        self.calls.append(path)
+        status, headers, body = self.responses.get(
+            path, ("404 Not Found", [("Content-Type", "text/html")], b"missing")
+        )
+        if callable(body):
+            body = body(environ)
+        start_response(status, list(headers))
+        return body if not isinstance(body, bytes) else [body]
+
+
+def html(body, **headers):
+    headers = [(key.replace("_", "-"), value) for key, value in headers.items()]
+    return ("200 OK", [("Content-Type", "text/html; charset=utf-8")] + headers, body)
+
+
+class TestESIAssembler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = App(
+            {
+                "/page": html(PAGE),
+                "/page/@@a.tile/a1/@@esi-body?x=1": html(b"<p>A</p>"),
+                "/page/@@b.tile/b1/@@esi-body": html(
+                    b"<p>B</p>", Cache_Control="public, max-age=0, s-maxage=60"
+                ),
+                "/image.png": ("200 OK", [("Content-Type", "image/png")], b"PNG"),
+            }
+        )
+        self.assembler = ESIAssembler(self.app, workers=2, cache_size=10)
+        self.addCleanup(self.assembler.executor.shutdown)
+
+    def request(self, path="/page", **environ):
+        environ.setdefault("HTTP_HOST", "example.com")
+        environ.update({"PATH_INFO": path, "QUERY_STRING": "", "SCRIPT_NAME": ""})
+        environ.setdefault("REQUEST_METHOD", "GET")
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = status
+            response["headers"] = dict(headers)
+
+        body = b"".join(self.assembler(environ, start_response))
+        return response["status"], response["headers"], body
+
+    def test_includes_resolved(self):
+        status, headers, body = self.request()
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(body, b"<html><body><p>A</p><p>B</p></body></html>")
+        self.assertEqual(headers["Content-Length"], str(len(body)))
+
+    def test_other_responses_passed_through(self):
+        self.assertEqual(self.request("/image.png")[2], b"PNG")
+        self.request(HTTP_SURROGATE_CAPABILITY='varnish="ESI/1.0"')
+        self.assertEqual(self.app.calls, ["/image.png", "/page"])
+
+    def test_streamed(self):
+        read = []
+
+        def chunks(environ):
+            for chunk in (b"<html>", b"<body>", b"</body></html>"):
+                read.append(chunk)
+                yield chunk
+
+        self.app.responses["/page"] = html(chunks, Content_Length="26")
+        self.assembler.sniffBytes = 10
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["headers"] = dict(headers)
+
+        result = self.assembler(
+            {"HTTP_HOST": "example.com", "PATH_INFO": "/page", "QUERY_STRING": ""},
+            start_response,
+        )
+        self.assertEqual(read, [b"<html>", b"<body>"])
+        self.assertEqual(response["headers"]["Content-Length"], "26")
+        self.assertEqual(b"".join(result), b"<html><body></body></html>")
+
+    def test_include_in_later_chunk(self):
+        self.app.responses["/page"] = html(lambda environ: iter([PAGE[:12], PAGE[12:]]))
+        body = self.request()[2]
+        self.assertEqual(body, b"<html><body><p>A</p><p>B</p></body></html>")
+
+    def test_failed_and_foreign_includes(self):
+        self.app.responses["/page"] = html(
+            b'<esi:include src="/page/@@missing" />'
+            b'<esi:include src="http://other.com/@@esi-body" />'
+        )
+        body = self.request()[2]
+        self.assertEqual(body, b'<esi:include src="http://other.com/@@esi-body" />')
+
+    def test_fragment_cache(self):
+        self.request()
+        self.request()
+        self.assertEqual(
+            self.app.calls,
+            [
+                "/page",
+                "/page/@@a.tile/a1/@@esi-body?x=1",
+                "/page/@@b.tile/b1/@@esi-body",
+                "/page",
+                "/page/@@a.tile/a1/@@esi-body?x=1",
+            ],
+        )
+        # not shared with authenticated users
+        self.request(HTTP_COOKIE="__ac=secret")
+        self.assertEqual(self.app.calls[-1], "/page/@@b.tile/b1/@@esi-body")
+
+    def test_fragment_cache_authenticated(self):
+        for environ in (
+            {"HTTP_AUTHORIZATION": "Basic YWRtaW46c2VjcmV0"},
+            {"HTTP_COOKIE": "lang=de; auth_token=secret"},
+            {"HTTP_COOKIE": "__ac_name=admin"},
+            {"HTTP_COOKIE": "_ZopeId=12345"},
+        ):
+            self.assertFalse(self.assembler.cacheable(environ))
+        self.assertTrue(self.assembler.cacheable({"HTTP_COOKIE": "lang=de"}))
+        self.app.responses["/page/@@b.tile/b1/@@esi-body"] = html(
+            b"<p>B</p>", Cache_Control="public, s-maxage=60", Set_Cookie="a=b"
+        )
+        self.request()
+        self.request()
+        self.assertEqual(self.app.calls.count("/page/@@b.tile/b1/@@esi-body"), 2)
+
+    def test_fragment_cache_bounded(self):
+        cache = FragmentCache(maxEntries=10)
+        headers = [("Cache-Control", "public, s-maxage=60"), ("Vary", "Cookie")]
+        for i in range(100):
+            cache.store({}, ("example.com", "/t", f"x={i}"), headers, b"x")
+        self.assertEqual(len(cache._entries), 10)
+        self.assertEqual(cache.lookup({}, ("example.com", "/t", "x=99")), b"x")
+        self.assertIsNone(cache.lookup({}, ("example.com", "/t", "x=1")))
+
+    def test_fragment_cache_vary(self):
+        self.app.responses["/page/@@b.tile/b1/@@esi-body"] = html(
+            lambda environ: environ.get("HTTP_ACCEPT_LANGUAGE", "").encode(),
+            Cache_Control="public, s-maxage=60",
+            Vary="Accept-Language",
+        )
+        self.assertIn(b"de", self.request(HTTP_ACCEPT_LANGUAGE="de")[2])
+        self.assertIn(b"en", self.request(HTTP_ACCEPT_LANGUAGE="en")[2])
+        self.assertIn(b"de", self.request(HTTP_ACCEPT_LANGUAGE="de")[2])
+        self.assertEqual(self.app.calls.count("/page/@@b.tile/b1/@@esi-body"), 2)
+
+    def test_concurrent_includes(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def wait(environ):
+            # fails with BrokenBarrierError unless both render at once
+            barrier.wait()
+            return b"x"
+
+        for path in (
+            "/page/@@a.tile/a1/@@esi-body?x=1",
+            "/page/@@b.tile/b1/@@esi-body",
+        ):
+            self.app.responses[path] = html(wait)
+        self.assertEqual(self.request()[2], b"<html><body>xx</body></html>")
+
+    def test_nested_includes(self):
+        self.app.responses["/page/@@a.tile/a1/@@esi-body?x=1"] = html(
+            b'<esi:include src="../../@@b.tile/b1/@@esi-body" />'
+        )
+        self.assertEqual(
+            self.request()[2], b"<html><body><p>B</p><p>B</p></body></html>"
+        )
+
+    def test_virtual_hosting(self):
+        self.app.responses = {
+            "/VirtualHostBase/https/example.com:443/site/VirtualHostRoot/_vh_intranet"
+            "/page": html(b'<esi:include src="/intranet/page/@@esi-body" />'),
+            "/VirtualHostBase/https/example.com:443/site/VirtualHostRoot/_vh_intranet"
+            "/page/@@esi-body": html(b"<p>Tile</p>"),
+        }
+        body = self.request(
+            "/VirtualHostBase/https/example.com:443/site/VirtualHostRoot/_vh_intranet"
+            "/page"
+        )[2]
+        self.assertEqual(body, b"<p>Tile</p>")
+
+    def test_filter_factory(self):
+        assembler = filter_factory(self.app, {}, workers="1", cache_size="5")
+        self.assertIsNone(assembler.executor)
+        self.assertEqual(assembler.cache.maxEntries, 5)
+
+
+class SampleESITile(ESITile):
+
+    __name__ = "sample.tile"
+
+    def index(self):
+        return (
+            "<html><head><title>Tile</title></head>"
+            "<body><p>Hello {}</p></body></html>".format(self.data["title"])
+        )
+
+
+class TileApp:
+    """A WSGI application rendering a page with a tile as plone.app.blocks
+    would, and the @@esi-body view of the tile.
+    """
+
+    def __init__(self):
+        self.context = Context()
+        self.paths = []
+
+    def __call__(self, environ, start_response):
+        path = environ["PATH_INFO"]
+        self.paths.append(path)
+        if path == "/page":
+            tileEnviron = dict(environ)
+            tileEnviron.update(
+                PATH_INFO="/page/@@sample.tile/t1", QUERY_STRING="title=World"
+            )
+            request = Request(environ=tileEnviron, form={"title": "World"})
+            tile = getMultiAdapter((self.context, request), name="sample.tile")
+            body = "<html><body><h1>Page</h1>{}</body></html>".format(
+                extractChildren(tile["t1"](), "body")
+            )
+        elif path == "/page/@@sample.tile/t1/@@esi-body":
+            request = Request(
+                environ=environ, form=dict(parse_qsl(environ["QUERY_STRING"]))
+            )
+            tile = getMultiAdapter((self.context, request), name="sample.tile")
+            body = ESIBody(tile["t1"], request)()
+        else:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b""]
+        start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+        return [body.encode()]
+
+
+class TestESIAssemblerIntegration(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(SampleESITile, (Interface, Interface), IBasicTile, "sample.tile")
+        self.app = TileApp()
+        self.assembler = ESIAssembler(self.app, workers=1)
+
+    def request(self, **environ):
+        environ.update(
+            {
+                "HTTP_HOST": "example.com",
+                "PATH_INFO": "/page",
+                "QUERY_STRING": "",
+                "SCRIPT_NAME": "",
+                "REQUEST_METHOD": "GET",
+            }
+        )
+        return b"".join(self.assembler(environ, lambda status, headers: None))
+
+    def test_tile_included(self):
+        body = self.request()
+        self.assertIn(b"<body><h1>Page</h1><p>Hello World</p></body>", body)
+        self.assertNotIn(b"_esi_placeholder", body)
+        self.assertEqual(self.app.paths, ["/page", "/page/@@sample.tile/t1/@@esi-body"])
+
+    def test_esi_proxy(self):
+        body = self.request(HTTP_SURROGATE_CAPABILITY='varnish="ESI/1.0"')
+        self.assertIn(b"<p>Hello World</p>", body)
+        self.assertEqual(self.app.paths, ["/page"])
@@ -0,0 +1,390 @@
+from AccessControl.SecurityManagement import getSecurityManager
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from Acquisition import aq_parent
+from OFS.Application import Application
+from plone.testing.zope import makeTestRequest
+from plone.tiles import PersistentTile
+from plone.tiles import Tile
+from plone.tiles.esi import LazyTile
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import IThreadSafeRendering
+from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.layout import LOGGER
+from plone.tiles.layout import renderTiles
+from plone.tiles.layout import shutdownExecutor
+from plone.tiles.tests.test_datamanager import Context
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import Request
+from plone.tiles.tests.test_storage import PersistentContext
+from plone.tiles.tests.test_tile import ContextAbsoluteURL
+from unittest import mock
+from ZODB.DB import DB
+from ZODB.MappingStorage import MappingStorage
+from zope.component import provideAdapter
+from zope.interface import implementer
+from zope.interface import Interface
+from ZPublisher.BaseRequest import RequestContainer
+
+import asyncio
+import socketserver
+import threading
+import time
+import transaction
+
+RENDERED = []
+
+
+class CloneableRequest(Request):
+
+    def clone(self):
+        return self.__class__()
+
+
+@implementer(IThreadSafeRendering)
+class ThreadSafeTile(PersistentTile):
+
+    __name__ = "sample.persistenttile"
+
+    barrier = None
+
+    def __call__(self):
+        RENDERED.append((self.id, threading.current_thread(), self.context))
+        if self.barrier is not None:
+            self.barrier.wait()
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+@implementer(IThreadSafeRendering)
+class SlowTile(LazyTile):
+
+    __name__ = "sample.tile"
+
+    def __call__(self):
+        SlowTile.event.wait(5)
+        return "Slow"
+
+
+@implementer(IThreadSafeRendering)
+class ThreadSafeTransientTile(Tile):
+
+    __name__ = "sample.tile"
+
+    delay = 0
+
+    def __call__(self):
+        time.sleep(self.delay)
+        return self.data["title"]
+
+
+@implementer(IThreadSafeRendering)
+class UserTile(Tile):
+
+    __name__ = "sample.tile"
+
+    def __call__(self):
+        user = getSecurityManager().getUser()
+        RENDERED.append((self.id, threading.current_thread(), user))
+        return user.getId()
+
+
+@implementer(IThreadSafeRendering)
+class RequestTile(Tile):
+
+    __name__ = "sample.tile"
+
+    def __call__(self):
+        RENDERED.append(
+            (self.id, threading.current_thread(), self.context.REQUEST is self.request)
+        )
+        return self.request["URL"]
+
+
+class TestRenderTiles(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(shutdownExecutor)
+        provideAdapter(
+            ThreadSafeTile,
+            (Interface, Interface),
+            IBasicTile,
+            name="sample.persistenttile",
+        )
+        self.db = DB(MappingStorage())
+        self.tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=self.tm)
+        self.context = conn.root()["context"] = PersistentContext()
+        self.request = CloneableRequest(form={"title": "Transient"})
+        self.tiles = [
+            self.tile("sample.tile", "tile0", self.context, self.request),
+        ]
+        for i in range(1, 4):
+            tile = self.tile(
+                "sample.persistenttile", f"tile{i}", self.context, CloneableRequest()
+            )
+            ITileDataManager(tile).set({"title": f"Tile {i}"})
+            self.tiles.append(tile)
+        self.tm.commit()
+        del RENDERED[:]
+
+    def tearDown(self):
+        ThreadSafeTile.barrier = None
+        self.tm.abort()
+        self.db.close()
+        super().tearDown()
+
+    def test_order_and_results(self):
+        serial = [tile() for tile in self.tiles]
+        self.assertEqual(
+            serial,
+            ["<html><body>Transient</body></html>"]
+            + [f"<html><body>Tile {i}</body></html>" for i in range(1, 4)],
+        )
+        self.assertEqual(renderTiles(self.tiles), serial)
+
+    def test_workers(self):
+        # only passes if the three tiles are rendered at the same time
+        ThreadSafeTile.barrier = threading.Barrier(3, timeout=5)
+        renderTiles(self.tiles)
+        self.assertEqual(len({thread for id_, thread, context in RENDERED}), 3)
+        for id_, thread, context in RENDERED:
+            self.assertIsNot(thread, threading.current_thread())
+            # loaded through a connection of its own
+            self.assertIsNot(context, self.context)
+            self.assertEqual(context._p_oid, self.context._p_oid)
+            self.assertIsNot(context._p_jar, self.context._p_jar)
+
+    def test_snapshot(self):
+        # the workers see the data as of the transaction of the caller
+        conn = self.db.open(transaction_manager=transaction.TransactionManager())
+        tile = self.tile("sample.persistenttile", "tile1", conn.root()["context"])
+        ITileDataManager(tile).set({"title": "Changed"})
+        conn.transaction_manager.commit()
+        conn.close()
+        self.assertEqual(
+            renderTiles(self.tiles[1:2]), ["<html><body>Tile 1</body></html>"]
+        )
+
+    def test_unknown_snapshot(self):
+        # rendered in the calling thread rather than seeing later changes
+        with mock.patch("plone.tiles.layout.getSnapshot", return_value=None):
+            self.assertEqual(
+                renderTiles(self.tiles[1:2]), ["<html><body>Tile 1</body></html>"]
+            )
+        ((id_, thread, context),) = RENDERED
+        self.assertIs(thread, threading.current_thread())
+        self.assertIs(context, self.context)
+
+    def test_timeout(self):
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(SlowTile, (Interface, Interface), IBasicTile, "sample.tile")
+        SlowTile.event = threading.Event()
+        self.addCleanup(SlowTile.event.set)
+        tiles = [self.tile("sample.tile", "tile0", self.context, self.request)]
+        with self.assertLogs("plone.tiles", "WARNING"):
+            (result,) = renderTiles(tiles, timeout=0.05)
+        self.assertIn('<div class="_lazy_placeholder"', result)
+        self.assertEqual(
+            renderTiles(tiles, timeout=0.05, placeholder=lambda tile: "-"), ["-"]
+        )
+
+    def test_request_annotations(self):
+        provideAdapter(
+            ThreadSafeTransientTile, (Interface, Interface), IBasicTile, "sample.tile"
+        )
+        tile = self.tile("sample.tile", "tile0", self.context, CloneableRequest())
+        ITileDataManager(tile).set({"title": "Annotated"})
+        self.assertEqual(renderTiles([tile]), ["Annotated"])
+
+    def test_user(self):
+        provideAdapter(UserTile, (Interface, Interface), IBasicTile, "sample.tile")
+        app = Application()
+        app.acl_users._doAddUser("editor", "secret", ["Member"], [])
+        self.context._p_jar.root()["Application"] = app
+        self.tm.commit()
+        newSecurityManager(
+            None, app.acl_users.getUserById("editor").__of__(app.acl_users)
+        )
+        self.addCleanup(noSecurityManager)
+
+        tile = self.tile("sample.tile", "tile0", app, CloneableRequest())
+        self.assertEqual(renderTiles([tile]), ["editor"])
+        ((id_, thread, user),) = RENDERED
+        self.assertIsNot(thread, threading.current_thread())
+        # fetched again through the connection of the worker
+        userFolder = aq_parent(user)
+        self.assertEqual(userFolder._p_oid, app.acl_users._p_oid)
+        self.assertIsNot(userFolder._p_jar, app._p_jar)
+
+    def test_request_container(self):
+        provideAdapter(RequestTile, (Interface, Interface), IBasicTile, "sample.tile")
+        app = self.context._p_jar.root()["Application"] = Application()
+        self.tm.commit()
+        request = makeTestRequest()
+        request["PARENTS"] = [app]
+        request.setServerURL("https", "example.org", 443)
+        request.setVirtualRoot("/site")
+        app = app.__of__(RequestContainer(REQUEST=request))
+
+        tile = self.tile("sample.tile", "tile0", app, request)
+        self.assertEqual(renderTiles([tile]), ["https://example.org/site"])
+        ((id_, thread, acquired),) = RENDERED
+        self.assertIsNot(thread, threading.current_thread())
+        # the worker acquires the clone of the request, not the caller's
+        self.assertTrue(acquired)
+
+    @mock.patch("plone.tiles.layout.MAX_WORKERS", 1)
+    def test_timeout_per_tile(self):
+        # the tiles are rendered one after another by a single worker, each
+        # within the timeout
+        shutdownExecutor()
+        provideAdapter(
+            ThreadSafeTransientTile, (Interface, Interface), IBasicTile, "sample.tile"
+        )
+        ThreadSafeTransientTile.delay = 0.1
+        self.addCleanup(setattr, ThreadSafeTransientTile, "delay", 0)
+        tiles = [
+            self.tile("sample.tile", f"tile{i}", self.context, self.request)
+            for i in range(3)
+        ]
+        self.assertEqual(renderTiles(tiles, timeout=0.15), ["Transient"] * 3)
+
+    @mock.patch("plone.tiles.layout.MAX_WORKERS", 1)
+    def test_saturated(self):
+        shutdownExecutor()
+        provideAdapter(
+            ThreadSafeTransientTile, (Interface, Interface), IBasicTile, "sample.tile"
+        )
+        ThreadSafeTransientTile.delay = 0.5
+        self.addCleanup(setattr, ThreadSafeTransientTile, "delay", 0)
+        tile = self.tile("sample.tile", "tile0", self.context, self.request)
+        with self.assertLogs("plone.tiles", "WARNING"):
+            self.assertEqual(
+                renderTiles([tile], timeout=0.05, placeholder=lambda tile: "-"), ["-"]
+            )
+        # the only worker is still busy, so the caller renders the tile
+        tile.delay = 0
+        with self.assertLogs("plone.tiles", "WARNING") as logs:
+            self.assertEqual(renderTiles([tile], timeout=0.05), ["Transient"])
+        self.assertIn("are busy", logs.output[0])
+        # until it is done
+        shutdownExecutor()
+        ThreadSafeTransientTile.delay = 0
+        with mock.patch.object(LOGGER, "warning") as warning:
+            self.assertEqual(renderTiles([tile], timeout=0.05), ["Transient"])
+        warning.assert_not_called()
+
+    def test_not_thread_safe(self):
+        self.assertEqual(
+            renderTiles([self.tile("sample.tile", "tile0", request=self.request)]),
+            ["<html><body>Transient</body></html>"],
+        )
+
+
+class DelayingHandler(socketserver.StreamRequestHandler):
+    """A stand-in service answering a line with the delay it waited"""
+
+    # (start, end) of each handled request
+    handled = []
+
+    def handle(self):
+        delay = float(self.rfile.readline())
+        started = time.perf_counter()
+        time.sleep(delay)
+        self.handled.append((started, time.perf_counter()))
+        self.wfile.write(b"Waited %.2f\n" % delay)
+
+
+class ServiceTile(Tile):
+
+    __name__ = "sample.tile"
+
+    async def prepare(self):
+        reader, writer = await asyncio.open_connection(*self.service)
+        try:
+            writer.write(b"%s\n" % self.data["title"].encode())
+            self.answer = (await reader.readline()).decode().strip()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    def index(self):
+        return self.answer
+
+
+class SynchronousTile(Tile):
+
+    __name__ = "sample.tile"
+
+    def prepare(self):
+        raise AssertionError("Not a coroutine function")
+
+    def index(self):
+        return "Rendered"
+
+
+class TestPrepare(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(ServiceTile, (Interface, Interface), IBasicTile, "sample.tile")
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), DelayingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        ServiceTile.service = server.server_address
+        DelayingHandler.handled = []
+
+    def tiles(self, *delays):
+        return [
+            self.tile("sample.tile", f"tile{i}", title=str(delay))
+            for i, delay in enumerate(delays)
+        ]
+
+    def test_single_tile(self):
+        (tile,) = self.tiles(0)
+        self.assertEqual(tile(), "Waited 0.00")
+
+    def test_latency(self):
+        delays = (0.3, 0.4, 0.3, 0.5, 0.4, 0.3)
+        started = time.perf_counter()
+        results = renderTiles(self.tiles(*delays))
+        elapsed = time.perf_counter() - started
+        self.assertEqual(results, [f"Waited {delay:.2f}" for delay in delays])
+        # the waits overlap, so the layout takes about as long as the slowest
+        # tile instead of the sum of the delays
+        starts, ends = zip(*DelayingHandler.handled)
+        self.assertLess(max(starts), min(ends))
+        self.assertLess(elapsed, sum(delays))
+
+    def test_synchronous_prepare(self):
+        # an unrelated method of the same name is not called
+        tile = SynchronousTile(Context(), Request())
+        self.assertEqual(tile(), "Rendered")
+        self.assertEqual(renderTiles([tile]), ["Rendered"])
+
+    def test_running_event_loop(self):
+        (tile,) = self.tiles(0)
+
+        async def render():
+            return tile()
+
+        self.assertEqual(asyncio.run(render()), "Waited 0.00")
+
+    @mock.patch("plone.tiles.tile.PREPARE_TIMEOUT", 0.1)
+    def test_single_tile_timeout(self):
+        (tile,) = self.tiles(0.5)
+        self.assertRaises(asyncio.TimeoutError, tile)
+
+    def test_timeout(self):
+        tiles = self.tiles(0, 0.5)
+        with self.assertLogs("plone.tiles", "WARNING"):
+            results = renderTiles(tiles, timeout=0.1, placeholder=lambda tile: "-")
+        self.assertEqual(results, ["Waited 0.00", "-"])
+        self.assertRaises(asyncio.TimeoutError, tiles[1])
+
+    def test_error(self):
+        tiles = self.tiles(0, 0)
+        ServiceTile.service = ("127.0.0.1", 1)
+        self.assertRaises(OSError, renderTiles, tiles)
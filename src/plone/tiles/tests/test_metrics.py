@@ -0,0 +1,147 @@
+from plone.tiles import Tile
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.metrics import METRICS
+from plone.tiles.metrics import MetricsRegistry
+from plone.tiles.metrics import OTHER
+from plone.tiles.metrics import TilesMetrics
+from plone.tiles.tests.test_datamanager import Context
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import Request
+from plone.tiles.tests.test_tile import ContextAbsoluteURL
+from plone.tiles.tests.test_timing import TemplateTile
+from zope.component import provideAdapter
+from zope.interface import Interface
+from zope.publisher.browser import TestRequest
+
+import json
+import threading
+import unittest
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        registry.observeRender("a.tile", 0.003, 100)
+        registry.observeRender("a.tile", 20.0, 2000000)
+        registry.observeRender("a.tile", 0.5, error=True)
+        metrics = registry.asDict()["tiles"]["a.tile"]
+        self.assertEqual(metrics["renders"], 3)
+        self.assertEqual(metrics["errors"], 1)
+        seconds = metrics["render_seconds"]
+        self.assertEqual(seconds["count"], 3)
+        self.assertEqual(seconds["buckets"]["0.0025"], 0)
+        self.assertEqual(seconds["buckets"]["0.005"], 1)
+        self.assertEqual(seconds["buckets"]["0.5"], 2)
+        self.assertEqual(seconds["buckets"]["10.0"], 2)
+        self.assertEqual(seconds["buckets"]["+Inf"], 3)
+        self.assertEqual(metrics["render_bytes"]["count"], 2)
+        self.assertEqual(metrics["render_bytes"]["buckets"]["256"], 1)
+
+    def test_cache_ratio(self):
+        registry = MetricsRegistry()
+        for hit in (True, True, True, False):
+            registry.observeCache("a.tile", "render", hit)
+        cache = registry.asDict()["tiles"]["a.tile"]["cache"]
+        self.assertEqual(cache["render"], {"hits": 3, "misses": 1, "ratio": 0.75})
+        self.assertEqual(cache["data"], {"hits": 0, "misses": 0, "ratio": None})
+
+    def test_bounded(self):
+        registry = MetricsRegistry(maxTypes=2)
+        for name in ("a", "b", "c", "d", "a"):
+            registry.observeDataSize(name, 10)
+        tiles = registry.asDict()["tiles"]
+        self.assertEqual(sorted(tiles), ["_other", "a", "b"])
+        self.assertEqual(tiles["_other"]["data_bytes"]["count"], 2)
+        self.assertEqual(tiles["a"]["data_bytes"]["count"], 2)
+
+    def test_disabled(self):
+        registry = MetricsRegistry(enabled=False)
+        registry.observeRender("a.tile", 0.1, 10)
+        registry.observeCache("a.tile", "data", True)
+        self.assertEqual(registry.asDict(), {"tiles": {}})
+
+    def test_threads(self):
+        registry = MetricsRegistry()
+
+        def observe():
+            for i in range(1000):
+                registry.observeRender("a.tile", 0.001, 10)
+
+        threads = [threading.Thread(target=observe) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(registry.asDict()["tiles"]["a.tile"]["renders"], 4000)
+
+    def test_prometheus(self):
+        registry = MetricsRegistry()
+        registry.observeRender('a"b.tile', 0.02, 100)
+        registry.observeCache('a"b.tile', "render", False)
+        text = registry.prometheus()
+        self.assertIn("# TYPE plone_tiles_renders_total counter\n", text)
+        self.assertIn('plone_tiles_renders_total{tile="a\\"b.tile"} 1\n', text)
+        self.assertIn(
+            'plone_tiles_render_seconds_bucket{tile="a\\"b.tile",le="0.025"} 1\n', text
+        )
+        self.assertIn('plone_tiles_render_seconds_count{tile="a\\"b.tile"} 1\n', text)
+        self.assertIn(
+            'plone_tiles_cache_requests_total{tile="a\\"b.tile",cache="render",'
+            'result="miss"} 1\n',
+            text,
+        )
+
+
+class UnnamedTile(Tile):
+
+    def index(self):
+        return "Unnamed"
+
+
+class TestTileMetrics(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(TemplateTile, (Interface, Interface), IBasicTile, "sample.tile")
+        METRICS.clear()
+        self.addCleanup(METRICS.clear)
+
+    def test_render(self):
+        tile = self.tile("sample.tile", title="Hello")
+        tile()
+        str(tile.url)
+        metrics = METRICS.asDict()["tiles"]["sample.tile"]
+        self.assertEqual(metrics["renders"], 1)
+        self.assertEqual(metrics["render_bytes"]["sum"], 31)
+        self.assertEqual(metrics["data_bytes"]["sum"], len("title=Hello"))
+
+    def test_error(self):
+        tile = self.tile("sample.tile")
+        tile.index = lambda: 1 / 0
+        self.assertRaises(ZeroDivisionError, tile)
+        metrics = METRICS.asDict()["tiles"]["sample.tile"]
+        self.assertEqual((metrics["renders"], metrics["errors"]), (1, 1))
+
+    def test_unnamed_tile(self):
+        tile = UnnamedTile(Context(), Request())
+        self.assertIsNone(tile.__name__)
+        self.assertEqual(tile(), "Unnamed")
+        self.assertEqual(METRICS.asDict()["tiles"][OTHER]["renders"], 1)
+        self.assertIn(
+            f'plone_tiles_renders_total{{tile="{OTHER}"}} 1', METRICS.prometheus()
+        )
+
+    def test_view(self):
+        METRICS.observeRender("sample.tile", 0.01, 10)
+        request = TestRequest()
+        text = TilesMetrics(None, request)()
+        self.assertIn('plone_tiles_renders_total{tile="sample.tile"} 1', text)
+        self.assertTrue(
+            request.response.getHeader("Content-Type").startswith("text/plain")
+        )
+        request = TestRequest(form={"format": "json"})
+        data = json.loads(TilesMetrics(None, request)())
+        self.assertEqual(data["tiles"]["sample.tile"]["renders"], 1)
+        self.assertEqual(request.response.getHeader("Content-Type"), "application/json")
@@ -0,0 +1,100 @@
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.SpecialUsers import system
+from plone.tiles import profiling
+from plone.tiles import timing
+from plone.tiles.esi import ESIBody
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_timing import TemplateTile
+from unittest import mock
+from zope.component import provideAdapter
+from zope.interface import Interface
+
+import os
+import pstats
+import tempfile
+
+
+class TestSlowTiles(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(TemplateTile, (Interface, Interface), IBasicTile, "sample.tile")
+        timing.addListener(profiling.recordPhases)
+        self.addCleanup(timing.removeListener, profiling.recordPhases)
+
+    @mock.patch("plone.tiles.profiling.SLOW_THRESHOLD", 0.000001)
+    def test_logged(self):
+        tile = self.tile("sample.tile", title="Hello")
+        with self.assertLogs("plone.tiles", "WARNING") as logs:
+            self.assertEqual(tile(), "<html><body>Hello</body></html>")
+        self.assertEqual(len(logs.output), 1)
+        self.assertRegex(
+            logs.output[0],
+            r"Slow tile sample.tile tile1 at None: \d+\.\d ms, data \d+ bytes, "
+            r"phases: manager \d+\.\d ms, data \d+\.\d ms, render \d+\.\d ms$",
+        )
+
+    @mock.patch("plone.tiles.profiling.SLOW_THRESHOLD", 0.000001)
+    def test_esi_logged_once(self):
+        tile = self.tile("sample.tile", title="Hello")
+        with self.assertLogs("plone.tiles", "WARNING") as logs:
+            ESIBody(tile, tile.request)()
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("extract", logs.output[0])
+
+    @mock.patch("plone.tiles.profiling.SLOW_THRESHOLD", 10.0)
+    def test_fast(self):
+        tile = self.tile("sample.tile", title="Hello")
+        with self.assertNoLogs("plone.tiles", "WARNING"):
+            tile()
+
+
+class TestProfiling(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(TemplateTile, (Interface, Interface), IBasicTile, "sample.tile")
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, "profiles")
+        patcher = mock.patch("plone.tiles.profiling.PROFILE_DIRECTORY", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        newSecurityManager(None, system)
+        self.addCleanup(noSecurityManager)
+
+    def profiles(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return os.listdir(self.directory)
+
+    def test_header(self):
+        tile = self.tile("sample.tile", title="Hello")
+        tile.request._environ["HTTP_X_TILE_PROFILE"] = "1"
+        self.assertEqual(tile(), "<html><body>Hello</body></html>")
+        (filename,) = self.profiles()
+        self.assertRegex(filename, r"^\d+T\d+-sample.tile-tile1.prof$")
+        self.assertEqual(tile.request.response.getHeader("X-Tile-Profile"), filename)
+        stats = pstats.Stats(os.path.join(self.directory, filename))
+        self.assertTrue(
+            any(function == "index" for (path, line, function) in stats.stats)
+        )
+
+    def test_esi_parameter(self):
+        tile = self.tile("sample.tile", title="Hello", _tile_profile="1")
+        self.assertEqual(ESIBody(tile, tile.request)(), "Hello")
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_not_requested(self):
+        tile = self.tile("sample.tile", title="Hello")
+        tile()
+        self.assertEqual(self.profiles(), [])
+
+    def test_unauthorized(self):
+        noSecurityManager()
+        tile = self.tile("sample.tile", title="Hello")
+        tile.request._environ["HTTP_X_TILE_PROFILE"] = "1"
+        tile()
+        self.assertEqual(self.profiles(), [])
@@ -0,0 +1,214 @@
+from persistent import Persistent
+from persistent.dict import PersistentDict
+from plone.tiles.data import get_many
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.data import TileDataRecord
+from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.storage import btreePersistentTileDataStorage
+from plone.tiles.storage import BTreeTileDataStorage
+from plone.tiles.storage import btreeTileDataStorage
+from plone.tiles.storage import migrate
+from plone.tiles.storage import STORAGE_KEY
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from unittest import mock
+from ZODB.DB import DB
+from ZODB.MappingStorage import MappingStorage
+from zope.annotation.interfaces import IAnnotations
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.component import provideAdapter
+from zope.interface import implementer
+
+import transaction
+
+
+@implementer(IAttributeAnnotatable)
+class PersistentContext(Persistent):
+    pass
+
+
+class StorageTestCase(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(btreeTileDataStorage)
+        provideAdapter(btreePersistentTileDataStorage)
+
+
+class TestBTreeTileDataStorage(StorageTestCase):
+
+    def test_manager_uses_tree(self):
+        tile = self.tile("sample.persistenttile")
+        manager = ITileDataManager(tile)
+        self.assertIsInstance(manager.storage, BTreeTileDataStorage)
+        self.assertEqual(manager.key, "tile1")
+
+        manager.set({"title": "Hello"})
+        annotations = IAnnotations(tile.context)
+        self.assertEqual(list(annotations.keys()), [STORAGE_KEY])
+        self.assertIsInstance(annotations[STORAGE_KEY]["tile1"], TileDataRecord)
+        self.assertEqual(manager.get(), {"title": "Hello", "count": None})
+
+        manager.delete()
+        self.assertEqual(list(annotations[STORAGE_KEY].keys()), [])
+        self.assertEqual(manager.get(), {"title": None, "count": None})
+
+    def test_get_does_not_create_tree(self):
+        tile = self.tile("sample.persistenttile")
+        ITileDataManager(tile).get()
+        self.assertEqual(list(IAnnotations(tile.context).keys()), [])
+
+    def test_transient_tile_with_persistent_flag(self):
+        tile = self.tile("sample.tile", title="Hello", **{"X-Tile-Persistent": "1"})
+        ITileDataManager(tile).set({"title": "Stored"})
+        self.assertEqual(
+            dict(IAnnotations(tile.context)[STORAGE_KEY]["tile1"]), {"title": "Stored"}
+        )
+
+    def test_legacy_fallback(self):
+        tile = self.tile("sample.persistenttile")
+        annotations = IAnnotations(tile.context)
+        annotations["plone.tiles.data.tile1"] = PersistentDict({"title": "Old"})
+
+        storage = BTreeTileDataStorage(tile.context)
+        self.assertIn("tile1", storage)
+        self.assertEqual(storage.keys(), ["tile1"])
+        self.assertEqual(ITileDataManager(tile).get()["title"], "Old")
+
+        ITileDataManager(tile).set({"title": "New"})
+        self.assertNotIn("plone.tiles.data.tile1", annotations)
+        self.assertEqual(dict(storage["tile1"]), {"title": "New"})
+
+    def test_legacy_record_updated_in_place(self):
+        tile = self.tile("sample.persistenttile")
+        annotations = IAnnotations(tile.context)
+        annotations["plone.tiles.data.tile1"] = TileDataRecord({"title": "Old"})
+
+        ITileDataManager(tile).set({"title": "New"})
+        self.assertEqual(dict(annotations["plone.tiles.data.tile1"]), {"title": "New"})
+        self.assertEqual(migrate([tile.context], commit=False), 1)
+        self.assertEqual(dict(annotations[STORAGE_KEY]["tile1"]), {"title": "New"})
+
+    def test_legacy_delete(self):
+        context = self.tile("sample.persistenttile").context
+        IAnnotations(context)["plone.tiles.data.tile1"] = PersistentDict()
+        storage = BTreeTileDataStorage(context)
+        del storage["tile1"]
+        self.assertEqual(list(IAnnotations(context).keys()), [])
+        with self.assertRaises(KeyError):
+            del storage["tile1"]
+
+    def test_get_many_fetches_once(self):
+        context = self.tile("sample.persistenttile").context
+        storage = BTreeTileDataStorage(context)
+        storage["a"] = {"title": "A"}
+        IAnnotations(context)["plone.tiles.data.b"] = PersistentDict({"title": "B"})
+
+        request = self.tile("sample.persistenttile").request
+        tiles = [("sample.persistenttile", tid) for tid in ("a", "b", "c")]
+        with (
+            mock.patch.object(
+                BTreeTileDataStorage,
+                "getMany",
+                autospec=True,
+                side_effect=BTreeTileDataStorage.getMany,
+            ) as getMany,
+            mock.patch.object(BTreeTileDataStorage, "get") as get,
+        ):
+            data = get_many(context, request, tiles)
+        getMany.assert_called_once_with(mock.ANY, ["a", "b", "c"])
+        get.assert_not_called()
+        self.assertEqual(
+            [data[tile]["title"] for tile in tiles],
+            ["A", "B", None],
+        )
+
+    def test_migrate(self):
+        contexts = [self.tile("sample.persistenttile").context for i in range(3)]
+        for context in contexts:
+            annotations = IAnnotations(context)
+            annotations["other.addon"] = "untouched"
+            for tid in ("a", "b"):
+                annotations["plone.tiles.data." + tid] = PersistentDict({"id": tid})
+
+        with mock.patch("transaction.commit") as commit:
+            self.assertEqual(migrate(iter(contexts), batch_size=3), 6)
+        self.assertEqual(commit.call_count, 2)
+
+        for context in contexts:
+            annotations = IAnnotations(context)
+            self.assertEqual(sorted(annotations.keys()), ["other.addon", STORAGE_KEY])
+            self.assertEqual(
+                dict(annotations[STORAGE_KEY]["b"]),
+                {"id": "b"},
+            )
+
+        # Running it again is harmless
+        with mock.patch("transaction.commit") as commit:
+            self.assertEqual(migrate(contexts), 0)
+        commit.assert_not_called()
+
+
+class TestBTreeTileDataStorageZODB(StorageTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(MappingStorage())
+
+    def tearDown(self):
+        transaction.abort()
+        self.db.close()
+        super().tearDown()
+
+    def open(self):
+        tm = transaction.TransactionManager()
+        conn = self.db.open(transaction_manager=tm)
+        return tm, conn
+
+    def test_write_does_not_touch_other_tiles(self):
+        tm, conn = self.open()
+        context = conn.root()["context"] = PersistentContext()
+        storage = BTreeTileDataStorage(context)
+        for tid in ("a", "b", "c"):
+            storage[tid] = {"title": tid}
+        tm.commit()
+        serials = {
+            tid: record._p_serial for tid, record in storage.items() if tid != "a"
+        }
+
+        # a second connection starts with an empty object cache
+        tm, conn = self.open()
+        context = conn.root()["context"]
+        tile = self.tile("sample.persistenttile", id_="a", context=context)
+        PersistentTileDataManager(tile).set({"title": "changed"})
+
+        tree = IAnnotations(context)[STORAGE_KEY]
+        for tid in serials:
+            # the other records are not even loaded
+            self.assertIsNone(tree[tid]._p_changed)
+        tm.commit()
+
+        for tid, serial in serials.items():
+            self.assertEqual(dict(tree[tid]), {"title": tid})
+            self.assertEqual(tree[tid]._p_serial, serial)
+        self.assertEqual(dict(tree["a"]), {"title": "changed"})
+
+    def test_noop_set_does_not_write(self):
+        tm, conn = self.open()
+        context = conn.root()["context"] = PersistentContext()
+        tile = self.tile("sample.persistenttile", context=context)
+        PersistentTileDataManager(tile).set({"title": "Hello", "count": 1})
+        tm.commit()
+        record = IAnnotations(context)[STORAGE_KEY]["tile1"]
+        serial = record._p_serial
+
+        tile = self.tile("sample.persistenttile", context=context)
+        PersistentTileDataManager(tile).set({"title": "Hello", "count": 1})
+        self.assertFalse(record._p_changed)
+        tm.commit()
+        self.assertEqual(record._p_serial, serial)
+
+        tile = self.tile("sample.persistenttile", context=context)
+        PersistentTileDataManager(tile).set({"title": "Changed", "count": 1})
+        self.assertIs(IAnnotations(context)[STORAGE_KEY]["tile1"], record)
+        tm.commit()
+        self.assertNotEqual(record._p_serial, serial)
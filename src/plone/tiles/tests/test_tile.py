@@ -0,0 +1,575 @@
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.users import SimpleUser
+from plone.tiles import PersistentTile
+from plone.tiles import Tile
+from plone.tiles.cache import RENDER_CACHE
+from plone.tiles.data import PersistentTileDataManager
+from plone.tiles.esi import ESIBody
+from plone.tiles.esi import ESIHead
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import IESIRendered
+from plone.tiles.interfaces import ITileDataDeletedEvent
+from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.interfaces import ITileDataModifiedEvent
+from plone.tiles.interfaces import ITileType
+from plone.tiles.tests.test_datamanager import Context
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_datamanager import Request
+from plone.tiles.tests.test_storage import PersistentContext
+from plone.tiles.tile import TileThemingTransform
+from unittest import mock
+from ZODB.DB import DB
+from ZODB.MappingStorage import MappingStorage
+from zope.component import adapter
+from zope.component import getMultiAdapter
+from zope.component import getUtility
+from zope.component import provideAdapter
+from zope.component import provideHandler
+from zope.event import notify
+from zope.interface import implementer
+from zope.interface import Interface
+from zope.lifecycleevent import ObjectModifiedEvent
+from zope.publisher.interfaces.http import IHTTPRequest
+from zope.traversing.browser.interfaces import IAbsoluteURL
+
+import datetime
+import transaction
+
+
+@implementer(IAbsoluteURL)
+@adapter(Context, IHTTPRequest)
+class ContextAbsoluteURL:
+
+    def __init__(self, context, request):
+        self.context = context
+        self.request = request
+
+    def __str__(self):
+        return "http://example.com/context"
+
+    __call__ = __str__
+
+
+class TileTestCase(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        noSecurityManager()
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(ContextAbsoluteURL, name="absolute_url")
+
+
+class TestTileURL(TileTestCase):
+
+    def test_url_is_cached(self):
+        tile = self.tile("sample.tile", title="Hello")
+        with mock.patch(
+            "plone.tiles.tile.absoluteURL", return_value="http://example.com/tile"
+        ) as absoluteURL:
+            self.assertEqual(tile.url, "http://example.com/tile")
+            self.assertEqual(tile.url, "http://example.com/tile")
+        self.assertEqual(absoluteURL.call_count, 1)
+
+    def test_url_follows_data_changes(self):
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertEqual(
+            tile.url, "http://example.com/context/@@sample.tile/tile1?title=Hello"
+        )
+        ITileDataManager(tile).set({"title": "World"})
+        self.assertEqual(
+            tile.url, "http://example.com/context/@@sample.tile/tile1?title=World"
+        )
+
+    def test_url_follows_id_changes(self):
+        tile = self.tile("sample.persistenttile")
+        self.assertEqual(
+            tile.url, "http://example.com/context/@@sample.persistenttile/tile1"
+        )
+        tile.id = "tile2"
+        self.assertEqual(
+            tile.url, "http://example.com/context/@@sample.persistenttile/tile2"
+        )
+
+
+class TestTileURLHeader(TileTestCase):
+
+    def traverse(self, request):
+        tile = getMultiAdapter((Context(), request), name="sample.tile")
+        return tile["tile1"]
+
+    def test_header_set_by_default(self):
+        tile = self.traverse(Request(form={"title": "Hello"}))
+        self.assertEqual(
+            tile.request.response.getHeader("X-Tile-Url"),
+            "http://example.com/context/@@sample.tile/tile1?title=Hello",
+        )
+
+    @mock.patch("plone.tiles.tile.LAZY_URL_HEADER", True)
+    def test_lazy_header_skipped_for_anonymous_get(self):
+        getUtility(ITileType, "sample.tile").edit_permission = "plone.tiles.tests.Edit"
+        with mock.patch("plone.tiles.tile.absoluteURL") as absoluteURL:
+            tile = self.traverse(Request(form={"title": "Hello"}))
+        self.assertIsNone(tile.request.response.getHeader("X-Tile-Url"))
+        absoluteURL.assert_not_called()
+
+    @mock.patch("plone.tiles.tile.LAZY_URL_HEADER", True)
+    def test_lazy_header_set_for_form_submissions(self):
+        getUtility(ITileType, "sample.tile").edit_permission = "plone.tiles.tests.Edit"
+        request = Request(form={"title": "Hello"}, environ={"REQUEST_METHOD": "POST"})
+        tile = self.traverse(request)
+        self.assertIsNotNone(tile.request.response.getHeader("X-Tile-Url"))
+
+    @mock.patch("plone.tiles.tile.LAZY_URL_HEADER", True)
+    def test_lazy_header_set_for_editors(self):
+        tile = self.traverse(Request(form={"title": "Hello"}))
+        self.assertIsNotNone(tile.request.response.getHeader("X-Tile-Url"))
+
+
+class PageContext(Context):
+
+    def getPhysicalPath(self):
+        return ("", "site", "page")
+
+
+class PersistentPageContext(PersistentContext):
+
+    def getPhysicalPath(self):
+        return ("", "site", "page")
+
+
+class IndexTile(Tile):
+
+    calls = []
+
+    def index(self):
+        self.calls.append((self.id, self.data["title"]))
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class PersistentIndexTile(PersistentTile):
+
+    index = IndexTile.index
+    calls = IndexTile.calls
+
+
+class TestRenderCache(TileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, class_ in (
+            ("sample.tile", IndexTile),
+            ("sample.persistenttile", PersistentIndexTile),
+        ):
+            provideAdapter(
+                type(class_.__name__, (class_,), {"__name__": name}),
+                (Interface, Interface),
+                IBasicTile,
+                name=name,
+            )
+            tileType = getUtility(ITileType, name)
+            tileType.render_cache_ttl = 60
+            tileType.render_cache_vary = ("LANGUAGE",)
+        patcher = mock.patch.object(RENDER_CACHE, "maxEntries", 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        RENDER_CACHE.clear()
+        self.addCleanup(RENDER_CACHE.clear)
+        self.addCleanup(noSecurityManager)
+        self.context = PageContext()
+        self.calls = IndexTile.calls
+        del self.calls[:]
+
+    def render(self, name="sample.tile", id_="tile1", request=None, **form):
+        return self.tile(name, id_, self.context, request, **form)()
+
+    def test_rendered_once(self):
+        self.assertEqual(self.render(title="Hello"), "<html><body>Hello</body></html>")
+        self.assertEqual(self.render(title="Hello"), "<html><body>Hello</body></html>")
+        self.assertEqual(self.calls, [("tile1", "Hello")])
+
+    def test_key(self):
+        self.render(title="Hello")
+        self.render(title="World")
+        self.render("sample.tile", "tile2", title="Hello")
+        self.render(request=Request(form={"title": "Hello"}, LANGUAGE="de"))
+        self.context = PageContext()
+        self.context.getPhysicalPath = lambda: ("", "site", "other")
+        self.render(title="Hello")
+        self.assertEqual(len(self.calls), 5)
+        self.assertEqual(len(RENDER_CACHE), 5)
+
+    def test_not_cached(self):
+        getUtility(ITileType, "sample.tile").render_cache_ttl = None
+        self.render(title="Hello")
+        self.render(title="Hello")
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(RENDER_CACHE), 0)
+
+    def test_not_cached_for_post(self):
+        request = Request(form={"title": "Hello"}, environ={"REQUEST_METHOD": "POST"})
+        self.render(request=request)
+        self.assertEqual(len(RENDER_CACHE), 0)
+
+    def test_not_cached_for_users(self):
+        newSecurityManager(None, SimpleUser("editor", "", ["Member"], []))
+        self.render(title="Hello")
+        self.assertEqual(len(RENDER_CACHE), 0)
+
+    def test_invalidated_by_data_manager(self):
+        self.render("sample.persistenttile")
+        self.render("sample.persistenttile", "tile2")
+        self.assertEqual(len(RENDER_CACHE), 2)
+        tile = self.tile("sample.persistenttile", "tile1", self.context)
+        PersistentTileDataManager(tile).set({"title": "Changed"})
+        self.assertEqual(len(RENDER_CACHE), 1)
+
+    def test_not_stale_after_commit(self):
+        db = DB(MappingStorage())
+        self.addCleanup(db.close)
+
+        def open():
+            tm = transaction.TransactionManager()
+            conn = db.open(transaction_manager=tm)
+            self.addCleanup(conn.close)
+            return tm, conn
+
+        tm, conn = open()
+        self.context = conn.root()["page"] = PersistentPageContext()
+        tm.commit()
+        tile = self.tile("sample.persistenttile", "tile1", self.context)
+        PersistentTileDataManager(tile).set({"title": "Hello"})
+        # changed in this transaction
+        self.render("sample.persistenttile")
+        self.assertEqual(len(RENDER_CACHE), 0)
+        tm.commit()
+        self.render("sample.persistenttile")
+        self.render("sample.persistenttile")
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(len(RENDER_CACHE), 1)
+
+        # saved by another process, which cannot invalidate this cache
+        serial = self.context._p_serial
+        tm, conn = open()
+        tile = self.tile("sample.persistenttile", "tile1", conn.root()["page"])
+        with mock.patch("plone.tiles.data.invalidateRenderCache"):
+            PersistentTileDataManager(tile).set({"title": "Changed"})
+        tm.commit()
+        self.context._p_jar.sync()
+        tm.abort()
+        self.assertEqual(
+            self.render("sample.persistenttile"), "<html><body>Changed</body></html>"
+        )
+        self.assertEqual(self.context._p_serial, serial)
+
+    def test_invalidated_by_modified_event(self):
+        self.render(title="Hello")
+        self.render("sample.tile", "tile2", title="Hello")
+        notify(ObjectModifiedEvent(PageContext()))
+        self.assertEqual(len(RENDER_CACHE), 0)
+
+
+class ConditionalTile(IndexTile):
+
+    conditionalGet = True
+
+
+class PersistentConditionalTile(PersistentIndexTile):
+
+    conditionalGet = True
+
+
+class ModifiedContext(PageContext):
+
+    def modified(self):
+        return datetime.datetime(2024, 5, 1, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+class TestConditionalGet(TileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, class_ in (
+            ("sample.tile", ConditionalTile),
+            ("sample.persistenttile", PersistentConditionalTile),
+        ):
+            provideAdapter(
+                type(class_.__name__, (class_,), {"__name__": name}),
+                (Interface, Interface),
+                IBasicTile,
+                name=name,
+            )
+        self.context = ModifiedContext()
+        self.calls = IndexTile.calls
+        del self.calls[:]
+
+    def publish(self, name="sample.tile", method="GET", **headers):
+        environ = {"HTTP_" + key.upper(): value for key, value in headers.items()}
+        environ["REQUEST_METHOD"] = method
+        request = Request(form={"title": "Hello"}, environ=environ)
+        tile = self.tile(name, "tile1", self.context, request)
+        request._environ["PUBLISHED"] = tile
+        return tile(), request.response
+
+    def test_validators(self):
+        body, response = self.publish()
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+        self.assertTrue(response.getHeader("ETag").startswith('W/"'))
+        self.assertEqual(
+            response.getHeader("Last-Modified"), "Wed, 01 May 2024 12:00:00 GMT"
+        )
+
+    def test_if_none_match(self):
+        etag = self.publish()[1].getHeader("ETag")
+        for ifNoneMatch in (etag, etag[2:], f'"other", {etag}', "*"):
+            body, response = self.publish(if_none_match=ifNoneMatch)
+            self.assertEqual(body, "")
+            self.assertEqual(response.getStatus(), 304)
+            self.assertEqual(response.getHeader("ETag"), etag)
+        self.assertEqual(len(self.calls), 1)
+
+        body, response = self.publish(if_none_match='W/"other"')
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_etag_follows_data(self):
+        tile = self.tile("sample.persistenttile", context=self.context)
+        etag = self.publish("sample.persistenttile")[1].getHeader("ETag")
+        ITileDataManager(tile).set({"title": "Changed"})
+        self.assertNotEqual(
+            self.publish("sample.persistenttile")[1].getHeader("ETag"), etag
+        )
+
+    def test_if_modified_since(self):
+        body, response = self.publish(if_modified_since="Wed, 01 May 2024 12:00:00 GMT")
+        self.assertEqual(response.getStatus(), 304)
+        body, response = self.publish(if_modified_since="Wed, 01 May 2024 11:59:59 GMT")
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+        # If-None-Match takes precedence
+        body, response = self.publish(
+            if_modified_since="Wed, 01 May 2024 12:00:00 GMT",
+            if_none_match='"other"',
+        )
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+        self.publish(if_modified_since="invalid")
+        self.assertEqual(len(self.calls), 3)
+
+    def test_not_modified_only_for_get(self):
+        etag = self.publish()[1].getHeader("ETag")
+        body, response = self.publish(method="POST", if_none_match=etag)
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+
+    def test_only_published_tile(self):
+        request = Request(form={"title": "Hello"}, HTTP_IF_NONE_MATCH="*")
+        tile = self.tile("sample.tile", "tile1", self.context, request)
+        self.assertEqual(tile(), "<html><body>Hello</body></html>")
+        self.assertIsNone(request.response.getHeader("ETag"))
+
+    def test_disabled_by_default(self):
+        provideAdapter(
+            type("IndexTile", (IndexTile,), {"__name__": "sample.tile"}),
+            (Interface, Interface),
+            IBasicTile,
+            name="sample.tile",
+        )
+        body, response = self.publish(if_none_match="*")
+        self.assertEqual(body, "<html><body>Hello</body></html>")
+        self.assertIsNone(response.getHeader("ETag"))
+
+    def test_esi_views(self):
+        for view in (ESIBody, ESIHead):
+            request = Request(form={"title": "Hello"}, HTTP_IF_NONE_MATCH="*")
+            tile = self.tile("sample.tile", "tile1", self.context, request)
+            self.assertEqual(view(tile, request)(), "")
+            self.assertEqual(request.response.getStatus(), 304)
+        self.assertEqual(self.calls, [])
+
+    def test_theming_transform(self):
+        tile = self.tile("sample.tile", "tile1", self.context, title="Hello")
+        tile.request.response.setStatus(200)
+        TileThemingTransform(tile, tile.request).transformUnicode("", "utf-8")
+        etag = tile.request.response.getHeader("ETag")
+        self.assertIsNotNone(etag)
+
+        request = Request(form={"title": "Hello"}, HTTP_IF_NONE_MATCH=etag)
+        request.response.setStatus(200)
+        tile = self.tile("sample.tile", "tile1", self.context, request)
+        self.assertEqual(
+            TileThemingTransform(tile, request).transformUnicode("", "utf-8"), ""
+        )
+        self.assertEqual(request.response.getStatus(), 304)
+
+
+class TestCachingPolicy(TileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(
+            type("IndexTile", (IndexTile,), {"__name__": "sample.tile"}),
+            (Interface, Interface),
+            IBasicTile,
+            name="sample.tile",
+        )
+        self.tileType = getUtility(ITileType, "sample.tile")
+        self.tileType.cache_max_age = 60
+        self.tileType.cache_s_maxage = 3600
+        self.tileType.cache_stale_while_revalidate = 30
+        self.tileType.cache_stale_if_error = 86400
+        self.tileType.cache_vary = ("Accept-Language",)
+        self.tileType.surrogate_keys = ("sample", "navigation")
+        self.addCleanup(noSecurityManager)
+        self.context = PageContext()
+
+    def publish(self, request=None):
+        if request is None:
+            request = Request(form={"title": "Hello"})
+        tile = self.tile("sample.tile", "tile1", self.context, request)
+        request._environ["PUBLISHED"] = tile
+        tile()
+        return request.response
+
+    def test_headers(self):
+        response = self.publish()
+        self.assertEqual(
+            response.getHeader("Cache-Control"),
+            "public, max-age=60, s-maxage=3600, stale-while-revalidate=30, "
+            "stale-if-error=86400",
+        )
+        self.assertEqual(response.getHeader("Vary"), "Accept-Language")
+        self.assertEqual(
+            response.getHeader("Surrogate-Key"), "sample.tile sample navigation"
+        )
+        self.assertEqual(response.getHeader("xkey"), "sample.tile sample navigation")
+
+    def test_shared_caches_only(self):
+        self.tileType.cache_max_age = None
+        self.tileType.cache_stale_while_revalidate = None
+        self.tileType.cache_stale_if_error = None
+        self.assertEqual(
+            self.publish().getHeader("Cache-Control"),
+            "public, max-age=0, s-maxage=3600",
+        )
+
+    def test_merged_with_existing_headers(self):
+        request = Request(form={"title": "Hello"})
+        request.response.setHeader("Cache-Control", "private")
+        request.response.setHeader("Vary", "Accept-Encoding, accept-language")
+        request.response.setHeader("Surrogate-Key", "other")
+        response = self.publish(request)
+        self.assertEqual(response.getHeader("Cache-Control"), "private")
+        self.assertEqual(response.getHeader("Vary"), "Accept-Encoding, accept-language")
+        self.assertEqual(
+            response.getHeader("Surrogate-Key"), "other sample.tile sample navigation"
+        )
+
+    def test_not_set(self):
+        request = Request(form={"title": "Hello"}, environ={"REQUEST_METHOD": "POST"})
+        self.assertIsNone(self.publish(request).getHeader("Cache-Control"))
+
+        newSecurityManager(None, SimpleUser("editor", "", ["Member"], []))
+        self.assertIsNone(self.publish().getHeader("Cache-Control"))
+        noSecurityManager()
+
+        request = Request(form={"title": "Hello"})
+        self.tile("sample.tile", "tile1", self.context, request)()
+        self.assertIsNone(request.response.getHeader("Cache-Control"))
+
+    def test_esi_view(self):
+        request = Request(form={"title": "Hello"})
+        tile = self.tile("sample.tile", "tile1", self.context, request)
+        ESIBody(tile, request)()
+        self.assertTrue(
+            request.response.getHeader("Cache-Control").startswith("public")
+        )
+
+
+class UIDContext(PageContext):
+
+    def UID(self):
+        return "abc123"
+
+
+class KeyedTile(IndexTile):
+
+    def index(self):
+        self.addSurrogateKeys("listed1", "listed2")
+        return super().index()
+
+
+@implementer(IESIRendered)
+class PersistentESIIndexTile(PersistentIndexTile):
+    pass
+
+
+class TestSurrogateKeys(TileTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, class_ in (
+            ("sample.tile", KeyedTile),
+            ("sample.persistenttile", PersistentESIIndexTile),
+        ):
+            provideAdapter(
+                type(class_.__name__, (class_,), {"__name__": name}),
+                (Interface, Interface),
+                IBasicTile,
+                name=name,
+            )
+        RENDER_CACHE.clear()
+        self.addCleanup(RENDER_CACHE.clear)
+        self.context = UIDContext()
+        del IndexTile.calls[:]
+        self.events = []
+        provideHandler(self.events.append, (ITileDataModifiedEvent,))
+
+    def publish(self):
+        request = Request(form={"title": "Hello"})
+        tile = self.tile("sample.tile", "tile1", self.context, request)
+        request._environ["PUBLISHED"] = tile
+        tile()
+        return request.response
+
+    def test_keys(self):
+        keys = "sample.tile abc123 abc123/tile1 listed1 listed2"
+        response = self.publish()
+        self.assertEqual(response.getHeader("Surrogate-Key"), keys)
+        self.assertEqual(response.getHeader("xkey"), keys)
+
+    @mock.patch.object(RENDER_CACHE, "maxEntries", 1000)
+    def test_declared_keys_restored_from_render_cache(self):
+        getUtility(ITileType, "sample.tile").render_cache_ttl = 60
+        self.publish()
+        response = self.publish()
+        self.assertEqual(len(IndexTile.calls), 1)
+        self.assertIn("listed1 listed2", response.getHeader("Surrogate-Key"))
+
+    def test_esi_views(self):
+        for view in (ESIBody, ESIHead):
+            request = Request(form={"title": "Hello"})
+            tile = self.tile("sample.tile", "tile1", self.context, request)
+            view(tile, request)()
+            self.assertIn("abc123/tile1", request.response.getHeader("xkey"))
+
+    def test_events(self):
+        tile = self.tile("sample.persistenttile", "tile1", self.context)
+        manager = PersistentTileDataManager(tile)
+        manager.set({"title": "Hello"})
+        manager.set({"title": "Hello"})
+        manager.set({"title": "Hello", "count": 1})
+        manager.delete()
+        manager.delete()
+
+        self.assertEqual(len(self.events), 3)
+        self.assertEqual(
+            [ITileDataDeletedEvent.providedBy(event) for event in self.events],
+            [False, False, True],
+        )
+        self.assertEqual(self.events[1].changed, {"count"})
+        self.assertEqual(self.events[2].changed, {"title", "count"})
+        event = self.events[0]
+        self.assertIs(event.object, tile)
+        self.assertEqual(
+            event.surrogateKeys, ["sample.persistenttile", "abc123", "abc123/tile1"]
+        )
+        url = "http://example.com/context/@@sample.persistenttile/tile1"
+        self.assertEqual(event.urls, [url, url + "/@@esi-body", url + "/@@esi-head"])
@@ -0,0 +1,87 @@
+from plone.tiles import Tile
+from plone.tiles import timing
+from plone.tiles.esi import ESIBody
+from plone.tiles.interfaces import IBasicTile
+from plone.tiles.interfaces import ITilePhaseTimedEvent
+from plone.tiles.tests.test_datamanager import DataManagerTestCase
+from plone.tiles.tests.test_tile import ContextAbsoluteURL
+from unittest import mock
+from zope.component import provideAdapter
+from zope.interface import Interface
+from zope.interface.interfaces import IObjectEvent
+
+
+class TemplateTile(Tile):
+
+    __name__ = "sample.tile"
+
+    def index(self):
+        return "<html><body>{}</body></html>".format(self.data["title"])
+
+
+class TestTiming(DataManagerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        provideAdapter(ContextAbsoluteURL)
+        provideAdapter(TemplateTile, (Interface, Interface), IBasicTile, "sample.tile")
+        self.events = []
+        timing.addListener(self.events.append)
+        self.addCleanup(timing.removeListener, self.events.append)
+
+    def phases(self):
+        return [(event.object.__name__, event.phase) for event in self.events]
+
+    def test_phases(self):
+        tile = self.tile("sample.tile", None, title="Hello")
+        tile = tile["tile1"]
+        self.assertEqual(tile(), "<html><body>Hello</body></html>")
+        str(tile.url)
+        self.assertEqual(
+            self.phases(),
+            [
+                ("sample.tile", "manager"),
+                ("sample.tile", "data"),
+                ("sample.tile", "encode"),
+                ("sample.tile", "traverse"),
+                ("sample.tile", "data"),
+                ("sample.tile", "render"),
+            ],
+        )
+        self.assertTrue(ITilePhaseTimedEvent.providedBy(self.events[0]))
+        # only passed to the listeners, not sent to event subscribers
+        self.assertFalse(IObjectEvent.providedBy(self.events[0]))
+        self.assertTrue(all(event.duration >= 0 for event in self.events))
+
+    def test_esi_extraction(self):
+        tile = self.tile("sample.tile", title="Hello")
+        self.assertEqual(ESIBody(tile, tile.request)(), "Hello")
+        self.assertEqual(self.phases()[-1], ("sample.tile", "extract"))
+
+    def test_no_listeners(self):
+        timing.removeListener(self.events.append)
+        self.addCleanup(timing.addListener, self.events.append)
+        self.assertIsNone(timing.start())
+        self.tile("sample.tile", title="Hello")()
+        self.assertEqual(self.events, [])
+
+    @mock.patch("plone.tiles.timing.SERVER_TIMING", True)
+    def test_server_timing_header(self):
+        timing.addListener(timing.recordServerTiming)
+        self.addCleanup(timing.removeListener, timing.recordServerTiming)
+        tile = self.tile("sample.tile", title="Hello")
+        tile.request._environ["PUBLISHED"] = tile
+        tile()
+        header = tile.request.response.getHeader("Server-Timing")
+        self.assertRegex(
+            header,
+            r'^manager;dur=\d+\.\d\d;desc="sample.tile tile1", '
+            r'data;dur=\d+\.\d\d;desc="sample.tile tile1", '
+            r'render;dur=\d+\.\d\d;desc="sample.tile tile1"$',
+        )
+
+    def test_server_timing_disabled(self):
+        tile = self.tile("sample.tile", title="Hello")
+        tile.request._environ["PUBLISHED"] = tile
+        tile()
+        self.assertIsNone(tile.request.response.getHeader("Server-Timing"))
@@ -1,12 +1,462 @@
+from AccessControl.SecurityManagement import getSecurityManager
+from email.utils import formatdate
+from email.utils import parsedate_to_datetime
+from persistent import Persistent
+from plone.tiles import timing
+from plone.tiles.cache import getContextPath
+from plone.tiles.cache import getDataCacheKey
+from plone.tiles.cache import getSurrogateKeys
+from plone.tiles.cache import RENDER_CACHE
+from plone.tiles.data import encode
+from plone.tiles.data import getDataGeneration
+from plone.tiles.interfaces import ESI_HEADER
+from plone.tiles.interfaces import ILazyRendered
 from plone.tiles.interfaces import IPersistentTile
 from plone.tiles.interfaces import ITile
 from plone.tiles.interfaces import ITileDataManager
+from plone.tiles.interfaces import ITileType
+from plone.tiles.metrics import measuredRender
+from plone.tiles.metrics import METRICS
+from plone.tiles.profiling import profiledRender
 from Products.Five import BrowserView
 from zExceptions import Forbidden
+from zope.annotation.interfaces import IAnnotations
 from zope.component import queryMultiAdapter
+from zope.component import queryUtility
 from zope.interface import implementer
 from zope.traversing.browser.absoluteurl import absoluteURL
 
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import html
+import inspect
+import os
+
+try:
+    from AccessControl.security import checkPermission
+except ImportError:
+    from zope.security import checkPermission
+
+
+_marker = object()
+
+# Request annotation set by views rendering a tile as a fragment of its own,
+# see markFragmentRequest()
+FRAGMENT_KEY = "plone.tiles.fragment"
+
+LAZY_TEMPLATE = """\
+<!DOCTYPE html>
+<html>
+    <head>
+        <script src="{script}" defer></script>
+    </head>
+    <body>
+        <div class="_lazy_placeholder" data-tile-src="{src}"></div>
+    </body>
+</html>
+"""
+
+# Only set the X-Tile-Url header for requests that may need it, see
+# Tile.needsUrlHeader()
+LAZY_URL_HEADER = os.environ.get("PLONE_TILES_LAZY_URL_HEADER", "").lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+# The number of seconds the prepare() coroutine of a tile may take, if set
+PREPARE_TIMEOUT = float(os.environ.get("PLONE_TILES_PREPARE_TIMEOUT") or 0) or None
+
+
+def encodedData(tile, tileType=_marker):
+    """Return the data of the tile as a canonical string"""
+    if tileType is _marker:
+        tileType = queryUtility(ITileType, name=tile.__name__)
+    schema = getattr(tileType, "schema", None)
+    if schema is not None:
+        return encode(tile.data, schema)
+    return repr(sorted(tile.data.items(), key=lambda item: item[0]))
+
+
+def getModificationTime(obj):
+    """Return the modification time of a content object or persistent object
+    in seconds since the epoch, or None.
+    """
+    modified = getattr(obj, "modified", None)
+    if callable(modified):
+        modified = modified()
+        if hasattr(modified, "timeTime"):  # DateTime
+            return modified.timeTime()
+        if hasattr(modified, "timestamp"):  # datetime
+            return modified.timestamp()
+    return getattr(obj, "_p_mtime", None)
+
+
+def handleConditionalRequest(tile):
+    """Set the ``ETag`` and ``Last-Modified`` headers of the response to the
+    validators returned by ``tile.cacheValidators()``.
+
+    Returns True if the request is a conditional GET or HEAD request the
+    validators match, after setting the response status to 304 Not Modified.
+    The tile does not need to be rendered then.
+    """
+    request = tile.request
+    response = request.response
+    if response.getHeader("ETag") or response.getHeader("Last-Modified"):
+        return False
+    cacheValidators = getattr(tile, "cacheValidators", None)
+    validators = cacheValidators() if cacheValidators is not None else None
+    if not validators:
+        return False
+    etag, lastModified = validators
+    if etag:
+        response.setHeader("ETag", etag)
+    if lastModified is not None:
+        response.setHeader("Last-Modified", formatdate(lastModified, usegmt=True))
+
+    if request.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+        return False
+    ifNoneMatch = request.getHeader("If-None-Match")
+    ifModifiedSince = request.getHeader("If-Modified-Since")
+    if ifNoneMatch:
+        # If-Modified-Since is ignored if If-None-Match is given
+        notModified = etag is not None and _matchesETag(ifNoneMatch, etag)
+    elif ifModifiedSince and lastModified is not None:
+        try:
+            since = parsedate_to_datetime(ifModifiedSince).timestamp()
+        except (TypeError, ValueError):
+            return False
+        notModified = int(lastModified) <= since
+    else:
+        return False
+
+    if notModified:
+        response.setStatus(304)
+    return notModified
+
+
+def _matchesETag(ifNoneMatch, etag):
+    # weak comparison, see RFC 9110, section 13.1.2
+    if ifNoneMatch.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in ifNoneMatch.split(",")
+    )
+
+
+def conditionalRender(func):
+    """Decorator for the ``__call__`` method of tiles, which answers
+    conditional requests for the published tile with 304 Not Modified
+    without rendering it, see ``handleConditionalRequest()``, and sets the
+    caching headers of the tile type, see ``setCachingHeaders()``.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        if self.request.get("PUBLISHED") is not self:
+            return func(self, *args, **kwargs)
+        if handleConditionalRequest(self):
+            setCachingHeaders(self)
+            timing.setServerTimingHeader(self)
+            return ""
+        result = func(self, *args, **kwargs)
+        setCachingHeaders(self)
+        timing.setServerTimingHeader(self)
+        return result
+
+    return __call__
+
+
+def isAnonymous():
+    """Return True if the current user is anonymous"""
+    user = getSecurityManager().getUser()
+    return user is None or user.getUserName() == "Anonymous User"
+
+
+def getCacheControl(tileType):
+    """Return the value of the ``Cache-Control`` header for the caching
+    policy of a tile type, or None if it has none.
+    """
+    if tileType is None:
+        return None
+    directives = []
+    for name, value in (
+        ("max-age", getattr(tileType, "cache_max_age", None)),
+        ("s-maxage", getattr(tileType, "cache_s_maxage", None)),
+        (
+            "stale-while-revalidate",
+            getattr(tileType, "cache_stale_while_revalidate", None),
+        ),
+        ("stale-if-error", getattr(tileType, "cache_stale_if_error", None)),
+    ):
+        if value is not None:
+            directives.append(f"{name}={value}")
+    if not directives:
+        return None
+    if tileType.cache_max_age is None and tileType.cache_s_maxage is not None:
+        # do not let browsers cache the response heuristically
+        directives.insert(0, "max-age=0")
+    return ", ".join(["public"] + directives)
+
+
+def _addTokens(response, header, tokens, separator):
+    value = response.getHeader(header) or ""
+    existing = {token.lower() for token in value.replace(",", " ").split()}
+    missing = [token for token in tokens if token.lower() not in existing]
+    if missing:
+        response.setHeader(header, separator.join(filter(None, [value] + missing)))
+
+
+def setCachingHeaders(tile):
+    """Set the caching headers of the response of a tile:
+    ``Cache-Control`` and ``Vary`` from the caching policy of the tile type,
+    i.e. the ``cache_*`` attributes of its ``<plone:tile />`` directive, and
+    ``Surrogate-Key`` and ``xkey`` from ``getSurrogateKeys()``.
+
+    The headers are only set for anonymous GET and HEAD requests. A
+    ``Cache-Control`` header that is already set, e.g. by plone.app.caching,
+    is kept. Calling this more than once is harmless.
+    """
+    request = tile.request
+    if request.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+        return
+    if request.getHeader(ESI_HEADER, "false").lower() == "true":
+        return
+    if not isAnonymous():
+        return
+
+    response = request.response
+    tileType = queryUtility(ITileType, name=tile.__name__)
+    cacheControl = getCacheControl(tileType)
+    if cacheControl is not None and not response.getHeader("Cache-Control"):
+        response.setHeader("Cache-Control", cacheControl)
+    vary = getattr(tileType, "cache_vary", ())
+    if vary:
+        _addTokens(response, "Vary", vary, ", ")
+    keys = getSurrogateKeys(tile)
+    _addTokens(response, "Surrogate-Key", keys, " ")
+    _addTokens(response, "xkey", keys, " ")
+
+
+def getRenderCacheKey(tile):
+    """Return the key of the output of the tile in ``RENDER_CACHE``, or None
+    if it must not be cached.
+
+    Only tiles of types registered with a ``render_cache_ttl`` are cached, and
+    only when rendered for anonymous GET or HEAD requests. The key covers the
+    tile name, id and data, the context path and serial, the serial of the
+    stored data record of persistent tiles, the server URL and the request
+    variables named by the type's ``render_cache_vary``. Persistent tiles
+    whose record was changed in the current transaction are not cached, so
+    that output rendered from uncommitted data is never shared.
+    """
+    if not RENDER_CACHE.enabled or not tile.__name__:
+        return None
+    tileType = queryUtility(ITileType, name=tile.__name__)
+    if not getattr(tileType, "render_cache_ttl", None):
+        return None
+    request = tile.request
+    if request.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+        return None
+    if request.getHeader(ESI_HEADER, "false").lower() == "true":
+        return None
+    if not isAnonymous():
+        return None
+    path = getContextPath(tile.context)
+    if path is None:
+        return None
+    recordKey = None
+    if IPersistentTile.providedBy(tile):
+        manager = ITileDataManager(tile)
+        storage = getattr(manager, "storage", None)
+        record = None if storage is None else storage.get(manager.key)
+        # saving the data of a tile does not change the serial of its context
+        if isinstance(record, Persistent) and (
+            record._p_jar is not None
+            or getattr(tile.context, "_p_jar", None) is not None
+        ):
+            recordKey = getDataCacheKey(record, tile.__name__)
+            if recordKey is None:
+                return None
+
+    return (
+        tile.__name__,
+        tile.id,
+        encodedData(tile, tileType),
+        path,
+        getattr(tile.context, "_p_serial", None),
+        recordKey,
+        request.get("SERVER_URL"),
+        tuple(str(request.get(name)) for name in tileType.render_cache_vary),
+    )
+
+
+def cachedRender(func):
+    """Decorator for the ``__call__`` method of tiles, which stores the
+    rendered tile in ``RENDER_CACHE``, if ``getRenderCacheKey()`` allows it.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        if args or kwargs or self.__dict__.get("_renderingCached"):
+            return func(self, *args, **kwargs)
+        key = getRenderCacheKey(self)
+        if key is None:
+            return func(self, *args, **kwargs)
+        cached = RENDER_CACHE.get(key)
+        METRICS.observeCache(self.__name__, "render", cached is not None)
+        if cached is not None:
+            result, keys = cached
+            if keys:
+                self.addSurrogateKeys(*keys)
+            return result
+
+        self._renderingCached = True
+        try:
+            result = func(self, *args, **kwargs)
+        finally:
+            del self._renderingCached
+        if isinstance(result, str):
+            tileType = queryUtility(ITileType, name=self.__name__)
+            RENDER_CACHE.set(
+                key,
+                (result, tuple(getattr(self, "surrogateKeys", ()))),
+                ttl=tileType.render_cache_ttl,
+                tags=(key[3], (key[3], self.__name__, self.id)),
+            )
+        return result
+
+    return __call__
+
+
+def markFragmentRequest(request):
+    """Mark the request as rendering tiles as fragments of their own, e.g.
+    for the @@esi-body view, so that lazily loaded tiles are rendered instead
+    of their placeholder.
+    """
+    annotations = IAnnotations(request, None)
+    if annotations is not None:
+        annotations[FRAGMENT_KEY] = True
+
+
+def isLazy(tile):
+    """Return True if the tile is to be rendered as a placeholder loaded by
+    the browser, i.e. it provides ``ILazyRendered``, its ``lazyLoad``
+    attribute is true, and it is not rendered as a fragment of its own, see
+    ``markFragmentRequest()``.
+    """
+    if not getattr(tile, "lazyLoad", False) or not ILazyRendered.providedBy(tile):
+        return False
+    # without annotations, the fragment could never be rendered
+    annotations = IAnnotations(tile.request, None)
+    return annotations is not None and not annotations.get(FRAGMENT_KEY)
+
+
+def renderLazyPlaceholder(tile):
+    """Return the placeholder of a lazily loaded tile, referring to the
+    @@esi-body view of its URL and to the script loading it.
+    """
+    url, separator, query = tile.url.partition("?")
+    base = tile.request.get("BASE1") or ""
+    return LAZY_TEMPLATE.format(
+        script=html.escape(f"{base}/@@tiles-lazy.js"),
+        src=html.escape(f"{url}/@@esi-body{separator}{query}"),
+    )
+
+
+def needsPreparing(tile):
+    """Return whether ``tile`` has an ``async def prepare()`` method which
+    was not run yet.
+    """
+    return "_prepared" not in tile.__dict__ and inspect.iscoroutinefunction(
+        getattr(tile, "prepare", None)
+    )
+
+
+async def runPrepare(tile, timeout):
+    """Run the ``prepare()`` coroutine of ``tile``, cancelling it after
+    ``timeout`` seconds with ``asyncio.TimeoutError``.
+    """
+    started = timing.start()
+    try:
+        await asyncio.wait_for(tile.prepare(), timeout)
+    finally:
+        timing.stop(tile, timing.PREPARE, started)
+
+
+def prepareTile(tile):
+    """Run the ``prepare()`` coroutine of ``tile``, if it has one and it was
+    not run yet, e.g. by ``plone.tiles.layout.prepareTiles()``. An exception
+    raised by an earlier run is raised again.
+
+    The coroutine runs in a new event loop, in a thread of its own if the
+    calling thread is running an event loop already.
+    """
+    prepared = tile.__dict__.get("_prepared")
+    if prepared is None:
+        if not needsPreparing(tile):
+            return
+        runEventLoop(runPrepare(tile, PREPARE_TIMEOUT))
+        tile._prepared = True
+    elif prepared is not True:
+        raise prepared
+
+
+def runEventLoop(coroutine):
+    """Run ``coroutine`` with ``asyncio.run()`` and return its result, in
+    another thread if an event loop is running in the calling thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def preparedRender(func):
+    """Decorator for the ``__call__`` method of tiles, which runs their
+    ``prepare()`` coroutine before rendering them, see ``prepareTile()``.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        prepareTile(self)
+        return func(self, *args, **kwargs)
+
+    return __call__
+
+
+def lazyRender(func):
+    """Decorator for the ``__call__`` method of tiles, which renders the
+    placeholder of lazily loaded tiles instead, see ``isLazy()``.
+
+    ``Tile.__call__`` is already decorated. Tiles overriding ``__call__``
+    can decorate their own implementation.
+    """
+
+    @functools.wraps(func)
+    def __call__(self, *args, **kwargs):
+        if isLazy(self):
+            return renderLazyPlaceholder(self)
+        return func(self, *args, **kwargs)
+
+    return __call__
+
 
 @implementer(ITile)
 class Tile(BrowserView):
@@ -17,10 +467,19 @@ class Tile(BrowserView):
 
     * The attribute `data` can be used to read the tile data, as returned by
       `ITileDataManager(tile).get()`. This value is cached when it is first
-      read.
+      read. Set `lazyData` to True on a tile class to get a `LazyTileData`
+      mapping instead, which only decodes the fields that are read and only
+      copies the data when it is changed.
     * The attribute `url` can be used to obtain the tile's URL, including the
       id specifier and any data associated with a transient tile. Again, the
-      return value is cached after the first access.
+      return value is cached after the first access, until the tile id
+      changes or tile data is changed through a data manager.
+    * If the tile type is registered with a `render_cache_ttl`, the output is
+      cached for anonymous users, see `cachedRender()`.
+    * Tiles providing `ILazyRendered` with `lazyLoad` set to True render a
+      placeholder loaded by the browser instead, see `lazyRender()`.
+    * Tiles may define an `async def prepare(self)` method gathering their
+      data before they are rendered, see `preparedRender()`.
     * The class implements __getitem__() to set the tile id from the traversal
       sub-path, as well as to allow views to be looked up. This is what allows
       a URL like `http://.../@@example.tile/foo` to result in a tile with id
@@ -31,8 +490,22 @@ class Tile(BrowserView):
     __cachedURL = None
 
     id = None
+    lazyData = False
+
+    # Keys added to the Surrogate-Key header, see addSurrogateKeys()
+    surrogateKeys = ()
+
+    # Set to True to send validators with the response of the tile, and to
+    # answer conditional requests with 304 Not Modified, see
+    # cacheValidators().
+    conditionalGet = False
+
+    # Set to True on tiles providing ILazyRendered to let the browser load
+    # them when they near the viewport, see isLazy().
+    lazyLoad = False
 
     def __getitem__(self, name):
+        started = timing.start()
 
         # If we haven't set the id yet, do that first
         if self.id is None:
@@ -50,9 +523,10 @@ class Tile(BrowserView):
             # the URL of a new tile after receiving the redirected response
             # from a tile form. That's why it's only set for customizable tiles
             # (tiles with id).
-            if self.id is not None:
+            if self.id is not None and self.needsUrlHeader():
                 self.request.response.setHeader("X-Tile-Url", self.url)
 
+            timing.stop(self, timing.TRAVERSE, started)
             return self
 
         # Also allow views on tiles even without @@.
@@ -63,10 +537,28 @@ class Tile(BrowserView):
         if view is not None:
             view.__parent__ = self
             view.__name__ = viewName
+            timing.stop(self, timing.TRAVERSE, started)
             return view
 
         raise KeyError(name)
 
+    def needsUrlHeader(self):
+        """Return True if the X-Tile-Url header should be set for this request.
+
+        By default the header is always set. If the environment variable
+        ``PLONE_TILES_LAZY_URL_HEADER`` is set, it is only set for requests
+        that may lead to an editor reading it: form submissions (anything but
+        GET or HEAD) and users with the tile type's edit permission.
+        Anonymous renderings then skip computing the tile URL altogether.
+        """
+        if not LAZY_URL_HEADER:
+            return True
+        if self.request.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+            return True
+        tileType = queryUtility(ITileType, name=self.__name__)
+        permission = getattr(tileType, "edit_permission", None)
+        return bool(permission) and checkPermission(permission, self.context)
+
     def browserDefault(self, request):
         """By default, tiles render themselves with no browser-default view"""
         return self, ()
@@ -77,24 +569,84 @@ class Tile(BrowserView):
         """
         return self[name]
 
+    @conditionalRender
+    @profiledRender
+    @measuredRender
+    @lazyRender
+    @cachedRender
+    @preparedRender
     def __call__(self, *args, **kwargs):
         if getattr(self, "index", None) is None:
             raise NotImplementedError(
                 'Override __call__ or set a class variable "index" to point '
                 "to a view page template file"
             )
-        return self.index(*args, **kwargs)
+        started = timing.start()
+        result = self.index(*args, **kwargs)
+        timing.stop(self, timing.RENDER, started)
+        return result
+
+    def addSurrogateKeys(self, *keys):
+        """Add keys to the ``Surrogate-Key`` and ``xkey`` headers of the
+        response, e.g. the UIDs of the content listed by the tile, so that
+        purging any of them purges the tile.
+
+        Call this while rendering. The keys are also restored when the output
+        of the tile comes from the render cache.
+        """
+        self.surrogateKeys = tuple(dict.fromkeys(self.surrogateKeys + keys))
+
+    def cacheValidators(self):
+        """Return an ``(etag, last_modified)`` tuple of validators for the
+        response of the tile, or None. ``last_modified`` is a time in
+        seconds since the epoch, either value may be None.
+
+        If ``conditionalGet`` is True, the validators are computed from the
+        tile data and the modification time of the context and of the stored
+        tile data. Override this if the output of the tile depends on
+        anything else.
+        """
+        if not self.conditionalGet:
+            return None
+        times = [getModificationTime(self.context)]
+        manager = ITileDataManager(self)
+        storage = getattr(manager, "storage", None)
+        if storage is not None and IPersistentTile.providedBy(self):
+            times.append(getattr(storage.get(manager.key), "_p_mtime", None))
+        times = [time for time in times if time is not None]
+        lastModified = max(times) if times else None
+
+        user = getSecurityManager().getUser()
+        fingerprint = repr(
+            (
+                self.__name__,
+                self.id,
+                encodedData(self),
+                lastModified,
+                user.getId() if user is not None else None,
+            )
+        )
+        digest = hashlib.md5(fingerprint.encode("utf-8"), usedforsecurity=False)
+        return f'W/"{digest.hexdigest()}"', lastModified
 
     @property
     def data(self):
         if self.__cachedData is None:
             reader = ITileDataManager(self)
-            self.__cachedData = reader.get()
+            get_lazy = getattr(reader, "get_lazy", None)
+            if self.lazyData and get_lazy is not None:
+                self.__cachedData = get_lazy()
+            else:
+                self.__cachedData = reader.get()
         return self.__cachedData
 
     @property
     def url(self):
-        return absoluteURL(self, self.request)
+        generation = getDataGeneration(self.request)
+        key = (self.id, generation)
+        if generation is None or self.__cachedURL is None or self.__cachedURL[0] != key:
+            self.__cachedURL = (key, absoluteURL(self, self.request))
+        return self.__cachedURL[1]
 
 
 @implementer(IPersistentTile)
@@ -120,6 +672,15 @@ class TileThemingTransform:
 
     def transform(self, result, encoding):
         self.request.response.setHeader("X-Theme-Disabled", "1")
+        # Send validators and caching headers for tiles not rendered through
+        # conditionalRender()
+        if (
+            ITile.providedBy(self.published)
+            and self.request.response.getStatus() == 200
+        ):
+            setCachingHeaders(self.published)
+            if handleConditionalRequest(self.published):
+                return ""
         return None
 
     def transformBytes(self, result, encoding):
@@ -0,0 +1,105 @@
+"""Timing of the phases of tile requests.
+
+The phases are timed by hooks in the tile base classes, data managers and
+views. Listeners added with ``addListener()`` are called with an
+``ITilePhaseTimedEvent`` for each of them. While there are no listeners,
+the hooks only test whether the list of listeners is empty.
+
+If the environment variable ``PLONE_TILES_SERVER_TIMING`` is set, the
+phases of a request are also reported in the ``Server-Timing`` header of
+tile responses, see ``setServerTimingHeader()``.
+"""
+
+from plone.tiles.events import TilePhaseTimedEvent
+from time import perf_counter
+from zope.annotation.interfaces import IAnnotations
+
+import os
+
+# The phases timed by plone.tiles
+TRAVERSE = "traverse"  # Tile.__getitem__(), i.e. setting the tile id
+MANAGER = "manager"  # creating the data manager of the tile
+DATA = "data"  # reading the tile data with the data manager
+ENCODE = "encode"  # encoding the data for the URL of a transient tile
+PREPARE = "prepare"  # running the prepare() coroutine of the tile
+RENDER = "render"  # rendering the template of the tile
+EXTRACT = "extract"  # rendering the head or body for @@esi-head/@@esi-body
+
+SERVER_TIMING = os.environ.get("PLONE_TILES_SERVER_TIMING", "").lower() in (
+    "1",
+    "true",
+    "yes",
+    "on",
+)
+
+SERVER_TIMING_KEY = "plone.tiles.timing"
+
+LISTENERS = []
+
+
+def addListener(listener):
+    """Call ``listener`` with an ``ITilePhaseTimedEvent`` for each timed
+    phase of a tile.
+    """
+    LISTENERS.append(listener)
+
+
+def removeListener(listener):
+    """Stop calling a listener added with ``addListener()``"""
+    LISTENERS.remove(listener)
+
+
+def start():
+    """Return the start time of a phase, or None if there are no listeners"""
+    return perf_counter() if LISTENERS else None
+
+
+def stop(tile, phase, started):
+    """Notify the listeners of a phase of ``tile``, which started at
+    ``started`` as returned by ``start()``.
+    """
+    if started is None:
+        return
+    event = TilePhaseTimedEvent(tile, phase, perf_counter() - started)
+    for listener in tuple(LISTENERS):
+        listener(event)
+
+
+def recordServerTiming(event):
+    """Listener keeping the timed phases in the annotations of the request"""
+    annotations = IAnnotations(event.object.request, None)
+    if annotations is None:
+        return
+    timings = annotations.setdefault(SERVER_TIMING_KEY, {})
+    key = (event.phase, event.object.__name__, event.object.id)
+    timings[key] = timings.get(key, 0.0) + event.duration
+
+
+def setServerTimingHeader(tile):
+    """Report the phases timed during the request of ``tile`` in the
+    ``Server-Timing`` header of its response, e.g.
+    ``render;dur=1.25;desc="my.tile tile1"``, if ``PLONE_TILES_SERVER_TIMING``
+    is set.
+    """
+    if not SERVER_TIMING:
+        return
+    annotations = IAnnotations(tile.request, None)
+    if annotations is None:
+        return
+    timings = annotations.pop(SERVER_TIMING_KEY, None)
+    if not timings:
+        return
+    metrics = []
+    for (phase, name, id_), duration in timings.items():
+        description = " ".join(str(part) for part in (name, id_) if part)
+        description = description.replace("\\", "").replace('"', "")
+        metrics.append(f'{phase};dur={duration * 1000:.2f};desc="{description}"')
+    response = tile.request.response
+    existing = response.getHeader("Server-Timing")
+    if existing:
+        metrics.insert(0, existing)
+    response.setHeader("Server-Timing", ", ".join(metrics))
+
+
+if SERVER_TIMING:
+    addListener(recordServerTiming)
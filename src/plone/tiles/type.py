@@ -17,6 +17,15 @@ class TileType:
         description=None,
         icon=None,
         schema=None,
+        render_cache_ttl=None,
+        render_cache_vary=(),
+        cache_max_age=None,
+        cache_s_maxage=None,
+        cache_stale_while_revalidate=None,
+        cache_stale_if_error=None,
+        cache_vary=(),
+        surrogate_keys=(),
+        lazy_load=False,
     ):
 
         if delete_permission is None:
@@ -34,6 +43,15 @@ class TileType:
         self.description = description
         self.icon = icon
         self.schema = schema
+        self.render_cache_ttl = render_cache_ttl
+        self.render_cache_vary = tuple(render_cache_vary)
+        self.cache_max_age = cache_max_age
+        self.cache_s_maxage = cache_s_maxage
+        self.cache_stale_while_revalidate = cache_stale_while_revalidate
+        self.cache_stale_if_error = cache_stale_if_error
+        self.cache_vary = tuple(cache_vary)
+        self.surrogate_keys = tuple(surrogate_keys)
+        self.lazy_load = lazy_load
 
     def __repr__(self):
         return f"<TileType {self.__name__} ({self.title})>"